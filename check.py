@@ -3,6 +3,8 @@ import subprocess
 import sys
 from datetime import datetime
 import os
+from itertools import islice
+from log_rotation import iter_lines
 
 # Check if a systemd service is active
 def is_service_active(service_name):
@@ -23,10 +25,10 @@ def print_error_log():
     if os.path.exists(error_log):
         print("\n--- Last 10 lines of error_log.txt ---")
         try:
-            with open(error_log, "r") as f:
-                lines = f.readlines()
-                for line in lines[-10:]:
-                    print(line.rstrip())
+            # Newest lines first, so only the end of the (rotated) log is read
+            lines = list(islice(iter_lines(error_log, reverse=True), 10))
+            for line in reversed(lines):
+                print(line.rstrip())
         except Exception as e:
             print(f"Could not read error_log.txt: {e}")
     else:
@@ -0,0 +1,82 @@
+### clock.py
+
+# Injectable clock. Scheduling code asks this module for the time instead of
+# calling datetime.now() / time.time() / time.monotonic() / time.sleep()
+# directly, so simulate.py can swap in a SimClock and replay days of schedule in
+# seconds. Production always runs on the SystemClock.
+
+import time as _time
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """The real clocks."""
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return _time.time()
+
+    def monotonic(self):
+        return _time.monotonic()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+
+class SimClock:
+    """
+    Virtual clock starting at `start` (a naive local datetime). Time only moves
+    when the simulation calls sleep() / advance_to(); wall and monotonic time
+    move together, so no clock jumps are ever reported.
+    """
+
+    def __init__(self, start):
+        self._start = start
+        self._elapsed = 0.0
+
+    def now(self):
+        return self._start + timedelta(seconds=self._elapsed)
+
+    def time(self):
+        return self._start.timestamp() + self._elapsed
+
+    def monotonic(self):
+        return self._elapsed
+
+    def sleep(self, seconds):
+        self._elapsed += max(0.0, seconds)
+
+    def advance_to(self, monotonic):
+        self._elapsed = max(self._elapsed, monotonic)
+
+
+_clock = SystemClock()
+
+
+def set_clock(clock):
+    """Install `clock` for the whole process; returns the previous one."""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def get_clock():
+    return _clock
+
+
+def now():
+    return _clock.now()
+
+
+def time():
+    return _clock.time()
+
+
+def monotonic():
+    return _clock.monotonic()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
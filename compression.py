@@ -0,0 +1,130 @@
+### compression.py
+
+# WSGI middleware that compresses JSON and text responses for clients that
+# accept it (Brotli when the optional brotli package is installed and the
+# client asks for br, gzip otherwise). Responses with a Content-Length below
+# COMPRESS_MIN_BYTES are passed through; streamed responses without a length
+# (/history-log) are compressed chunk by chunk. Server-Sent Events are never
+# compressed, since buffering in the compressor would hold back the events.
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv", "application/javascript")
+
+
+def _accepts(accept_encoding, coding):
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def finish(self):
+        return self._z.flush()
+
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level):
+        self._b = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._b.process(data)
+
+    def finish(self):
+        return self._b.finish()
+
+
+class CompressionMiddleware:
+    """Wrap a WSGI app: app.wsgi_app = CompressionMiddleware(app.wsgi_app)."""
+
+    def __init__(self, app, min_bytes=COMPRESS_MIN_BYTES, level=COMPRESS_LEVEL):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def _encoder_for(self, environ):
+        accept = environ.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is not None and _accepts(accept, "br"):
+            return _BrotliEncoder(self.level)
+        if _accepts(accept, "gzip"):
+            return _GzipEncoder(self.level)
+        return None
+
+    def __call__(self, environ, start_response):
+        encoder = self._encoder_for(environ)
+        if encoder is None or environ.get("REQUEST_METHOD") == "HEAD":
+            return self.app(environ, start_response)
+        state = {"encoder": None}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                state["encoder"] = encoder
+                headers = [
+                    (k, "W/" + v if k.lower() == "etag" and not v.startswith("W/") else v)  # Different bytes now
+                    for k, v in headers if k.lower() != "content-length"
+                ]
+                headers.append(("Content-Encoding", encoder.name))
+                headers.append(("Vary", "Accept-Encoding"))
+            return start_response(status, headers, exc_info)
+
+        return _CompressedBody(self.app(environ, compressing_start_response), state)
+
+    def _should_compress(self, status, headers):
+        if not status.startswith("200"):
+            return False
+        values = {k.lower(): v for k, v in headers}
+        if "content-encoding" in values:
+            return False
+        content_type = values.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return False  # Includes text/event-stream
+        length = values.get("content-length")
+        return length is None or int(length) >= self.min_bytes
+
+
+class _CompressedBody:
+    """
+    Response body that compresses once start_response picked an encoder.
+    close() is forwarded to the wrapped body even if iteration never began
+    (the client left first), so its cleanup callbacks always run.
+    """
+
+    def __init__(self, app_iter, state):
+        self._app_iter = app_iter
+        self._state = state
+
+    def __iter__(self):
+        for chunk in self._app_iter:
+            encoder = self._state["encoder"]
+            if encoder is None:
+                yield chunk
+                continue
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        if self._state["encoder"] is not None:
+            yield self._state["encoder"].finish()
+
+    def close(self):
+        close = getattr(self._app_iter, "close", None)
+        if close is not None:
+            close()
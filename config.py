@@ -4,3 +4,16 @@ RELAYS = {
     "Garden": 27,
     "Misters": 22
 }
+
+# Hydraulic budget for the zone sequencer (zone_sequencer.py).
+# Zones are admitted in FIFO order while both limits hold; one zone is always allowed.
+# With MAX_FLOW_LPM set, a zone whose ZONE_FLOW_LPM is None counts as the whole
+# budget (it only runs alone); the sequencer warns about such zones at startup.
+MAX_CONCURRENT_ZONES = 1
+MAX_FLOW_LPM = None  # e.g. 30.0 to cap total litres/minute; None disables the flow check
+# Expected flow per zone in litres/minute (measure with the flow meter, one zone at a time)
+ZONE_FLOW_LPM = {
+    "Hanging Pots": None,
+    "Garden": None,
+    "Misters": None
+}
@@ -0,0 +1,114 @@
+### cycle_soak.py
+
+# Cycle-and-soak optimiser.
+# With pulse/soak enabled a zone's valve is closed half the time (Garden is
+# 2 min on / 2 min off). plan_cycles() fills one zone's soak gaps with pulses
+# from other zones, so a batch of zones finishes in a much shorter window:
+#   - a zone never runs longer than its pulse in one go, and never starts its
+#     next pulse before its soak has elapsed (soak is a minimum),
+#   - zones without pulse/soak run in one continuous segment, as before,
+#   - the hydraulic budget (zone_fits) holds at every instant; a zone with
+#     no flow estimate counts as the whole MAX_FLOW_LPM budget,
+#   - ready zones are admitted strictly in (ready time, queue order) order, so
+#     no zone is starved by the others.
+# The plan is in seconds relative to the batch start. The zone sequencer runs
+# it as-is and /status upcoming_runs reports it, so both agree.
+
+from config import MAX_CONCURRENT_ZONES, MAX_FLOW_LPM, ZONE_FLOW_LPM
+
+
+def zone_fits(set_name, active_names, max_concurrent=MAX_CONCURRENT_ZONES, max_flow_lpm=MAX_FLOW_LPM, zone_flow=ZONE_FLOW_LPM):
+    """
+    True if `set_name` can open alongside `active_names` within the hydraulic
+    budget. A zone without a ZONE_FLOW_LPM estimate counts as using the whole
+    flow budget, so with MAX_FLOW_LPM set it only ever runs alone.
+    """
+    if not active_names:
+        return True  # Always allow one zone, whatever its flow
+    if max_concurrent and len(active_names) >= max_concurrent:
+        return False
+    if max_flow_lpm:
+        flows = [zone_flow.get(name) for name in list(active_names) + [set_name]]
+        if sum(max_flow_lpm if flow is None else flow for flow in flows) > max_flow_lpm:
+            return False
+    return True
+
+
+def missing_zone_flows(zone_names, max_flow_lpm=MAX_FLOW_LPM, zone_flow=ZONE_FLOW_LPM):
+    """Zones that zone_fits treats as filling the flow budget (no estimate while MAX_FLOW_LPM is set)."""
+    if not max_flow_lpm:
+        return []
+    return [name for name in zone_names if zone_flow.get(name) is None]
+
+
+def plan_cycles(zones, **budget):
+    """
+    zones: [(set_name, water_minutes, pulse_minutes, soak_minutes), ...] in queue order.
+    budget: optional max_concurrent / max_flow_lpm / zone_flow overrides for zone_fits.
+    Returns {set_name: [(on_sec, off_sec), ...]}.
+    """
+    state = []
+    for order, (set_name, water_minutes, pulse, soak) in enumerate(zones):
+        cycling = bool(pulse and soak and pulse > 0 and soak > 0)
+        state.append({
+            "set": set_name,
+            "remaining": water_minutes * 60,
+            "pulse": pulse * 60 if cycling else None,
+            "soak": soak * 60 if cycling else 0,
+            # Zones that really cycle (pulse shorter than the run) go first so
+            # their soaks can be filled by the others
+            "rank": (0 if cycling and pulse < water_minutes else 1, order),
+            "ready": 0,
+            "open_until": None
+        })
+    segments = {z["set"]: [] for z in state}
+    t = 0
+    while any(z["remaining"] > 0 or z["open_until"] is not None for z in state):
+        # Close pulses that have finished; the zone must soak before it is ready again
+        for z in state:
+            if z["open_until"] is not None and z["open_until"] <= t:
+                z["ready"] = z["open_until"] + z["soak"]
+                z["open_until"] = None
+        open_names = [z["set"] for z in state if z["open_until"] is not None]
+        ready = sorted(
+            (z for z in state if z["remaining"] > 0 and z["open_until"] is None and z["ready"] <= t),
+            key=lambda z: (z["ready"], z["rank"])
+        )
+        for z in ready:
+            if not zone_fits(z["set"], open_names, **budget):
+                break  # Strict FIFO: nobody overtakes the zone at the head
+            length = min(z["pulse"] or z["remaining"], z["remaining"])
+            segments[z["set"]].append((t, t + length))
+            z["remaining"] -= length
+            z["open_until"] = t + length
+            open_names.append(z["set"])
+        upcoming = [z["open_until"] for z in state if z["open_until"] is not None]
+        upcoming += [z["ready"] for z in state if z["remaining"] > 0 and z["open_until"] is None and z["ready"] > t]
+        if not upcoming:
+            break
+        t = min(upcoming)
+    return segments
+
+
+def plan_window_seconds(segments):
+    """Length of the whole batch: from the first valve opening to the last closing."""
+    spans = [seg for zone_segments in segments.values() for seg in zone_segments]
+    if not spans:
+        return 0
+    return max(off for _, off in spans) - min(on for on, _ in spans)
+
+
+def summarize_plan(segments):
+    """
+    Return [(set_name, first_on_minutes, span_minutes), ...] ordered by first
+    valve opening: what /status reports as each set's start time and duration.
+    """
+    summary = []
+    for set_name, zone_segments in segments.items():
+        if not zone_segments:
+            continue
+        first_on = zone_segments[0][0]
+        last_off = zone_segments[-1][1]
+        summary.append((set_name, first_on / 60, (last_off - first_on) / 60))
+    summary.sort(key=lambda s: s[1])
+    return summary
@@ -0,0 +1,77 @@
+### downsample.py
+
+# Largest-Triangle-Three-Buckets downsampling for the /chart endpoint.
+# LTTB keeps the first and last point and picks one point per bucket in
+# between: the one forming the largest triangle with the previously kept point
+# and the mean of the next bucket. Peaks, dips and steps survive, so a plot of
+# a few hundred points looks like the plot of the full series.
+#
+# The per-bucket search is vectorized with NumPy when it is installed; the
+# pure-Python version gives the same result (NumPy is not a dependency).
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def lttb(xs, ys, threshold):
+    """Indices of the points to keep (ascending) for at most `threshold` points of (xs, ys), xs ascending."""
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][:max(threshold, 0)]
+    if np is not None:
+        return _lttb_numpy(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), threshold)
+    return _lttb_python(xs, ys, threshold)
+
+
+def _bucket_bounds(n, threshold):
+    # Buckets for the n - 2 inner points; bucket i covers [bounds[i], bounds[i + 1])
+    every = (n - 2) / (threshold - 2)
+    return [int(i * every) + 1 for i in range(threshold - 2)] + [n - 1]
+
+
+def _lttb_python(xs, ys, threshold):
+    n = len(xs)
+    bounds = _bucket_bounds(n, threshold)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_start, next_end = end, bounds[i + 2] if i + 2 < len(bounds) else n
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def _lttb_numpy(xs, ys, threshold):
+    n = len(xs)
+    bounds = _bucket_bounds(n, threshold)
+    # Means of every bucket (the last "bucket" is the final point) in one pass
+    edges = np.array(bounds + [n])
+    sums_x = np.add.reduceat(xs, edges[:-1])
+    sums_y = np.add.reduceat(ys, edges[:-1])
+    counts = np.diff(edges)
+    mean_x, mean_y = sums_x / counts, sums_y / counts
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        ax, ay = xs[a], ys[a]
+        area = np.abs((ax - mean_x[i + 1]) * (ys[start:end] - ay) - (ax - xs[start:end]) * (mean_y[i + 1] - ay))
+        a = start + int(np.argmax(area))
+        kept.append(a)
+    kept.append(n - 1)
+    return kept
@@ -0,0 +1,257 @@
+### error_reporter.py
+
+# Deduplicating, rate-limited error reporting.
+# While the sensor Pi or the MQTT broker is down the same failure repeats every
+# few seconds, and writing each one (with traceback) is how error_log.txt grew
+# to tens of thousands of lines. report() fingerprints an error by its message
+# template (numbers, hex ids and quoted values masked) plus the code location
+# that raised or reported it:
+#   - the first occurrence is written in full (traceback / extra included),
+#   - repeats within ERROR_SUMMARY_WINDOW_SEC are only counted, and are written
+#     as one "N more occurrence(s) since T" line per window while they persist,
+#   - at most ERROR_MAX_WRITES_PER_MINUTE entries are written per process; the
+#     rest are counted and summarised the same way.
+# Counts stay available in memory (snapshot()); main.py also persists them to
+# error_counts.json, which keeps the deduplication across service restarts and
+# lets the API report them. main.py calls flush_due() from its housekeeping
+# tick; the API process runs it on a timer thread (start_flusher()).
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import clock
+from logger import log
+from log_rotation import append_line
+
+ERROR_LOG_FILE = "/home/lds00/sprinkler/error_log.txt"
+ERROR_COUNTS_FILE = "/home/lds00/sprinkler/error_counts.json"
+ERROR_SUMMARY_WINDOW_SEC = 300
+ERROR_MAX_WRITES_PER_MINUTE = 20
+ERROR_EXTRA_MAX_CHARS = 4000      # Cap for `extra` dumps such as `ps aux`
+ERROR_STATE_INTERVAL_SEC = 30     # Minimum gap between error_counts.json rewrites
+ERROR_FLUSH_INTERVAL_SEC = 30     # Timer for processes without a loop that calls flush_due()
+
+_VOLATILE = re.compile(r"0x[0-9a-fA-F]+|\d+(?:\.\d+)*|'[^']*'|\"[^\"]*\"")
+
+
+def fingerprint(msg, location):
+    return f"{_VOLATILE.sub('#', msg)} @ {location}"
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds")
+
+
+class ErrorReporter:
+    """
+    report(msg, exc=None, extra=None, error_log=True) writes to error_log.txt
+    (error_log=False: the status log) subject to the deduplication and rate
+    limits above. It returns True when the entry was written in full, so
+    callers can skip their own console output for suppressed repeats.
+    """
+
+    def __init__(self, state_file=None, window_sec=ERROR_SUMMARY_WINDOW_SEC, max_per_minute=ERROR_MAX_WRITES_PER_MINUTE):
+        self.state_file = state_file
+        self.window_sec = window_sec
+        self.max_per_minute = max_per_minute
+        self._lock = threading.Lock()
+        self._errors = {}  # fingerprint -> state dict (JSON-serialisable)
+        self._tokens = float(max_per_minute)
+        self._tokens_at = clock.time()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._flusher = None
+        if state_file:
+            self.persist_to(state_file)
+
+    def persist_to(self, state_file):
+        """Keep the counts in `state_file` (loading what a previous run saved)."""
+        self.state_file = state_file
+        self._load()
+
+    def report(self, msg, exc=None, extra=None, error_log=True, stacklevel=1):
+        now = clock.time()
+        key = fingerprint(msg, self._location(exc, stacklevel + 1))
+        with self._lock:
+            state = self._errors.get(key)
+            if state is None:
+                state = self._errors[key] = {
+                    "message": msg, "error_log": error_log, "count": 0, "pending": 0,
+                    "first_seen": now, "window_start": None
+                }
+            state["count"] += 1
+            state["last_seen"] = now
+            state["message"] = msg
+            self._dirty = True
+            if state["window_start"] is not None and now - state["window_start"] < self.window_sec:
+                state["pending"] += 1
+                return False
+            if state["pending"]:
+                # Still repeating: one summary per window instead of the full entry
+                state["pending"] += 1
+                self._write_summary(key, state, now)
+                return False
+            if not self._take_token(now):
+                state["pending"] += 1
+                state["window_start"] = now
+                return False
+            state["window_start"] = now
+        self._write(self._full_entry(msg, exc, extra, now), error_log)
+        return True
+
+    def flush_due(self):
+        """Write summaries whose window has ended and persist the counts (call periodically)."""
+        now = clock.time()
+        with self._lock:
+            for key, state in self._errors.items():
+                if state["pending"] and now - state["window_start"] >= self.window_sec:
+                    self._write_summary(key, state, now)
+        self._save(now)
+
+    def start_flusher(self, interval_sec=ERROR_FLUSH_INTERVAL_SEC):
+        """Call flush_due() every `interval_sec` on a daemon thread (idempotent)."""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, args=(interval_sec,), daemon=True, name="error-flusher")
+        self._flusher.start()
+
+    def _flush_loop(self, interval_sec):
+        while True:
+            time.sleep(interval_sec)  # Real time, even under a SimClock
+            try:
+                self.flush_due()
+            except Exception as e:
+                log(f"[ERROR REPORTER] flush failed: {e}")
+
+    def flush_all(self):
+        """Write every pending summary now (shutdown)."""
+        now = clock.time()
+        with self._lock:
+            for key, state in self._errors.items():
+                if state["pending"]:
+                    self._write_summary(key, state, now)
+        self._save(now, force=True)
+
+    def snapshot(self):
+        """Current error counts, most recent first."""
+        with self._lock:
+            return _public(self._errors)
+
+    @staticmethod
+    def _location(exc, stacklevel):
+        if exc is not None and exc.__traceback__ is not None:
+            frame = traceback.extract_tb(exc.__traceback__)[0]  # Our frame that caught it
+            return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+        try:
+            frame = sys._getframe(stacklevel)
+            return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+        except ValueError:
+            return "?"
+
+    def _take_token(self, now):
+        # Called with self._lock held
+        self._tokens = min(self.max_per_minute, self._tokens + (now - self._tokens_at) * self.max_per_minute / 60)
+        self._tokens_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _write_summary(self, key, state, now):
+        # Called with self._lock held; summaries are not rate limited (one per fingerprint per window)
+        entry = (f"[{_iso(now)}] [REPEAT] {state['pending']} more occurrence(s) since "
+                 f"{_iso(state['window_start'])}: {key} (last: {state['message']})\n")
+        state["pending"] = 0
+        state["window_start"] = now
+        self._write(entry, state["error_log"])
+
+    @staticmethod
+    def _full_entry(msg, exc, extra, now):
+        entry = f"[{_iso(now)}] {msg}\n"
+        if exc is not None:
+            entry += "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        if extra:
+            if len(extra) > ERROR_EXTRA_MAX_CHARS:
+                extra = extra[:ERROR_EXTRA_MAX_CHARS] + f"\n... ({len(extra) - ERROR_EXTRA_MAX_CHARS} more characters)"
+            entry += f"\n--- EXTRA DEBUG INFO ---\n{extra}\n"
+        return entry
+
+    @staticmethod
+    def _write(entry, error_log):
+        try:
+            if error_log:
+                append_line(ERROR_LOG_FILE, entry, fsync=True)
+            else:
+                log(entry.split("] ", 1)[1].rstrip("\n"))  # logger adds its own timestamp
+        except Exception as e:
+            print(f"[FATAL] Could not write error entry: {e}")
+
+    def _load(self):
+        try:
+            with open(self.state_file) as f:
+                saved = json.load(f)
+            self._errors = {item["fingerprint"]: item["state"] for item in saved.get("errors", [])}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN] Could not load {self.state_file}: {e}")
+
+    def _save(self, now, force=False):
+        if not self.state_file or not self._dirty:
+            return
+        if not force and now - self._saved_at < ERROR_STATE_INTERVAL_SEC:
+            return
+        with self._lock:
+            data = {
+                "updated": _iso(now),
+                "errors": [{"fingerprint": key, "state": dict(state)} for key, state in self._errors.items()]
+            }
+            self._dirty = False
+        self._saved_at = now
+        try:
+            tmp_path = self.state_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            print(f"[WARN] Could not write {self.state_file}: {e}")
+
+
+def _public(errors):
+    items = [
+        {
+            "fingerprint": key,
+            "message": state["message"],
+            "count": state["count"],
+            "pending": state["pending"],
+            "first_seen": _iso(state["first_seen"]),
+            "last_seen": _iso(state["last_seen"])
+        }
+        for key, state in errors.items()
+    ]
+    items.sort(key=lambda e: e["last_seen"], reverse=True)
+    return items
+
+
+def load_counts(state_file=ERROR_COUNTS_FILE):
+    """Error counts another process persisted (same shape as ErrorReporter.snapshot())."""
+    with open(state_file) as f:
+        saved = json.load(f)
+    return _public({item["fingerprint"]: item["state"] for item in saved.get("errors", [])})
+
+
+error_reporter = ErrorReporter()
+atexit.register(error_reporter.flush_all)
+
+
+def report_error(msg, exc=None, extra=None, error_log=True):
+    """Report through the process-wide reporter (see ErrorReporter.report)."""
+    return error_reporter.report(msg, exc, extra, error_log, stacklevel=2)
@@ -0,0 +1,85 @@
+### fake_gpio.py
+
+# In-memory stand-in for RPi.GPIO, used by simulate.py (and handy on a PC with
+# no GPIO header). install() registers it as RPi.GPIO before gpio_controller is
+# imported; every output change is recorded with clock.now() so the simulation
+# can report the exact relay timeline.
+
+import sys
+import types
+
+import clock
+
+BCM = "BCM"
+BOARD = "BOARD"
+OUT = "OUT"
+IN = "IN"
+HIGH = 1
+LOW = 0
+PUD_UP = "PUD_UP"
+PUD_DOWN = "PUD_DOWN"
+RISING = "RISING"
+FALLING = "FALLING"
+BOTH = "BOTH"
+
+_levels = {}      # pin -> HIGH/LOW
+transitions = []  # [(datetime, pin, level), ...] for every change of an output
+
+
+def setmode(mode):
+    pass
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(pin, direction, pull_up_down=None, initial=None):
+    if direction == OUT:
+        _levels.setdefault(pin, HIGH if initial else LOW)
+
+
+def output(pin, level):
+    level = HIGH if level else LOW
+    if _levels.get(pin) != level:
+        transitions.append((clock.now(), pin, level))
+    _levels[pin] = level
+
+
+def input(pin):
+    return _levels.get(pin, LOW)
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    pass
+
+
+def cleanup(pins=None):
+    _levels.clear()
+
+
+class PWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+
+    def start(self, duty):
+        pass
+
+    def ChangeDutyCycle(self, duty):
+        pass
+
+    def stop(self):
+        pass
+
+
+def reset():
+    _levels.clear()
+    transitions.clear()
+
+
+def install():
+    """Make `import RPi.GPIO` resolve to this module."""
+    package = sys.modules.get("RPi") or types.ModuleType("RPi")
+    package.GPIO = sys.modules[__name__]
+    sys.modules["RPi"] = package
+    sys.modules["RPi.GPIO"] = sys.modules[__name__]
@@ -1,26 +1,108 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, make_response, request, stream_with_context
 from status import CURRENT_RUN
-from run_manager import force_stop_all
+from shared_state import shared_state
+from state_file import mist_status as mist_status_state, last_completed_run as last_completed_run_state
+from run_manager import request_stop_all
 import os
-from scheduler import get_schedule_day_index, load_json
+from scheduler import get_schedule_day_index
+from schedule_cache import get_schedule
+from upcoming_runs import upcoming_runs_index
 from datetime import datetime, timedelta
 import time
 from logger import log
+from log_rotation import iter_lines
+from sensor_store import sensor_store, to_epoch, BacklogFull, ROLLUP_RESOLUTIONS
+from ingest import ingest, ingest_many, STREAM_SCHEMAS
+from downsample import lttb
+from history_index import history_file
+from error_reporter import error_reporter, report_error, load_counts
 from gpio_controller import get_led_colors
+import csv
+import functools
+import hashlib
+import io
 import json
+import threading
 
 TEST_MODE_FILE = "/home/lds00/sprinkler/test_mode.txt"
-LAST_COMPLETED_RUN_FILE = "/home/lds00/sprinkler/last_completed_run.json"
 WATERING_HISTORY_JSONL = "/home/lds00/sprinkler/watering_history.jsonl"
-MIST_STATUS_FILE = "/home/lds00/sprinkler/mist_status.json"
-SOIL_LOG_PATH = "/home/lds00/sprinkler/soil_readings.log"
+SOIL_LOG_PATH = "/home/lds00/sprinkler/soil_readings.log"   # Pre-sensor_store logs, imported once
+ENV_LOG_PATH = "/home/lds00/sprinkler/env_readings.log"
+WATERING_HISTORY_LOG = "/home/lds00/sprinkler/watering_history.log"
+ZONE_QUEUE_FILE = "/home/lds00/sprinkler/zone_queue.json"
+STREAM_POLL_SEC = 0.05       # /status-stream: shared-memory change check
+STREAM_RECHECK_SEC = 1.0     # /status-stream: full recompute for file-backed fields
+STREAM_HEARTBEAT_SEC = 5.0     # Also how soon a vanished client's worker is freed (the write fails)
+STREAM_MAX_CLIENTS = 4         # Concurrent /status-stream clients; more get 503 (serve_api sizes it from --threads)
+STREAM_MAX_LIFETIME_SEC = 300  # Streams end after this; EventSource reconnects after STREAM_RETRY_MS
+STREAM_RETRY_MS = 3000
+INGEST_RETRY_AFTER_SEC = 5    # Retry-After when the sensor store's write backlog is full
+CHART_DEFAULT_POINTS = 500
+CHART_MAX_POINTS = 5000
+EXPORT_CHUNK_BYTES = 64 * 1024
+HISTORY_EXPORT_COLUMNS = ["date", "set", "duration_minutes", "status", "source", "late_sec", "note"]
+CHART_RAW_LIMIT = 30000   # Longer ranges are downsampled from the min/max rollups instead of raw readings
 
 app = Flask(__name__)
 
+@app.before_request
+def start_error_flusher():
+    # Summaries of repeating API errors are written on a timer (main.py flushes from its own loop)
+    error_reporter.start_flusher()
+
 # Add global state for manual_set and soon_set
 manual_set = None
 soon_set = None
 
+# --- Conditional GET ---
+# Read endpoints are tagged from cheap state versions (schedule version, the
+# controller's shared-memory sequence, file stat keys, sensor store counters)
+# rather than from the body, so an If-None-Match that still matches gets a 304
+# without the body being computed at all.
+
+_BOOT_ID = f"{os.getpid()}.{int(time.time())}"
+
+def file_version(path):
+    try:
+        st = os.stat(path)
+        return f"{st.st_ino}.{st.st_size}.{st.st_mtime_ns}"
+    except OSError:
+        return "-"
+
+def schedule_version():
+    try:
+        return get_schedule().version
+    except Exception:
+        return None
+
+def conditional(version):
+    """Route decorator: ETag = hash(version(), path + query); 304 when the client already has it."""
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                parts = (_BOOT_ID, request.full_path, manual_set, soon_set) + tuple(version())
+                tag = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+            except Exception:
+                return view(*args, **kwargs)  # No version available: serve uncached
+            if request.if_none_match.contains_weak(tag):  # Weak: compression marks the tag W/
+                response = make_response("", 304)
+                response.set_etag(tag)
+                return response
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(tag)
+                response.headers["Cache-Control"] = "no-cache"  # Always revalidate
+            return response
+        return wrapper
+    return decorate
+
+def run_version():
+    # Countdowns in the body tick every second while a run is active
+    run_state = shared_state.read_run()
+    running = run_state is not None and run_state["Running"]
+    return (shared_state.sequence(), int(time.time()) if running else None)
+
 @app.route("/schedule-index")
 def schedule_index():
     try:
@@ -39,8 +121,8 @@ def schedule_index():
 
 @app.route("/stop-all", methods=["POST"])
 def stop_all():
-    force_stop_all()
-    return jsonify({"status": "stopped"})
+    confirmed = request_stop_all()
+    return jsonify({"status": "stopped", "confirmed": confirmed})
 
 @app.route("/set-test-mode", methods=["POST"])
 def set_test_mode():
@@ -66,16 +148,20 @@ def set_test_mode():
         log(f"[ERROR] Failed to set test mode via API: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/status")
-def status():
+def status_payload():
     global manual_set, soon_set
     set_names = ["Hanging Pots", "Garden", "Misters"]
     zones = []
-    current_set = CURRENT_RUN.get("Set", "")
-    running = CURRENT_RUN.get("Running", False)
-    phase = CURRENT_RUN.get("Phase", "")
+    # The controller's live state from shared memory (this process's CURRENT_RUN never runs anything)
+    run_state = shared_state.read_run() or CURRENT_RUN
+    current_set = run_state.get("Set", "")
+    running = run_state.get("Running", False)
+    phase = run_state.get("Phase", "")
+    zone_phases = {z["Set"]: z["Phase"] for z in run_state.get("Zones", [])}
     for set_name in set_names:
-        if running and current_set == set_name:
+        if zone_phases.get(set_name):
+            status_str = zone_phases[set_name]
+        elif running and current_set == set_name:
             status_str = phase or "Watering"
         else:
             status_str = "Idle"
@@ -89,19 +175,23 @@ def status():
         test_mode_val = False
         test_mode_mtime = None
     led_colors = get_led_colors(current_set, running, test_mode_val, None, manual_set, soon_set, False)
+    # One schedule snapshot for the whole request (parsed only when the file changes)
+    try:
+        schedule = get_schedule()
+    except Exception:
+        schedule = None
 
     # --- Current Run Info ---
     if running and current_set:
-        # Try to get start_time and duration from CURRENT_RUN, else fallback to now and 0
-        start_time = CURRENT_RUN.get("Start_Time")
+        # Try to get start_time and duration from the run state, else fallback to now and 0
+        start_time = run_state.get("Start_Time")
         if not start_time:
             # Fallback: use now
             start_time = datetime.now().isoformat()
-        duration_minutes = CURRENT_RUN.get("Duration_Minutes")
+        duration_minutes = run_state.get("Duration_Minutes")
         if not duration_minutes:
             # Fallback: try to get from schedule
             try:
-                schedule = load_json("/home/lds00/sprinkler/sprinkler_schedule.json")
                 match = next((s for s in schedule.get("sets", []) if s["set_name"] == current_set), None)
                 duration_minutes = match.get("run_duration_minutes", 0) if match else 0
             except Exception:
@@ -111,124 +201,28 @@ def status():
             "start_time": start_time,
             "duration_minutes": duration_minutes,
             "phase": phase,
-            "time_remaining_sec": CURRENT_RUN.get("Time_Remaining_Sec", 0),
-            "pulse_time_left_sec": CURRENT_RUN.get("Pulse_Time_Left_Sec", 0),
-            "soak_remaining_sec": CURRENT_RUN.get("Soak_Remaining_Sec", 0)
+            "time_remaining_sec": run_state.get("Time_Remaining_Sec", 0),
+            "pulse_time_left_sec": run_state.get("Pulse_Time_Left_Sec", 0),
+            "soak_remaining_sec": run_state.get("Soak_Remaining_Sec", 0)
         }
     else:
         current_run = None
 
     # --- Next Run Info ---
+    # Served from the precomputed index (rebuilt only when the schedule version or date changes)
     try:
-        schedule = load_json("/home/lds00/sprinkler/sprinkler_schedule.json")
-        now = datetime.now()
-        next_run = None
-        days_checked = 0
-        max_days = 30
-        def get_day_index_for_date(date):
-            base = datetime(2023, 12, 31)  # Match scheduler.py (Sunday)
-            return (date.date() - base.date()).days % 14
-        found = False
-        while not found and days_checked < max_days:
-            day = now + timedelta(days=days_checked)
-            idx = get_day_index_for_date(day)
-            if not schedule.get("schedule_days", [False]*14)[idx]:
-                days_checked += 1
-                continue  # skip non-watering days
-            for entry in schedule.get("start_times", []):
-                if not entry.get("isEnabled", False):
-                    continue
-                sched_time = entry["time"]
-                set_start_dt = datetime.strptime(f"{day.strftime('%Y-%m-%d')} {sched_time}", "%Y-%m-%d %H:%M")
-                if set_start_dt < now and days_checked == 0:
-                    continue
-                for s in schedule.get("sets", []):
-                    if s["set_name"] == "Misters" or not s.get("mode", True):
-                        continue
-                    duration = s.get("seasonallyAdjustedMinutes") or s.get("run_duration_minutes", 1)
-                    pulse = s.get("pulse_duration_minutes")
-                    soak = s.get("soak_duration_minutes")
-                    if pulse and soak and pulse > 0 and soak > 0:
-                        cycles = duration // (pulse + soak)
-                        remainder = duration % (pulse + soak)
-                        true_minutes = cycles * (pulse + soak) + remainder
-                    else:
-                        true_minutes = duration
-                    if set_start_dt > now or days_checked > 0:
-                        next_run = {
-                            "set": s["set_name"],
-                            "start_time": set_start_dt.isoformat(),
-                            "duration_minutes": true_minutes
-                        }
-                        found = True
-                        break
-                    set_start_dt += timedelta(minutes=true_minutes)
-                if found:
-                    break
-            days_checked += 1
+        next_run = upcoming_runs_index.next_run(schedule)
     except Exception:
         next_run = None
 
     # --- Last Completed Run ---
-    try:
-        with open(LAST_COMPLETED_RUN_FILE) as f:
-            last_completed_run = json.load(f)
-    except Exception:
-        last_completed_run = None
+    # Re-parsed only when main.py has replaced last_completed_run.json
+    last_completed_run = last_completed_run_state.get()
 
     # --- Upcoming Runs List ---
     try:
         N = 10  # Number of upcoming runs to report
-        schedule = load_json("/home/lds00/sprinkler/sprinkler_schedule.json")
-        now = datetime.now()
-        upcoming_runs = []
-        days_checked = 0
-        max_days = 30  # Prevent infinite loop if schedule_days is all False
-        def get_day_index_for_date(date):
-            base = datetime(2023, 12, 31)  # Match scheduler.py (Sunday)
-            return (date.date() - base.date()).days % 14
-        while len(upcoming_runs) < N and days_checked < max_days:
-            day = now + timedelta(days=days_checked)
-            idx = get_day_index_for_date(day)
-            if not schedule.get("schedule_days", [False]*14)[idx]:
-                days_checked += 1
-                continue  # skip non-watering days
-            for entry in schedule.get("start_times", []):
-                if not entry.get("isEnabled", False):
-                    continue
-                sched_time = entry["time"]
-                set_start_dt = datetime.strptime(f"{day.strftime('%Y-%m-%d')} {sched_time}", "%Y-%m-%d %H:%M")
-                # If today, skip times already passed
-                if set_start_dt < now and days_checked == 0:
-                    continue
-                # Serially schedule each enabled set (except Misters)
-                for s in schedule.get("sets", []):
-                    if s["set_name"] == "Misters" or not s.get("mode", True):
-                        continue
-                    duration = s.get("seasonallyAdjustedMinutes") or s.get("run_duration_minutes", 1)
-                    # Calculate true run time with pulse/soak if present
-                    pulse = s.get("pulse_duration_minutes")
-                    soak = s.get("soak_duration_minutes")
-                    if pulse and soak and pulse > 0 and soak > 0:
-                        # Number of cycles: total duration divided by (pulse+soak)
-                        cycles = duration // (pulse + soak)
-                        remainder = duration % (pulse + soak)
-                        true_minutes = cycles * (pulse + soak) + remainder
-                    else:
-                        true_minutes = duration
-                    if set_start_dt > now or days_checked > 0:
-                        upcoming_runs.append({
-                            "set": s["set_name"],
-                            "start_time": set_start_dt.isoformat(),
-                            "duration_minutes": true_minutes
-                        })
-                    set_start_dt += timedelta(minutes=true_minutes)
-                    if len(upcoming_runs) >= N:
-                        break
-                if len(upcoming_runs) >= N:
-                    break
-            days_checked += 1
-        upcoming_runs = upcoming_runs[:N]
+        upcoming_runs = upcoming_runs_index.upcoming(schedule, N)
     except Exception:
         upcoming_runs = []
 
@@ -251,36 +245,190 @@ def status():
         "upcoming_runs": upcoming_runs,
         "today_is_watering_day": today_is_watering_day
     }
-    return jsonify(resp)
+    return resp
+
+def status_version():
+    # next_run / upcoming_runs move on as start times pass: at most a minute old
+    return run_version() + (
+        schedule_version(), file_version(TEST_MODE_FILE), file_version(last_completed_run_state.path),
+        int(time.time() // 60)
+    )
+
+@app.route("/status")
+@conditional(status_version)
+def status():
+    return jsonify(status_payload())
+
+def stream_payload():
+    # /status plus the mist state: everything the live stream reports
+    payload = status_payload()
+    payload["mist"] = shared_state.read_mist() or dict(mist_status_state.get())
+    return payload
+
+def comparable(payload):
+    # Countdowns tick every second; clients run them down locally, so they alone do not trigger an update
+    current_run = payload.get("current_run")
+    if not current_run:
+        return payload
+    return {**payload, "current_run": {k: v for k, v in current_run.items() if not k.endswith("_sec")}}
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+
+def set_stream_limit(max_clients):
+    """Allow `max_clients` concurrent /status-stream clients (call before serving)."""
+    global _stream_slots
+    _stream_slots = threading.BoundedSemaphore(max_clients) if max_clients > 0 else None
+
+def release_stream_slot(slots, released):
+    if not released[0]:
+        released[0] = True
+        slots.release()
+
+@app.route("/status-stream")
+def status_stream():
+    """
+    Server-Sent Events: a "snapshot" event with the full /status payload (plus
+    "mist") on connect, then "update" events carrying only the top-level keys
+    that changed, and a "heartbeat" event every STREAM_HEARTBEAT_SEC.
+    Relay and phase changes are picked up within STREAM_POLL_SEC by watching the
+    controller's shared-memory sequence counter; everything else (test mode,
+    schedule, last run) is re-checked every STREAM_RECHECK_SEC.
+
+    Every stream holds a server worker, so at most STREAM_MAX_CLIENTS run at
+    once (503 beyond that) and each ends after STREAM_MAX_LIFETIME_SEC; the
+    "retry" field makes the browser reconnect STREAM_RETRY_MS later.
+    """
+    slots = _stream_slots
+    if slots is None or not slots.acquire(blocking=False):
+        response = jsonify({"error": "Too many /status-stream clients; retry later or poll /status."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(STREAM_RETRY_MS // 1000)
+        return response
+
+    def generate():
+        payload = stream_payload()
+        last = comparable(payload)
+        yield f"retry: {STREAM_RETRY_MS}\n" + sse_event("snapshot", payload)
+        seq = shared_state.sequence()
+        started = time.monotonic()
+        next_recheck = started + STREAM_RECHECK_SEC
+        next_heartbeat = started + STREAM_HEARTBEAT_SEC
+        while time.monotonic() - started < STREAM_MAX_LIFETIME_SEC:
+            time.sleep(STREAM_POLL_SEC)
+            now = time.monotonic()
+            new_seq = shared_state.sequence()
+            if new_seq != seq or now >= next_recheck:
+                seq = new_seq
+                next_recheck = now + STREAM_RECHECK_SEC
+                payload = stream_payload()
+                current = comparable(payload)
+                changed = {k: payload[k] for k in payload if current[k] != last.get(k)}
+                last = current
+                if changed:
+                    yield sse_event("update", changed)
+                    next_heartbeat = now + STREAM_HEARTBEAT_SEC
+            if now >= next_heartbeat:
+                next_heartbeat = now + STREAM_HEARTBEAT_SEC
+                yield sse_event("heartbeat", {"time": datetime.now().isoformat(timespec="seconds")})
+
+    try:
+        response = Response(stream_with_context(generate()), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except Exception:
+        slots.release()
+        raise
+    # Released (once) when the server closes the response: stream ended, client gone (failed write) or never read
+    response.call_on_close(functools.partial(release_stream_slot, slots, [False]))
+    return response
 
 @app.route("/history-log")
 def history_log():
     try:
-        with open("/home/lds00/sprinkler/watering_history.log", "r") as f:
-            return f.read(), 200, {'Content-Type': 'text/plain'}
+        # Archived segments first, then the live file, streamed line by line
+        lines = iter_lines(WATERING_HISTORY_LOG)
+        return Response(lines, mimetype='text/plain')
     except Exception as e:
         return str(e), 500
 
+def chunked(lines):
+    # Join small lines into ~EXPORT_CHUNK_BYTES response chunks
+    buf, size = [], 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+def csv_lines(columns, records):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([
+            "" if record.get(c) is None else json.dumps(record[c]) if isinstance(record.get(c), (dict, list)) else record[c]
+            for c in columns
+        ])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue()
+
+@app.route("/export/<dataset>")
+def export(dataset):
+    # Bulk export of watering_history or a sensor stream (env, soil, sets, plant, environment):
+    # ?format=ndjson|csv&start=&end=&set_name= ; streamed in chunks with constant memory
+    try:
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in ("ndjson", "csv"):
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+        start, end = range_args()
+        set_name = request.args.get("set_name")
+        if dataset == "watering_history":
+            records = history_file(WATERING_HISTORY_JSONL).iter_events(start, end, set_name)
+            columns = HISTORY_EXPORT_COLUMNS
+        elif dataset in STREAM_SCHEMAS:
+            store = sensor_readings()
+            records = store.iter_readings(dataset, start, end, set_name)
+            columns = None
+            if fmt == "csv":
+                columns = ["timestamp"] + [f for f in store.field_names(dataset, start, end, set_name) if f != "timestamp"]
+        else:
+            return jsonify({"error": f"unknown dataset: {dataset}"}), 404
+        if fmt == "csv":
+            body, mimetype = chunked(csv_lines(columns, records)), "text/csv"
+        else:
+            body, mimetype = chunked(ndjson_lines(records)), "application/x-ndjson"
+        filename = f"{dataset}.{'csv' if fmt == 'csv' else 'ndjson'}"
+        return Response(body, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log(f"[EXPORT ERROR] {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/history")
+@conditional(lambda: (file_version(WATERING_HISTORY_JSONL), int(time.time() // 60)))  # Default window slides
 def history():
     try:
-        # Read and filter last 30 days
-        cutoff = datetime.now() - timedelta(days=30)
-        history = []
-        with open(WATERING_HISTORY_JSONL, "r") as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    event_dt = datetime.fromisoformat(event["date"])
-                    if event_dt >= cutoff:
-                        history.append(event)
-                except Exception:
-                    continue
+        # ?since= / ?until= (ISO date or datetime; default: the last 30 days) and ?set=
+        since = request.args.get("since") or (datetime.now() - timedelta(days=30)).isoformat()
+        until = request.args.get("until")
+        history = history_file(WATERING_HISTORY_JSONL).query(since, until, request.args.get("set"))
         return jsonify({"watering_history": history})
     except Exception as e:
         return jsonify({"watering_history": [], "error": str(e)})
 
-# Helper to update mist status (call from mist_manager in main.py)
+# Helper to update mist status (publish_mist for schedule_actions, wired up in main.py)
 def update_mist_status(is_misting, last_mist_event, next_mist_event, current_temperature, interval_minutes, duration_minutes):
     data = {
         "is_misting": is_misting,
@@ -290,20 +438,22 @@ def update_mist_status(is_misting, last_mist_event, next_mist_event, current_tem
         "interval_minutes": interval_minutes,
         "duration_minutes": duration_minutes
     }
-    try:
-        with open(MIST_STATUS_FILE, "w") as f:
-            json.dump(data, f)
-    except Exception as e:
-        pass
+    # Live copy for the API process; the file keeps the last mist event across restarts
+    shared_state.publish_mist(**data)
+    mist_status_state.set(data)  # Written only when it changed
 
 @app.route("/mist-status")
+@conditional(lambda: (
+    shared_state.sequence(), file_version(mist_status_state.path), schedule_version(), datetime.now().date()
+))
 def mist_status():
     try:
-        with open(MIST_STATUS_FILE) as f:
-            data = json.load(f)
+        data = shared_state.read_mist()
+        if data is None:
+            data = dict(mist_status_state.get())
         # Add today_is_watering_day to mist-status as well
         try:
-            schedule = load_json("/home/lds00/sprinkler/sprinkler_schedule.json")
+            schedule = get_schedule()
             from scheduler import should_run_today
             today_is_watering_day = should_run_today(schedule)
         except Exception:
@@ -322,143 +472,284 @@ def mist_status():
             "today_is_watering_day": False
         })
 
+@app.route("/zone-queue")
+def zone_queue():
+    # Written by main.py's zone sequencer whenever the queue changes
+    try:
+        with open(ZONE_QUEUE_FILE) as f:
+            return jsonify(json.load(f))
+    except Exception:
+        return jsonify({"active": [], "queued": [], "max_concurrent_zones": None, "max_flow_lpm": None, "updated": None})
+
+@app.route("/error-counts")
+def error_counts():
+    # Repeating errors as counted by the error reporters (controller: persisted by main.py)
+    try:
+        controller = load_counts()
+    except Exception:
+        controller = []
+    return jsonify({"controller": controller, "api": error_reporter.snapshot()})
+
+_sensor_logs_imported = False
+_sensor_import_lock = threading.Lock()
+
+def sensor_readings():
+    """The sensor store, once the old text logs have been imported into it."""
+    global _sensor_logs_imported
+    if not _sensor_logs_imported:
+        with _sensor_import_lock:
+            if not _sensor_logs_imported:
+                for stream, path in (("env", ENV_LOG_PATH), ("soil", SOIL_LOG_PATH)):
+                    try:
+                        sensor_store.import_log(stream, path)
+                    except Exception as e:
+                        report_error(f"[SENSOR_STORE IMPORT ERROR] {path}: {e}", e)
+                _sensor_logs_imported = True
+    return sensor_store
+
+def range_args():
+    # Optional ?start= / ?end= (ISO timestamps or epoch seconds) for the history and export endpoints,
+    # as naive local datetimes; ValueError (answered with 400) if either does not parse
+    bounds = []
+    for name in ("start", "end"):
+        value = request.args.get(name)
+        ts = to_epoch(value)  # None for unparsable, non-finite or out-of-range values
+        try:
+            bounds.append(None if ts is None else datetime.fromtimestamp(ts))
+        except (OverflowError, OSError):
+            ts = None
+        if value and ts is None:
+            raise ValueError(f"invalid {name}: {value!r} (expected an ISO timestamp or epoch seconds)")
+    return tuple(bounds)
+
 @app.route("/soil-latest")
+@conditional(lambda: (sensor_readings().version("soil"),))
 def soil_latest():
     try:
-        with open(SOIL_LOG_PATH, "r") as f:
-            lines = f.readlines()
-            if not lines:
-                return jsonify({"error": "No soil readings available."}), 404
-            last_line = lines[-1]
-            # Format: timestamp | {json}
-            ts, json_part = last_line.split("|", 1)
-            return jsonify({"timestamp": ts.strip(), **json.loads(json_part)})
+        entry = sensor_readings().latest("soil")
+        if entry is None:
+            return jsonify({"error": "No soil readings available."}), 404
+        return jsonify(entry)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/soil-history")
+@conditional(lambda: (sensor_readings().version("soil"),))
 def soil_history():
     try:
         N = int(request.args.get("n", 100))  # Default: last 100 readings
-        readings = []
-        skipped = 0
-        blank = 0
-        with open(SOIL_LOG_PATH, "r") as f:
-            lines = f.readlines()
-        total_lines = len(lines)
-        for line in reversed(lines):
-            line = line.strip()
-            if not line:
-                blank += 1
-                continue  # skip blank lines
-            try:
-                ts, json_part = line.split("|", 1)
-                entry = {"timestamp": ts.strip(), **json.loads(json_part)}
-                readings.append(entry)
-                if len(readings) >= N:
-                    break
-            except Exception as e:
-                skipped += 1
-                continue
-        resp = list(reversed(readings))  # Return in chronological order
+        start, end = range_args()
+        resp = sensor_readings().query("soil", n=N, start=start, end=end)  # Chronological order
         # Debug log
-        if readings:
+        if resp:
             first_ts = resp[0]["timestamp"]
             last_ts = resp[-1]["timestamp"]
         else:
             first_ts = last_ts = None
-        log(f"[SOIL_HISTORY DEBUG] lines={total_lines}, blank={blank}, skipped={skipped}, returned={len(resp)}, first_ts={first_ts}, last_ts={last_ts}")
-        if skipped > 0 or blank > 0:
-            return jsonify({"readings": resp, "skipped_lines": skipped, "blank_lines": blank}), 200
+        log(f"[SOIL_HISTORY DEBUG] returned={len(resp)}, first_ts={first_ts}, last_ts={last_ts}")
         return jsonify(resp)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         log(f"[SOIL_HISTORY ERROR] {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def backlog_response(e):
+    # Nothing from the request was queued, so the client can resend all of it
+    log(f"[INGEST] {e}")
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(INGEST_RETRY_AFTER_SEC)
+    return response
+
+def ingest_response(stream):
+    # One reading or a JSON array of them; committed by the sensor store's group-commit writer
+    sensor_readings()
+    try:
+        accepted, rejected = ingest(stream, request.get_json(force=True))
+    except BacklogFull as e:
+        return backlog_response(e)
+    if rejected:
+        log(f"[INGEST] {stream}: accepted {accepted}, rejected {len(rejected)}: {rejected[0]['error']}")
+        return jsonify({"status": "ok" if accepted else "rejected", "accepted": accepted, "rejected": rejected}), 200 if accepted else 400
+    return jsonify({"status": "ok", "accepted": accepted}), 200
+
 @app.route("/soil-data", methods=["POST"])
 def soil_data():
     try:
-        data = request.get_json(force=True)
-        # Log as a single line: timestamp | {json}
-        ts = data.get("timestamp", datetime.now().isoformat())
-        with open(SOIL_LOG_PATH, "a") as f:
-            f.write(f"{ts} | {json.dumps(data)}\n")
-            f.flush()
-            os.fsync(f.fileno())
-        return jsonify({"status": "ok"}), 200
+        return ingest_response("soil")
     except Exception as e:
-        with open("error_log.txt", "a") as ef:
-            ef.write(f"[SOIL-DATA ERROR] {datetime.now().isoformat()} - {str(e)}\n")
+        report_error(f"[SOIL-DATA ERROR] {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/env-data", methods=["POST"])
 def env_data():
     try:
-        data = request.get_json(force=True)
         # Expecting: timestamp, set_name, pressure, flow, moisture_b
-        ts = data.get("timestamp", datetime.now().isoformat())
-        with open("/home/lds00/sprinkler/env_readings.log", "a") as f:
-            f.write(f"{ts} | {json.dumps(data)}\n")
-            f.flush()
-            os.fsync(f.fileno())
-        return jsonify({"status": "ok"}), 200
+        return ingest_response("env")
     except Exception as e:
-        log(f"[ENV_DATA ERROR] {datetime.now().isoformat()} - {str(e)}")
+        report_error(f"[ENV_DATA ERROR] {str(e)}", error_log=False)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/env-history")
+@conditional(lambda: (sensor_readings().version("env"),))
 def env_history():
     try:
         N = int(request.args.get("n", 100))
         set_name = request.args.get("set_name")
-        readings = []
-        skipped = 0
-        blank = 0
-        with open("/home/lds00/sprinkler/env_readings.log", "r") as f:
-            lines = f.readlines()
-        for line in reversed(lines):
-            line = line.strip()
-            if not line:
-                blank += 1
-                continue
-            try:
-                ts, json_part = line.split("|", 1)
-                entry = {"timestamp": ts.strip(), **json.loads(json_part)}
-                if set_name and entry.get("set_name") != set_name:
-                    continue
-                readings.append(entry)
-                if len(readings) >= N:
-                    break
-            except Exception:
-                skipped += 1
-                continue
-        resp = list(reversed(readings))
-        return jsonify(resp)
+        start, end = range_args()
+        return jsonify(sensor_readings().query("env", n=N, start=start, end=end, set_name=set_name))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         log(f"[ENV_HISTORY ERROR] {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/env-latest")
+@conditional(lambda: (sensor_readings().version("env"),))
 def env_latest():
     try:
-        with open("/home/lds00/sprinkler/env_readings.log", "r") as f:
-            lines = f.readlines()
-            if not lines:
-                return jsonify({"error": "No env readings available."}), 404
-            for line in reversed(lines):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    ts, json_part = line.split("|", 1)
-                    entry = {"timestamp": ts.strip(), **json.loads(json_part)}
-                    return jsonify(entry)
-                except Exception:
-                    continue
-            return jsonify({"error": "No valid env readings found."}), 404
+        entry = sensor_readings().latest("env")
+        if entry is None:
+            return jsonify({"error": "No env readings available."}), 404
+        return jsonify(entry)
     except Exception as e:
         log(f"[ENV_LATEST ERROR] {str(e)}")
         return jsonify({"error": str(e)}), 500
+# Remote sensor streams posted by main.post_all_env_data: /<stream>-data, /<stream>-latest, /<stream>-history
+def add_sensor_stream_routes(stream):
+    def data():
+        try:
+            return ingest_response(stream)
+        except Exception as e:
+            report_error(f"[{stream.upper()}_DATA ERROR] {str(e)}", error_log=False)
+            return jsonify({"error": str(e)}), 500
+
+    def latest():
+        try:
+            entry = sensor_readings().latest(stream, set_name=request.args.get("set_name"))
+            if entry is None:
+                return jsonify({"error": f"No {stream} readings available."}), 404
+            return jsonify(entry)
+        except Exception as e:
+            log(f"[{stream.upper()}_LATEST ERROR] {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    def history():
+        try:
+            N = int(request.args.get("n", 100))
+            start, end = range_args()
+            return jsonify(sensor_readings().query(stream, n=N, start=start, end=end, set_name=request.args.get("set_name")))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            log(f"[{stream.upper()}_HISTORY ERROR] {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    stream_version = conditional(lambda: (sensor_readings().version(stream),))
+    app.add_url_rule(f"/{stream}-data", f"{stream}_data", data, methods=["POST"])
+    app.add_url_rule(f"/{stream}-latest", f"{stream}_latest", stream_version(latest))
+    app.add_url_rule(f"/{stream}-history", f"{stream}_history", stream_version(history))
+
+for _stream in ("sets", "plant", "environment"):
+    add_sensor_stream_routes(_stream)
+
+@app.route("/sensor-data", methods=["POST"])
+def sensor_data():
+    # {"sets": {...}, "plant": {...}, "environment": [...]}: several streams in one request (main.post_all_env_data)
+    try:
+        sensor_readings()
+        body = request.get_json(force=True)
+        if not isinstance(body, dict) or not body:
+            return jsonify({"error": "expected an object of stream -> reading(s)"}), 400
+        try:
+            ingested = ingest_many(body)  # All streams queued together, or none
+        except BacklogFull as e:
+            return backlog_response(e)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        results = {}
+        total = 0
+        for stream, (accepted, rejected) in ingested.items():
+            total += accepted
+            results[stream] = {"accepted": accepted}
+            if rejected:
+                results[stream]["rejected"] = rejected
+                log(f"[INGEST] {stream}: accepted {accepted}, rejected {len(rejected)}: {rejected[0]['error']}")
+        return jsonify({"status": "ok" if total else "rejected", "streams": results}), 200 if total else 400
+    except Exception as e:
+        report_error(f"[SENSOR_DATA ERROR] {str(e)}", error_log=False)
+        return jsonify({"error": str(e)}), 500
+
+def chart_version():
+    stream = request.args.get("stream", "env")
+    # Without ?end= the window follows the clock
+    return (sensor_readings().version(stream), None if request.args.get("end") else int(time.time() // 60))
+
+@app.route("/chart")
+@conditional(chart_version)
+def chart():
+    # ?stream=env&fields=pressure,flow&start=&end=&points=500&set_name= ; each field is LTTB-downsampled to `points`.
+    # At most CHART_RAW_LIMIT inputs per field: past that the finest rollup that fits is used, as a min and a max
+    # point per bucket so spikes survive. Work per request is bounded however long the range is.
+    try:
+        stream = request.args.get("stream", "env")
+        fields = (request.args.get("fields") or request.args.get("field") or "").split(",")
+        fields = [f for f in fields if f]
+        if not fields:
+            return jsonify({"error": "fields is required"}), 400
+        end = request.args.get("end") or datetime.now().isoformat()
+        start = request.args.get("start") or (datetime.now() - timedelta(days=1)).isoformat()
+        points = min(int(request.args.get("points", CHART_DEFAULT_POINTS)), CHART_MAX_POINTS)
+        set_name = request.args.get("set_name")
+        store = sensor_readings()
+        series = {}
+        sources = {}
+        for field in fields:
+            rows = store.series(stream, field, start, end, set_name, limit=CHART_RAW_LIMIT + 1)
+            sources[field] = "raw"
+            if len(rows) > CHART_RAW_LIMIT:
+                span = to_epoch(end) - to_epoch(start)
+                resolution = next((name for name, sec in ROLLUP_RESOLUTIONS.items() if span / sec * 2 <= CHART_RAW_LIMIT), "day")
+                half = ROLLUP_RESOLUTIONS[resolution] / 2
+                rows = []
+                for bucket, low, high in store.rollup_series(stream, field, start, end, resolution, set_name):
+                    rows.append((bucket, low))
+                    rows.append((bucket + half, high))
+                sources[field] = resolution
+            xs = [row[0] for row in rows]
+            ys = [row[1] for row in rows]
+            series[field] = [
+                {"timestamp": datetime.fromtimestamp(xs[i]).isoformat(timespec="seconds"), "value": ys[i]}
+                for i in lttb(xs, ys, points)
+            ]
+        return jsonify({"stream": stream, "start": start, "end": end, "series": series, "sources": sources})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log(f"[CHART ERROR] {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/sensor-rollup")
+def sensor_rollup():
+    # Chart data: min/max/mean/count per minute, hour or day (chosen from the range unless ?resolution= is given)
+    try:
+        stream = request.args.get("stream", "env")
+        end = request.args.get("end") or datetime.now().isoformat()
+        start = request.args.get("start") or (datetime.now() - timedelta(days=7)).isoformat()
+        fields = request.args.get("fields")
+        return jsonify(sensor_readings().rollup(
+            stream, start, end,
+            set_name=request.args.get("set_name"),
+            fields=fields.split(",") if fields else None,
+            resolution=request.args.get("resolution")
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log(f"[SENSOR_ROLLUP ERROR] {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 def read_test_mode():
     try:
         with open(TEST_MODE_FILE) as f:
@@ -190,6 +190,12 @@ def turn_off(pin, name=None):
         except Exception as e:
             log(f"[WARN] Could not turn off relay pin {pin} ({name}): {e}")
 
+def is_relay_on(pin):
+    """Read back a relay output (used to confirm a valve is really closed after a stop)."""
+    if is_test_mode():
+        return _last_states.get(pin) == "ON"
+    return GPIO.input(pin) == GPIO.HIGH
+
 # Set status LED (LED 0) color
 # color: 'idle', 'running', 'off', 'wifi', 'test', 'maintenance', 'error'
 def set_status_led(color):
@@ -0,0 +1,214 @@
+### history_index.py
+
+# watering_history.jsonl with a sparse date index, so /history reads only the
+# window it was asked for instead of parsing every event ever recorded.
+#
+# The index (<jsonl>.idx) has one "YYYY-MM-DD <byte offset>" line per day: the
+# offset of the first event whose date reached that day. Events are written
+# when a run ends but dated by its start, so they are not strictly in date
+# order; entries are therefore only added when the running maximum date moves
+# to a new day. Everything before the entry for day D is dated before D, so a
+# query for `since` seeks straight to that entry. The other end stops at the
+# entry MAX_RUN_DAYS after `until`: an event written later started after it.
+#
+# run_manager appends through HistoryFile.append(), which keeps the index in
+# step. A missing or stale index (file replaced or truncated) is rebuilt with
+# one scan. Readers in other processes reload the index when its size changes.
+
+import bisect
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from logger import log
+
+MAX_RUN_DAYS = 1  # No run (plus its soaks) spans more than this many days
+
+
+def _day(date_str):
+    return date_str[:10]  # ISO "YYYY-MM-DD..." -> "YYYY-MM-DD"
+
+
+def to_datetime(value):
+    """datetime for an ISO date / datetime string (or a datetime); None passes through."""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).strip())
+
+
+class HistoryFile:
+    """One JSONL history file and its sparse date index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._lock = threading.Lock()
+        self._days = []      # Sorted days with an index entry
+        self._offsets = []   # Matching byte offsets
+        self._max_day = ""
+        self._index_key = None   # (size, mtime) of the index file when loaded
+        self._file_key = None    # (inode, size) of the JSONL file the index was checked against
+
+    def append(self, event):
+        """Append one event (needs an ISO "date") and index it if it starts a new day."""
+        line = (json.dumps(event) + "\n").encode()
+        with self._lock:
+            self._refresh()
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            day = _day(event["date"])
+            if self._index_key is None:
+                self._rebuild()  # First event, or no usable index yet
+            elif day > self._max_day:
+                self._add_entry(day, offset)
+            try:
+                st = os.stat(self.path)
+                self._file_key = (st.st_ino, st.st_size)
+            except OSError:
+                self._file_key = None
+
+    def query(self, since=None, until=None, set_name=None):
+        """Events with since <= date < until (either may be None), optionally for one set, oldest first."""
+        return list(self.iter_events(since, until, set_name))
+
+    def iter_events(self, since=None, until=None, set_name=None):
+        """Generator form of query(): reads the file line by line (constant memory, for exports)."""
+        since, until = to_datetime(since), to_datetime(until)
+        with self._lock:
+            self._refresh()
+            days, offsets = list(self._days), list(self._offsets)
+        start = 0
+        if since is not None:
+            i = bisect.bisect_left(days, since.date().isoformat())
+            if i == len(days):
+                return
+            start = offsets[i]
+        stop = None
+        if until is not None and until < datetime.max - timedelta(days=MAX_RUN_DAYS + 1):  # Else read to the end
+            i = bisect.bisect_left(days, (until + timedelta(days=MAX_RUN_DAYS + 1)).date().isoformat())
+            if i < len(days):
+                stop = offsets[i]
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                pos = start
+                for raw in f:
+                    if stop is not None and pos >= stop:
+                        break
+                    pos += len(raw)
+                    try:
+                        event = json.loads(raw)
+                        event_dt = datetime.fromisoformat(event["date"])
+                    except Exception:
+                        continue
+                    if since is not None and event_dt < since:
+                        continue
+                    if until is not None and event_dt >= until:
+                        continue
+                    if set_name is not None and event.get("set") != set_name:
+                        continue
+                    yield event
+        except FileNotFoundError:
+            return
+
+    def _add_entry(self, day, offset):
+        # Called with self._lock held
+        self._days.append(day)
+        self._offsets.append(offset)
+        self._max_day = day
+        try:
+            with open(self.index_path, "a") as f:
+                f.write(f"{day} {offset}\n")
+            st = os.stat(self.index_path)
+            self._index_key = (st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            log(f"[WARN] Could not write {self.index_path}: {e}")
+
+    def _refresh(self):
+        # Called with self._lock held: (re)load the index if another process extended it,
+        # rebuild it if the JSONL file was replaced or truncated underneath it
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._days, self._offsets, self._max_day = [], [], ""
+            self._index_key = self._file_key = None
+            return
+        try:
+            ist = os.stat(self.index_path)
+            index_key = (ist.st_size, ist.st_mtime_ns)
+        except FileNotFoundError:
+            index_key = None
+        file_key = (st.st_ino, st.st_size)
+        if index_key == self._index_key and index_key is not None and \
+                (self._file_key is None or (file_key[0] == self._file_key[0] and file_key[1] >= self._file_key[1])):
+            self._file_key = file_key
+            return
+        if index_key is not None and self._load_index(st):
+            self._index_key = index_key
+            self._file_key = file_key
+            return
+        self._rebuild()
+        self._file_key = file_key
+
+    def _load_index(self, st):
+        days, offsets = [], []
+        try:
+            with open(self.index_path) as f:
+                header = f.readline().split()
+                if header[:2] != ["#", "inode"] or int(header[2]) != st.st_ino:
+                    return False
+                for line in f:
+                    day, offset = line.split()
+                    days.append(day)
+                    offsets.append(int(offset))
+        except (OSError, ValueError, IndexError):
+            return False
+        if offsets and offsets[-1] >= st.st_size:
+            return False  # JSONL truncated
+        self._days, self._offsets = days, offsets
+        self._max_day = days[-1] if days else ""
+        return True
+
+    def _rebuild(self):
+        days, offsets = [], []
+        max_day = ""
+        with open(self.path, "rb") as f:
+            pos = 0
+            for raw in f:
+                try:
+                    day = _day(json.loads(raw)["date"])
+                except Exception:
+                    day = ""
+                if day > max_day:
+                    days.append(day)
+                    offsets.append(pos)
+                    max_day = day
+                pos += len(raw)
+            inode = os.fstat(f.fileno()).st_ino
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(f"# inode {inode}\n")
+                f.writelines(f"{day} {offset}\n" for day, offset in zip(days, offsets))
+            os.replace(tmp_path, self.index_path)
+            st = os.stat(self.index_path)
+            self._index_key = (st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            log(f"[WARN] Could not write {self.index_path}: {e}")
+            self._index_key = None
+        self._days, self._offsets, self._max_day = days, offsets, max_day
+        log(f"[HISTORY] Indexed {self.path}: {len(days)} day(s)")
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def history_file(path):
+    """Shared HistoryFile for `path` (one instance per path per process)."""
+    with _files_lock:
+        if path not in _files:
+            _files[path] = HistoryFile(path)
+        return _files[path]
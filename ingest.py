@@ -0,0 +1,85 @@
+### ingest.py
+
+# Sensor reading ingest for flask_api's /<stream>-data endpoints. A POST body is
+# one reading (JSON object) or an array of them. Each reading is checked against
+# its stream's schema: the listed fields must have the listed type (or be
+# null), a "timestamp" must parse to a time between TIMESTAMP_MIN and
+# TIMESTAMP_MAX_AHEAD_SEC from now, and at least one field must be numeric.
+# Unlisted fields are kept (main.post_env_data merges the remote sensors'
+# fields into /env-data). Valid readings are handed to the sensor store's
+# group-commit writer; invalid ones are reported back by index. A request's
+# valid readings are queued all together or, if the writer is too far behind
+# (sensor_store.BacklogFull), not at all.
+
+from datetime import datetime
+
+import clock
+from sensor_store import sensor_store, to_epoch, numeric_fields
+
+NUMBER = (int, float)
+TIMESTAMP_MIN = datetime(2000, 1, 1).timestamp()   # Older: a sensor Pi whose clock was never set
+TIMESTAMP_MAX_AHEAD_SEC = 86400
+
+# Stream -> {field: accepted type(s)}; the streams main.py and the sensor Pis post
+STREAM_SCHEMAS = {
+    "env": {"set_name": str, "pressure": NUMBER, "flow": NUMBER, "moisture_b": NUMBER},
+    "soil": {"moisture": NUMBER, "soil_temperature": NUMBER},
+    "sets": {"set_name": str, "pressure": NUMBER, "flow_litres": NUMBER, "flow_pulses": NUMBER, "pressure_kpa": NUMBER},
+    "plant": {"moisture": NUMBER, "lux": NUMBER, "soil_temperature": NUMBER},
+    "environment": {"temperature": NUMBER, "humidity": NUMBER, "wind_speed": NUMBER, "barometric_pressure": NUMBER}
+}
+
+
+def validate_reading(stream, reading):
+    """Raise ValueError if `reading` does not fit `stream`'s schema."""
+    if not isinstance(reading, dict):
+        raise ValueError("reading must be a JSON object")
+    for field, kind in STREAM_SCHEMAS[stream].items():
+        value = reading.get(field)
+        if value is not None and (not isinstance(value, kind) or isinstance(value, bool)):
+            raise ValueError(f"{field} must be {'a number' if kind is NUMBER else 'a string'}, not {value!r}")
+    timestamp = reading.get("timestamp")
+    if timestamp is not None:
+        ts = to_epoch(timestamp)  # None for unparsable, NaN, infinite or out-of-range values
+        if ts is None or not TIMESTAMP_MIN <= ts <= clock.time() + TIMESTAMP_MAX_AHEAD_SEC:
+            raise ValueError(f"invalid timestamp: {timestamp!r}")
+    if next(numeric_fields(reading), None) is None:
+        raise ValueError("reading has no numeric values")
+
+
+def ingest(stream, payload):
+    """
+    Validate one reading or a list of readings and submit the valid ones.
+    Returns (accepted count, [{"index", "error"}, ...] for the rejected ones).
+    """
+    return ingest_many({stream: payload})[stream]
+
+
+def ingest_many(payloads):
+    """
+    ingest() for {stream: reading or [readings]}, submitted as one batch.
+    Returns {stream: (accepted count, rejected)}. Raises ValueError for an
+    unknown stream and sensor_store.BacklogFull (nothing queued) when the
+    writer is too far behind.
+    """
+    unknown = sorted(set(payloads) - set(STREAM_SCHEMAS))
+    if unknown:
+        raise ValueError(f"unknown stream(s): {', '.join(unknown)}")
+    items = []
+    results = {}
+    for stream, payload in payloads.items():
+        readings = payload if isinstance(payload, list) else [payload]
+        accepted = 0
+        rejected = []
+        for index, reading in enumerate(readings):
+            try:
+                validate_reading(stream, reading)
+            except ValueError as e:
+                rejected.append({"index": index, "error": str(e)})
+                continue
+            items.append((stream, reading, reading.get("timestamp") or datetime.now().isoformat()))
+            accepted += 1
+        results[stream] = (accepted, rejected)
+    if items:
+        sensor_store.submit_many(items)
+    return results
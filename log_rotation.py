@@ -0,0 +1,217 @@
+### log_rotation.py
+
+# Rotation for the append-only text logs (sprinkler_status.log, error_log.txt,
+# watering_history.log, env_readings.log, soil_readings.log).
+# The live file is rolled once it passes ROTATE_MAX_BYTES or when the first
+# write of a new day arrives; the rolled segment is renamed to
+# <log>.<YYYYmmdd-HHMMSS> and gzipped, and the oldest archives are deleted once
+# the archives of that log exceed RETENTION_BYTES. main.py and flask_api.py both
+# write some of these logs, so appends and rotation are serialised across
+# processes with flock() on <log>.lock.
+#
+# Readers use iter_lines(), which walks the archived segments and the live file
+# as one stream (oldest first, or newest first with reverse=True). Newest-first
+# reads seek backwards through the live file in REVERSE_BLOCK_BYTES blocks, so
+# "last N entries" costs O(N) however large the log has grown.
+#
+# This module must not import logger.py (logger writes through it).
+
+import fcntl
+import gzip
+import os
+import re
+import threading
+from datetime import datetime
+
+ROTATE_MAX_BYTES = 5 * 1024 * 1024     # Roll the live file at this size...
+ROTATE_DAILY = True                    # ...and at the first write of each day
+RETENTION_BYTES = 100 * 1024 * 1024    # Compressed archives kept per log
+REVERSE_BLOCK_BYTES = 64 * 1024
+
+_SEGMENT_RE = re.compile(r"\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$")
+
+
+class RotatingLog:
+    """One rotating text log. append() is safe across threads and processes."""
+
+    def __init__(self, path, max_bytes=ROTATE_MAX_BYTES, daily=ROTATE_DAILY, retention_bytes=RETENTION_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.daily = daily
+        self.retention_bytes = retention_bytes
+        self._lock = threading.Lock()
+
+    def append(self, data, fsync=False):
+        """Append `data` (str), rolling the live file first if it is due."""
+        with self._lock:
+            if self._rotation_due(len(data)):
+                with self._flock(fcntl.LOCK_EX):
+                    if self._rotation_due(len(data)):  # Another process may have rolled it
+                        self._rotate()
+            with self._flock(fcntl.LOCK_SH):
+                with open(self.path, "a") as f:
+                    f.write(data)
+                    f.flush()
+                    if fsync:
+                        os.fsync(f.fileno())
+
+    def _flock(self, mode):
+        return _FileLock(self.path + ".lock", mode)
+
+    def _rotation_due(self, incoming):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_size == 0:
+            return False
+        if st.st_size + incoming > self.max_bytes:
+            return True
+        return self.daily and datetime.fromtimestamp(st.st_mtime).date() != datetime.now().date()
+
+    def _rotate(self):
+        stamp = datetime.fromtimestamp(os.stat(self.path).st_mtime).strftime("%Y%m%d-%H%M%S")
+        target = f"{self.path}.{stamp}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{self.path}.{stamp}-{n}"
+            n += 1
+        os.rename(self.path, target)
+        try:
+            with open(target, "rb") as src, gzip.open(target + ".gz.tmp", "wb") as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(target + ".gz.tmp", target + ".gz")
+            os.remove(target)
+        except Exception as e:
+            print(f"[LOG_ROTATION] Could not compress {target}: {e}")  # Left uncompressed; still readable
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        archives = self.archived_segments()
+        total = sum(os.path.getsize(p) for p in archives)
+        for path in archives[:-1]:  # Always keep the newest archive
+            if total <= self.retention_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def archived_segments(self):
+        """Rolled segments of this log, oldest first (.gz, or plain if compression failed)."""
+        directory = os.path.dirname(self.path) or "."
+        base = os.path.basename(self.path)
+        found = []
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            if not name.startswith(base + "."):
+                continue
+            m = _SEGMENT_RE.fullmatch(name[len(base):])
+            if m:
+                found.append(((m.group(1), int(m.group(2) or 0)), os.path.join(directory, name)))
+        found.sort()
+        return [path for _, path in found]
+
+    def segments(self):
+        """Every segment oldest first, the live file last (if present)."""
+        segments = self.archived_segments()
+        if os.path.exists(self.path):
+            segments.append(self.path)
+        return segments
+
+    def iter_lines(self, reverse=False):
+        """
+        Yield the lines (with their newline) of every segment as one stream.
+        With reverse=True the newest line comes first and older segments are
+        only opened once the newer ones are exhausted.
+        """
+        segments = self.segments()
+        if reverse:
+            segments.reverse()
+        for path in segments:
+            try:
+                if reverse and not path.endswith(".gz"):
+                    yield from _reverse_lines(path)
+                elif reverse:
+                    yield from reversed(_read_segment(path))
+                else:
+                    yield from _stream_segment(path)  # Constant memory however large the segment
+            except FileNotFoundError:
+                continue  # Rolled or expired while we were reading
+
+
+class _FileLock:
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, self.mode)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+def _reverse_lines(path, block_size=REVERSE_BLOCK_BYTES):
+    """Lines of the uncompressed file `path`, newest first."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        carry = b""  # Start of a line whose beginning lies in an earlier block (ends with its newline)
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + carry
+            cut = 0 if pos == 0 else buf.find(b"\n") + 1
+            if pos > 0 and cut == 0:
+                carry = buf  # No line boundary in this block yet
+                continue
+            carry = buf[:cut]
+            parts = buf[cut:].split(b"\n")
+            if parts[-1]:
+                yield parts[-1].decode(errors="replace")  # Unterminated last line of the file
+            for part in reversed(parts[:-1]):
+                yield (part + b"\n").decode(errors="replace")
+
+
+def _stream_segment(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="replace") as f:
+        yield from f
+
+
+def _read_segment(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="replace") as f:
+        return f.readlines()
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def rotating_log(path, **options):
+    """Shared RotatingLog for `path` (one instance per path per process)."""
+    with _logs_lock:
+        if path not in _logs:
+            _logs[path] = RotatingLog(path, **options)
+        return _logs[path]
+
+
+def append_line(path, line, fsync=False):
+    """Append one line (newline added if missing) to the rotating log at `path`."""
+    if not line.endswith("\n"):
+        line += "\n"
+    rotating_log(path).append(line, fsync=fsync)
+
+
+def iter_lines(path, reverse=False):
+    return rotating_log(path).iter_lines(reverse)
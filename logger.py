@@ -1,17 +1,110 @@
 ### logger.py
 
+# Asynchronous status log. log() only formats the line and puts it on a bounded
+# queue; a background writer appends queued lines in batches and fsyncs them as
+# a group (every LOG_FSYNC_INTERVAL_SEC, or sooner once LOG_FSYNC_BYTES are
+# pending), so callers - including the relay timing paths - never wait on the
+# SD card and the card sees far fewer small writes. [ERROR]/[FATAL] lines are
+# synced right away; flush() waits until everything logged so far is on disk
+# and runs automatically at interpreter exit. The file is size/day rotated by
+# log_rotation.py.
+
+import atexit
+import queue
 import threading
-import os
-from datetime import datetime
+import time
+
+import clock
+from log_rotation import rotating_log
 
 LOG_PATH = "/home/lds00/sprinkler/sprinkler_status.log"
-_log_lock = threading.Lock()
+LOG_QUEUE_MAX = 10000        # Lines held in memory before log() starts dropping
+LOG_FSYNC_INTERVAL_SEC = 2.0
+LOG_FSYNC_BYTES = 64 * 1024
+LOG_FLUSH_TIMEOUT_SEC = 5.0
+
+_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+_dropped = 0
+
 
 def log(msg):
-    ts = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
+    global _dropped
+    ts = clock.now().strftime("[%Y-%m-%d %H:%M:%S]")
     line = f"{ts} {msg}\n"
-    with _log_lock:
-        with open(LOG_PATH, "a") as f:
-            f.write(line)
-            f.flush()
-            os.fsync(f.fileno())
\ No newline at end of file
+    _ensure_writer()
+    try:
+        _queue.put_nowait((line, msg.startswith(("[ERROR]", "[FATAL]"))))
+    except queue.Full:
+        _dropped += 1  # Never block the caller; the writer reports the gap
+
+
+def flush(timeout=LOG_FLUSH_TIMEOUT_SEC):
+    """Block until every line logged so far is written and fsynced. Returns False on timeout."""
+    if _writer is None:
+        return True
+    done = threading.Event()
+    try:
+        _queue.put((None, done), timeout=timeout)
+    except queue.Full:
+        return False
+    return done.wait(timeout)
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, daemon=True, name="log-writer")
+            _writer.start()
+
+
+def _write_loop():
+    global _dropped
+    unsynced = 0
+    last_sync = time.monotonic()
+    while True:
+        try:
+            items = [_queue.get(timeout=LOG_FSYNC_INTERVAL_SEC)]
+        except queue.Empty:
+            items = []
+        while True:  # Take everything already queued as one batch
+            try:
+                items.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        lines = []
+        sync_now = False
+        waiters = []
+        for line, flag in items:
+            if line is None:
+                waiters.append(flag)  # flush() request
+                sync_now = True
+            else:
+                lines.append(line)
+                sync_now = sync_now or flag
+        if _dropped:
+            dropped, _dropped = _dropped, 0
+            ts = clock.now().strftime("[%Y-%m-%d %H:%M:%S]")
+            lines.append(f"{ts} [WARN] Log queue full; dropped {dropped} message(s)\n")
+        path = LOG_PATH  # Can be redirected at runtime (simulate.py)
+        try:
+            data = "".join(lines)
+            unsynced += len(data)
+            now = time.monotonic()
+            fsync = unsynced > 0 and (sync_now or unsynced >= LOG_FSYNC_BYTES or now - last_sync >= LOG_FSYNC_INTERVAL_SEC)
+            if data or fsync:
+                rotating_log(path).append(data, fsync=fsync)
+            if fsync:
+                unsynced = 0
+                last_sync = now
+        except Exception as e:
+            print(f"[LOGGER] Could not write {path}: {e}")
+        for done in waiters:
+            done.set()
+
+
+atexit.register(flush)
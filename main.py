@@ -1,22 +1,18 @@
 import os
 import sys
 import time
-import traceback
 import paho.mqtt.client as mqtt
 from datetime import datetime
+from error_reporter import error_reporter, report_error, ERROR_COUNTS_FILE
 
 ERROR_LOG_FILE = "/home/lds00/sprinkler/error_log.txt"
 
+# Repeats are collapsed into periodic summaries, also across restarts
+error_reporter.persist_to(ERROR_COUNTS_FILE)
+
 def log_error(msg, exc=None, extra=None):
-    try:
-        with open(ERROR_LOG_FILE, "a") as ef:
-            ef.write(f"[{datetime.now().isoformat()}] {msg}\n")
-            if exc:
-                ef.write(traceback.format_exc())
-            if extra:
-                ef.write(f"\n--- EXTRA DEBUG INFO ---\n{extra}\n")
-    except Exception as e:
-        print(f"[FATAL] Could not write to error_log.txt: {e}")
+    """Write to error_log.txt through the deduplicating, rate-limited error reporter."""
+    return error_reporter.report(msg, exc, extra, stacklevel=2)
 
 # --- Kill any existing main.py or GPIO-using processes to avoid conflicts ---
 # (Removed per user request)
@@ -26,14 +22,23 @@ print("[DEBUG] kill_conflicting_processes() complete. Continuing startup...")
 ### main.py
 
 import os
+import signal
 import time
 import threading
 from datetime import datetime, timedelta
-from scheduler import load_json, should_run_today, is_start_time_enabled
+from scheduler import load_json, is_start_time_enabled, MIST_RECHECK_SECONDS
+import clock
+from schedule_cache import get_schedule
 from gpio_controller import initialize_gpio, status_led_controller, turn_off
-from flask_api import app, manual_set, soon_set
-from run_manager import run_set
+from flask_api import app, manual_set, soon_set, update_mist_status
+from run_manager import start_run, force_stop_all, STOP_REQUEST_FILE, CONTROLLER_PID_FILE
+from zone_sequencer import ZoneSequencer
+from schedule_actions import ScheduleActions, MISSED_START_GRACE_MINUTES
+from schedule_engine import ScheduleEngine, compile_start_events, next_midnight
 from status import CURRENT_RUN
+from shared_state import shared_state
+from state_file import mist_status, last_completed_run
+from sensor_client import sensor_client
 from logger import log
 import logging
 from config import RELAYS
@@ -47,7 +52,7 @@ SCHEDULE_FILE = "/home/lds00/sprinkler/sprinkler_schedule.json"
 MANUAL_COMMAND_FILE = "/home/lds00/sprinkler/manual_command.json"
 LOG_FILE = "/home/lds00/sprinkler/watering_history.log"
 TEST_MODE_FILE = "/home/lds00/sprinkler/test_mode.txt"
-MIST_STATUS_FILE = "/home/lds00/sprinkler/mist_status.json"
+LAST_SCHEDULED_RUN_FILE = "/home/lds00/sprinkler/last_scheduled_run.json"
 ERROR_LOG_FILE = "/home/lds00/sprinkler/error_log.txt"
 
 DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "0") == "1"
@@ -65,7 +70,7 @@ _weather_cache = {"temp": None, "timestamp": 0}
 WEATHER_CACHE_SECONDS = 300  # 5 minutes
 
 def get_current_temperature():
-    now = time.time()
+    now = clock.time()
     if _weather_cache["temp"] is not None and now - _weather_cache["timestamp"] < WEATHER_CACHE_SECONDS:
         return _weather_cache["temp"]
     try:
@@ -77,88 +82,9 @@ def get_current_temperature():
         _weather_cache["timestamp"] = now
         return temp
     except Exception as e:
-        log(f"[ERROR] Failed to fetch temperature from OpenWeatherMap: {e}")
+        report_error(f"[ERROR] Failed to fetch temperature from OpenWeatherMap: {e}", error_log=False)
         return _weather_cache["temp"]  # Return last known temp (may be None)
 
-# Track last mist times for each temperature setting
-_last_mist_times = {}
-
-def mist_manager(schedule):
-    # Prevent misting if a manual run is active
-    if manual_set is not None:
-        log("[MIST] Skipping misting because manual run is active.")
-        return
-    mist_settings = schedule.get("mist", {}).get("temperature_settings", [])
-    if not mist_settings:
-        return
-    current_temp = get_current_temperature()
-    if current_temp is None:
-        log("[MIST] Skipping misting because temperature is unavailable.")
-        return
-    now = time.time()
-    # Find the highest temp threshold that applies
-    active_setting = None
-    for setting in sorted(mist_settings, key=lambda s: s.get("temperature", 0), reverse=True):
-        if current_temp >= setting.get("temperature", 0):
-            active_setting = setting
-            break
-    interval = active_setting.get("interval") if active_setting else None
-    duration = active_setting.get("duration") if active_setting else None
-    # Find last and next mist event times
-    try:
-        with open("/home/lds00/sprinkler/mist_status.json") as f:
-            last_status = json.load(f)
-            last_mist_event = last_status.get("last_mist_event")
-            next_mist_event = last_status.get("next_mist_event")
-    except Exception:
-        last_mist_event = None
-        next_mist_event = None
-    # Calculate next mist event time
-    if last_mist_event and interval:
-        try:
-            last_dt = datetime.fromisoformat(last_mist_event)
-            next_mist_event = (last_dt + timedelta(minutes=interval)).isoformat()
-        except Exception:
-            next_mist_event = None
-    # If a mist is triggered, update last_mist_event
-    mist_triggered = False
-    for setting in mist_settings:
-        temp_threshold = setting.get("temperature")
-        interval = setting.get("interval")  # in minutes
-        duration = setting.get("duration")  # in minutes
-        if temp_threshold is None or interval is None or duration is None:
-            continue
-        if current_temp >= temp_threshold:
-            key = f"{temp_threshold}_{interval}_{duration}"
-            last_time = _last_mist_times.get(key, 0)
-            if now - last_time >= interval * 60:
-                log(f"[WEATHER] Current temperature from OpenWeatherMap: {current_temp}°F")
-                log(f"[MIST] Triggering mist for temp >= {temp_threshold}°F: {duration} min")
-                threading.Thread(
-                    target=run_set,
-                    args=("Misters", duration, RELAYS, LOG_FILE),
-                    kwargs={
-                        "source": f"MIST_{temp_threshold}",
-                        "pulse": None,
-                        "soak": None
-                    },
-                    daemon=True
-                ).start()
-                _last_mist_times[key] = now
-                mist_triggered = True
-                last_mist_event = datetime.now().isoformat()
-                next_mist_event = (datetime.now() + timedelta(minutes=interval)).isoformat() if interval else None
-    # Update mist status for API
-    from flask_api import update_mist_status
-    update_mist_status(
-        is_misting=mist_triggered,
-        last_mist_event=last_mist_event,
-        next_mist_event=next_mist_event,
-        current_temperature=current_temp,
-        interval_minutes=interval,
-        duration_minutes=duration
-    )
-
 def ensure_all_relays_off():
     for name, pin in RELAYS.items():
         try:
@@ -172,25 +98,24 @@ def run_manual_command(command, schedule):
     from gpio_controller import initialize_gpio
     initialize_gpio(RELAYS)
     # Interrupt and stop any currently running set(s)
-    from run_manager import force_stop_all
+    sequencer.clear_queue()
     force_stop_all()
     sets = command.get("manual_run", {}).get("sets", [])
     duration = command.get("manual_run", {}).get("duration_minutes", 1)
 
+    zones = []
     for set_name in sets:
         match = next((s for s in schedule.get("sets", []) if s["set_name"] == set_name), None)
         if match:
             log(f"[MANUAL] Starting {set_name} for {duration} min")
-            threading.Thread(
-                target=run_set,
-                args=(set_name, duration, RELAYS, LOG_FILE),
-                kwargs={
-                    "source": "MANUAL",
-                    "pulse": match.get("pulse_duration_minutes"),
-                    "soak": match.get("soak_duration_minutes")
-                },
-                daemon=True
-            ).start()
+            zones.append({
+                "set": set_name,
+                "duration_minutes": duration,
+                "pulse": match.get("pulse_duration_minutes"),
+                "soak": match.get("soak_duration_minutes")
+            })
+    if zones:
+        sequencer.submit(zones, source="MANUAL", immediate=True)
 
 # Only read from test_mode.txt, never write to it!
 def read_test_mode_from_file():
@@ -215,33 +140,52 @@ def get_next_scheduled_set(schedule, current_time):
                     return s["set_name"]
     return None
 
-# Track misting state in memory for API
-mist_state = {
-    "is_misting": False,
-    "last_mist_event": None,
-    "next_mist_event": None,
-    "current_temperature": None,
-    "interval_minutes": None,
-    "duration_minutes": None
-}
-
-def update_mist_status(is_misting, last_mist_event, next_mist_event, current_temperature, interval_minutes, duration_minutes):
-    mist_state.update({
-        "is_misting": is_misting,
-        "last_mist_event": last_mist_event,
-        "next_mist_event": next_mist_event,
-        "current_temperature": current_temperature,
-        "interval_minutes": interval_minutes,
-        "duration_minutes": duration_minutes
-    })
+# Track last scheduled run for each start time (global)
+# Persisted to last_scheduled_run.json so a restart neither re-fires nor misses a start.
+def load_last_scheduled_run():
     try:
-        with open(MIST_STATUS_FILE, "w") as f:
-            json.dump(mist_state, f)
-    except Exception:
-        pass
+        with open(LAST_SCHEDULED_RUN_FILE) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log(f"[WARN] Could not read {LAST_SCHEDULED_RUN_FILE}: {e}")
+        return {}
 
-# Track last scheduled run for each start time (global)
-last_scheduled_run = {}
+def save_last_scheduled_run():
+    tmp_path = LAST_SCHEDULED_RUN_FILE + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(last_scheduled_run, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, LAST_SCHEDULED_RUN_FILE)
+    except Exception as e:
+        log(f"[WARN] Could not write {LAST_SCHEDULED_RUN_FILE}: {e}")
+
+last_scheduled_run = load_last_scheduled_run()
+
+# --- ZONE SEQUENCER ---
+# All runs (scheduled, manual, mist) are queued and admitted against the
+# hydraulic budget in config.py instead of opening every zone at once.
+def start_zone(set_name, duration_minutes, **kwargs):
+    return start_run(set_name, duration_minutes, RELAYS, LOG_FILE, **kwargs)
+
+sequencer = ZoneSequencer(start_zone)
+
+# Start and mist decisions are shared with simulate.py; main supplies the
+# real weather, persistence, API status and manual-run state.
+actions = ScheduleActions(
+    sequencer,
+    get_current_temperature,
+    last_runs=last_scheduled_run,
+    save_last_runs=save_last_scheduled_run,
+    publish_mist=update_mist_status,
+    mist_status=mist_status,
+    manual_active=lambda: manual_set is not None,
+    grace_minutes=MISSED_START_GRACE_MINUTES
+)
 
 # --- ADC SETUP FOR PRESSURE SENSOR ---
 try:
@@ -334,7 +278,7 @@ def fetch_remote_flow():
             "moisture_b": data.get("moisture_b")
         }
     except Exception as e:
-        log(f"[REMOTE FLOW ERROR] {e}")
+        report_error(f"[REMOTE FLOW ERROR] {e}", error_log=False)
         return {}
 
 def fetch_remote_moisture():
@@ -350,67 +294,31 @@ def fetch_remote_moisture():
         else:
             return None
     except Exception as e:
-        log(f"[REMOTE MOISTURE ERROR] {e}")
+        report_error(f"[REMOTE MOISTURE ERROR] {e}", error_log=False)
         return None
 
 # --- REMOTE SENSOR FETCHING (NEW ENDPOINTS) ---
+# Through sensor_client: one pooled keep-alive session, concurrent fetches and a
+# circuit breaker per endpoint while the sensor Pi is offline.
 def fetch_remote_sets():
-    try:
-        print("[DEBUG] Fetching remote sets data...")
-        resp = requests.get("http://100.117.254.20:8000/sets-latest", timeout=2)
-        data = resp.json()
-        print(f"[DEBUG] Received sets data: {data}")
-        return {
-            "flow_litres": data.get("flow_litres"),
-            "flow_pulses": data.get("flow_pulses"),
-            "pressure_kpa": data.get("pressure_kpa")
-        }
-    except Exception as e:
-        log(f"[REMOTE SETS ERROR] {e}")
-        print(f"[ERROR] Failed to fetch remote sets: {e}")
-        return {}
+    return sensor_client.fetch("sets")
 
 def fetch_remote_plant():
-    try:
-        print("[DEBUG] Fetching remote plant data...")
-        resp = requests.get("http://100.117.254.20:8000/plant-latest", timeout=2)
-        data = resp.json()
-        print(f"[DEBUG] Received plant data: {data}")
-        return {
-            "moisture": data.get("moisture"),
-            "lux": data.get("lux"),
-            "soil_temperature": data.get("soil_temperature")
-        }
-    except Exception as e:
-        log(f"[REMOTE PLANT ERROR] {e}")
-        print(f"[ERROR] Failed to fetch remote plant: {e}")
-        return {}
+    return sensor_client.fetch("plant")
 
 def fetch_remote_environment():
-    try:
-        print("[DEBUG] Fetching remote environment data...")
-        resp = requests.get("http://100.117.254.20:8000/environment-latest", timeout=2)
-        data = resp.json()
-        print(f"[DEBUG] Received environment data: {data}")
-        return {
-            "temperature": data.get("temperature"),
-            "humidity": data.get("humidity"),
-            "wind_speed": data.get("wind_speed"),
-            "barometric_pressure": data.get("barometric_pressure")
-        }
-    except Exception as e:
-        log(f"[REMOTE ENV ERROR] {e}")
-        print(f"[ERROR] Failed to fetch remote environment: {e}")
-        return {}
+    return sensor_client.fetch("environment")
 
-# --- ENV DATA POSTING ---
-def post_env_data(set_name, flow, moisture_b):
+def read_local_pressure():
     adc_value = read_adc(0)  # Channel 0 for pressure sensor (local only)
     voltage = adc_to_voltage(adc_value)
-    pressure = voltage_to_psi(voltage)
-    sets = fetch_remote_sets()
-    plant = fetch_remote_plant()
-    env = fetch_remote_environment()
+    return voltage_to_psi(voltage)
+
+# --- ENV DATA POSTING ---
+def post_env_data(set_name, flow, moisture_b):
+    pressure = read_local_pressure()
+    remote = sensor_client.fetch_all()
+    sets, plant, env = remote["sets"], remote["plant"], remote["environment"]
     flow_litres = sets.get("flow_litres") if sets.get("flow_litres") is not None else flow
     flow_lpm = flow_litres * 60 if flow_litres is not None else None
     payload = {
@@ -424,54 +332,25 @@ def post_env_data(set_name, flow, moisture_b):
         for k, v in d.items():
             if v is not None:
                 payload[k] = v
-    try:
+    if DEBUG_VERBOSE:
         print(f"[DEBUG] Sending env data: {payload}")
-        requests.post("http://127.0.0.1:5000/env-data", json=payload, timeout=2)
-        print("[DEBUG] Env data sent successfully.")
-    except Exception as e:
-        log(f"[ENV_DATA POST ERROR] {e}")
-        print(f"[ERROR] Failed to send env data: {e}")
+    if sensor_client.post("/env-data", payload) is None:
+        print("[ERROR] Failed to send env data (see status log)")
 
-# --- POST REMOTE DATA TO GUI/API AS SEPARATE PAYLOADS ---
+# --- POST REMOTE DATA TO GUI/API IN ONE REQUEST ---
 def post_all_env_data(set_name=None):
-    adc_value = read_adc(0)
-    voltage = adc_to_voltage(adc_value)
-    pressure = voltage_to_psi(voltage)
-    sets = fetch_remote_sets()
-    plant = fetch_remote_plant()
-    env = fetch_remote_environment()
-    if sets is not None:
-        sets_payload = dict(sets)
-        sets_payload["timestamp"] = datetime.now().isoformat()
-        sets_payload["set_name"] = set_name
-        sets_payload["pressure"] = pressure
-        try:
-            print(f"[DEBUG] Sending sets data: {sets_payload}")
-            requests.post("http://127.0.0.1:5000/sets-data", json=sets_payload, timeout=2)
-            print("[DEBUG] Sets data sent successfully.")
-        except Exception as e:
-            log(f"[SETS_DATA POST ERROR] {e}")
-            print(f"[ERROR] Failed to send sets data: {e}")
-    if plant is not None:
-        plant_payload = dict(plant)
-        plant_payload["timestamp"] = datetime.now().isoformat()
-        try:
-            print(f"[DEBUG] Sending plant data: {plant_payload}")
-            requests.post("http://127.0.0.1:5000/plant-data", json=plant_payload, timeout=2)
-            print("[DEBUG] Plant data sent successfully.")
-        except Exception as e:
-            log(f"[PLANT_DATA POST ERROR] {e}")
-            print(f"[ERROR] Failed to send plant data: {e}")
-    if env is not None:
-        env_payload = dict(env)
-        env_payload["timestamp"] = datetime.now().isoformat()
-        try:
-            print(f"[DEBUG] Sending environment data: {env_payload}")
-            requests.post("http://127.0.0.1:5000/environment-data", json=env_payload, timeout=2)
-            print("[DEBUG] Environment data sent successfully.")
-        except Exception as e:
-            log(f"[ENVIRONMENT_DATA POST ERROR] {e}")
-            print(f"[ERROR] Failed to send environment data: {e}")
+    pressure = read_local_pressure()
+    remote = sensor_client.fetch_all()  # Concurrent: one round trip (or one timeout) for all three
+    timestamp = datetime.now().isoformat()
+    # sets always carries the local pressure; the others are skipped when their endpoint gave nothing
+    readings = {"sets": dict(remote["sets"], timestamp=timestamp, set_name=set_name, pressure=pressure)}
+    for stream in ("plant", "environment"):
+        if remote[stream]:
+            readings[stream] = dict(remote[stream], timestamp=timestamp)
+    if DEBUG_VERBOSE:
+        print(f"[DEBUG] Sending sensor data: {readings}")
+    if sensor_client.post_readings(readings) is None:
+        print("[ERROR] Failed to send sensor data (see status log)")
 
 # --- MQTT SETUP FOR STATUS PUBLISHING ---
 MQTT_BROKER = 'localhost'
@@ -494,16 +373,11 @@ def get_status_payload():
         # Compose a status dict similar to the old /status endpoint
         status = {
             'timestamp': datetime.now().isoformat(),
-            'mist_state': mist_state.copy(),
-            'last_completed_run': None,
+            'mist_state': dict(mist_status.get()),
+            'last_completed_run': last_completed_run.get(),
             'gpio_ok': True,
         }
         # Optionally add more fields as needed
-        try:
-            with open('/home/lds00/sprinkler/last_completed_run.json') as f:
-                status['last_completed_run'] = json.load(f)
-        except Exception:
-            status['last_completed_run'] = None
         return status
     except Exception as e:
         log_error(f"[ERROR] Failed to build status payload: {e}")
@@ -536,96 +410,152 @@ def led_status_thread():
         status_led_controller(CURRENT_RUN, test_mode=test_mode)
         time.sleep(0.1)
 
+# --- EVENT-DRIVEN MAIN LOOP ---
+# The schedule is compiled into "soon"/"start" events (schedule_engine) and the
+# loop sleeps until the next one. Only cheap os.stat() checks run every second.
+HOUSEKEEPING_SECONDS = 1
+
+engine = ScheduleEngine()
+_schedule = None
+_last_manual_mtime = 0
+
+def compile_timeline():
+    """(Re)build the start/soon/midnight events from the current schedule."""
+    engine.cancel("soon", "start", "midnight")
+    if _schedule is not None:
+        events = compile_start_events(_schedule, grace_minutes=MISSED_START_GRACE_MINUTES)
+        for when, kind, payload in events:
+            engine.schedule_at(when, kind, payload)
+        log(f"[SCHEDULER] Compiled {sum(1 for e in events if e[1] == 'start')} upcoming start(s)")
+    engine.schedule_at(next_midnight(), "midnight")
+
+def reload_schedule():
+    """Pick up a new schedule version from the shared cache. Returns True when it changed."""
+    global _schedule
+    try:
+        schedule = get_schedule()
+    except Exception:
+        return False  # schedule_cache already logged why
+    if _schedule is not None and schedule.version == _schedule.version:
+        return False
+    _schedule = schedule
+    return True
+
+def on_soon(event, late_sec):
+    global soon_set
+    if _schedule is None:
+        return
+    soon_set = get_next_scheduled_set(_schedule, event.payload["time"])
+
+def on_start(event, late_sec):
+    global soon_set
+    soon_set = None
+    actions.start(_schedule, event.payload, late_sec)
+
+def on_midnight(event, late_sec):
+    compile_timeline()
+
+def on_mist(event, late_sec):
+    recheck_sec = MIST_RECHECK_SECONDS
+    if _schedule is not None:
+        recheck_sec = actions.mist(_schedule)
+    engine.schedule_in(recheck_sec, "mist")
+
+_stop_lock = threading.Lock()
+
+def handle_stop_request():
+    """Stop everything on behalf of flask_api's /stop-all and acknowledge by deleting the request file."""
+    with _stop_lock:
+        if not os.path.exists(STOP_REQUEST_FILE):
+            return
+        log("[SYSTEM] Stop-all requested by API")
+        sequencer.clear_queue()
+        force_stop_all()
+        try:
+            os.remove(STOP_REQUEST_FILE)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log(f"[WARN] Could not delete stop request file: {e}")
+
+def on_stop_signal(signum, frame):
+    # Keep the signal handler short; the stop itself blocks until relays are confirmed off
+    threading.Thread(target=handle_stop_request, daemon=True).start()
+
+def on_housekeeping(event, late_sec):
+    global _last_test_mode, manual_set, _last_manual_mtime
+    # Stop request whose SIGUSR1 was missed (e.g. sent before we started)
+    if os.path.exists(STOP_REQUEST_FILE):
+        handle_stop_request()
+    # Manual run detection
+    if os.path.exists(MANUAL_COMMAND_FILE):
+        try:
+            mtime = os.path.getmtime(MANUAL_COMMAND_FILE)
+            if mtime > _last_manual_mtime:
+                try:
+                    data = load_json(MANUAL_COMMAND_FILE)
+                    sets = data.get("manual_run", {}).get("sets", [])
+                    manual_set = sets[0] if sets else None
+                    run_manual_command(data, _schedule or {})
+                except Exception as e:
+                    log(f"[ERROR] Failed to parse or execute manual command: {e}")
+                finally:
+                    try:
+                        os.remove(MANUAL_COMMAND_FILE)
+                    except Exception as e:
+                        log(f"[WARN] Could not delete manual command file: {e}")
+                _last_manual_mtime = mtime
+        except Exception as e:
+            log(f"[ERROR] Could not stat manual command file: {e}")
+    else:
+        manual_set = None
+    # Schedule file change (schedule_cache re-parses only when the file changed)
+    if reload_schedule():
+        log("[SCHEDULER] Schedule file changed, recompiling timeline")
+        compile_timeline()
+        engine.cancel("mist")
+        engine.schedule_in(0, "mist")
+    elif engine.clock_jumped():
+        log("[SCHEDULER] Wall clock changed, recompiling timeline")
+        compile_timeline()
+    # Summaries of repeating errors, error_counts.json
+    error_reporter.flush_due()
+    # Test mode state update
+    current_test_mode = read_test_mode_from_file()
+    if current_test_mode != _last_test_mode:
+        log(f"[INFO] TEST_MODE changed to {current_test_mode}")
+        _last_test_mode = current_test_mode
+    engine.schedule_in(HOUSEKEEPING_SECONDS, "housekeeping")
+
 def main_loop():
     """
-    Main control loop for the sprinkler system.
-    - Loads schedule and checks if today is a watering day.
-    - Handles manual runs via manual_command.json.
-    - Handles scheduled runs for enabled sets.
-    - Prevents duplicate runs per day using last_scheduled_run.
-    - Calls mist_manager for mist logic.
-    - Updates test mode state and logs changes.
-    - Sleeps 1 second per loop.
+    Main control loop for the sprinkler system (event-driven).
+    - Compiles the schedule into start/"soon" events on monotonic deadlines.
+    - Queues enabled sets on the zone sequencer exactly on each start time; a start that was due while the loop
+      was blocked or restarting is launched late (within MISSED_START_GRACE_MINUTES).
+    - last_scheduled_run (persisted) prevents duplicates, including across restarts.
+    - Evaluates the mist decision (schedule_actions) only when a mist interval falls due (or every MIST_RECHECK_SECONDS).
+    - Handles manual runs via manual_command.json, schedule edits and test mode changes
+      with a 1-second os.stat() check; nothing is re-parsed unless it changed.
+    - Recompiles at midnight and whenever the wall clock jumps.
     """
-    global _last_test_mode, manual_set, soon_set, last_scheduled_run
+    global _last_test_mode, manual_set, soon_set
     log("[DEBUG] main_loop has started")
-    last_manual_mtime = 0
     _last_test_mode = read_test_mode_from_file()
     log(f"[INFO] TEST_MODE = {_last_test_mode}")
     manual_set = None
     soon_set = None
-    error_zones = None
-    maintenance = False
-    while True:
-        now = datetime.now()
-        current_time = now.strftime("%H:%M")
-        today_str = now.strftime("%Y-%m-%d")
-        try:
-            schedule = load_json(SCHEDULE_FILE)
-        except Exception as e:
-            log(f"[ERROR] Failed to load schedule: {e}")
-            time.sleep(5)
-            continue
-        # Manual run detection
-        if os.path.exists(MANUAL_COMMAND_FILE):
-            try:
-                mtime = os.path.getmtime(MANUAL_COMMAND_FILE)
-                if mtime > last_manual_mtime:
-                    try:
-                        data = load_json(MANUAL_COMMAND_FILE)
-                        sets = data.get("manual_run", {}).get("sets", [])
-                        manual_set = sets[0] if sets else None
-                        run_manual_command(data, schedule)
-                    except Exception as e:
-                        log(f"[ERROR] Failed to parse or execute manual command: {e}")
-                    finally:
-                        try:
-                            os.remove(MANUAL_COMMAND_FILE)
-                        except Exception as e:
-                            log(f"[WARN] Could not delete manual command file: {e}")
-                    last_manual_mtime = mtime
-            except Exception as e:
-                log(f"[ERROR] Could not stat manual command file: {e}")
-        else:
-            manual_set = None
-        # Scheduled soon detection
-        soon_set = get_next_scheduled_set(schedule, current_time)
-        # Scheduled run detection
-        if should_run_today(schedule):
-            for entry in schedule.get("start_times", []):
-                sched_time = entry["time"]
-                if not entry.get("isEnabled", False):
-                    continue
-                # Only run if we haven't already run this start_time today
-                if last_scheduled_run.get(sched_time) == today_str:
-                    continue
-                if current_time == sched_time:
-                    for s in schedule.get("sets", []):
-                        if s["set_name"] == "Misters":
-                            continue  # skip Misters for scheduled runs
-                        if not s.get("mode", True):
-                            continue  # skip inactive sets
-                        log(f"[SCHEDULED] Launching set {s['set_name']} at {current_time}")
-                        threading.Thread(
-                            target=run_set,
-                            args=(s["set_name"], s.get("run_duration_minutes", 1), RELAYS, LOG_FILE),
-                            kwargs={
-                                "pulse": s.get("pulse_duration_minutes"),
-                                "soak": s.get("soak_duration_minutes")
-                            },
-                            daemon=True
-                        ).start()
-                    last_scheduled_run[sched_time] = today_str
-        # Enhanced mist logic: use temperature_settings
-        mist_manager(schedule)
-        # Test mode state update
-        current_test_mode = read_test_mode_from_file()
-        if current_test_mode != _last_test_mode:
-            log(f"[INFO] TEST_MODE changed to {current_test_mode}")
-            _last_test_mode = current_test_mode
-        time.sleep(1)
+    engine.on("soon", on_soon)
+    engine.on("start", on_start)
+    engine.on("midnight", on_midnight)
+    engine.on("mist", on_mist)
+    engine.on("housekeeping", on_housekeeping)
+    reload_schedule()
+    compile_timeline()
+    engine.schedule_in(0, "mist")
+    engine.schedule_in(HOUSEKEEPING_SECONDS, "housekeeping")
+    engine.run_forever()
 
-import signal
 import sys
 
 def handle_sigterm(signum, frame):
@@ -651,16 +581,36 @@ if __name__ == "__main__":
         pass
     except Exception as e:
         log(f"[WARN] Could not delete manual command file at startup: {e}")
+    # A stop request left over from before a restart has nothing left to stop
+    try:
+        os.remove(STOP_REQUEST_FILE)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"[WARN] Could not delete stop request file at startup: {e}")
+    # Let flask_api's /stop-all reach this process's run engine
+    try:
+        with open(CONTROLLER_PID_FILE, "w") as f:
+            f.write(str(os.getpid()))
+    except Exception as e:
+        log(f"[WARN] Could not write {CONTROLLER_PID_FILE}: {e}")
+    signal.signal(signal.SIGUSR1, on_stop_signal)
+    # Publish live run/mist state to the API process through shared memory
+    try:
+        shared_state.open_writer()
+    except Exception as e:
+        log(f"[WARN] Could not create shared state segment {shared_state.path}: {e}")
     log("[DEBUG] Waiting 2 seconds after ensure_all_relays_off to avoid relay chatter at startup.")
     time.sleep(2)
+    sequencer.start()
     threading.Thread(target=main_loop, daemon=True).start()
     threading.Thread(target=led_status_thread, daemon=True).start()
     threading.Thread(target=env_history_logger, daemon=True).start()
     # Suppress Flask/Werkzeug request logs
     import logging as py_logging
     py_logging.getLogger('werkzeug').setLevel(py_logging.WARNING)
-    # DO NOT run Flask server here. Run it separately using flask_api.py
-    log("[INFO] main.py started without running Flask server. Start flask_api.py separately for API endpoints.")
+    # DO NOT run Flask server here. Run it separately using serve_api.py
+    log("[INFO] main.py started without running Flask server. Start serve_api.py (sprinkler_api.service) separately for API endpoints.")
     print("[INFO] main.py is running. Background threads started.")
     while True:
         time.sleep(1)
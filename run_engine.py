@@ -0,0 +1,292 @@
+### run_engine.py
+
+# Single-threaded run engine.
+# One thread drives every active zone from a heap ("timer wheel") of relay
+# on/off deadlines on clock.monotonic(). Each zone run is a list of planned
+# (on, off) segments, so run durations are exact (no sleep-plus-bookkeeping
+# drift), the thread count stays fixed no matter how many zones, mist triggers
+# or manual runs are active, and the thread only wakes when a relay changes.
+# Remaining times are not counted down; they are derived from the deadlines
+# when somebody asks (see ZoneRun.remaining and status.RunState).
+# simulate.py runs the same engine without its thread, stepping run_due() on a
+# virtual clock.
+#
+# Cancellation is cooperative: cancel() queues a "cancel" action ahead of every
+# deadline and wakes the engine thread, which closes the relay, reads it back,
+# logs the run as Aborted with the time actually watered and frees the zone.
+# cancel() returns once that has happened (normally within a few ms).
+#
+# This module is pure mechanism: relay switching, history logging and
+# CURRENT_RUN publishing are injected by run_manager.py.
+
+import heapq
+import itertools
+import threading
+import time
+
+import clock
+from logger import log
+
+CANCEL_TIMEOUT_SEC = 1.0  # How long cancel() waits for the engine to confirm a relay is off
+
+
+class ZoneRun:
+    """One zone's run: planned relay segments as absolute monotonic deadlines."""
+
+    def __init__(self, set_name, pin, duration_minutes, segments, source="SCHEDULED", **info):
+        self.set_name = set_name
+        self.pin = pin
+        self.duration_minutes = duration_minutes
+        self.segments = segments  # [(on_mono, off_mono), ...]
+        self.source = source
+        self.info = info          # late_sec, log_file, ... passed through to the finish hook
+        self.phase = "Waiting"
+        self.index = 0
+        self.watered_sec = 0.0
+        self.started = clock.now()
+        self.ended = None
+        self.status = None
+        self.relay_confirmed_off = None
+        self.cancel_status = None
+        self.engine = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def add_done_callback(self, fn):
+        """Call fn(run) once the run has finished (immediately if it already has)."""
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set_done(self):
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                log(f"[WARN] Done callback failed for {self.set_name}: {e}")
+
+    def cancel(self, status="Aborted", timeout=CANCEL_TIMEOUT_SEC):
+        """Stop this run (see RunEngine.cancel). Returns True once the relay is confirmed off."""
+        if self.engine is not None:
+            self.engine.cancel([self], status, timeout)
+        return self.done.is_set() and self.relay_confirmed_off is not False
+
+    @property
+    def total_sec(self):
+        return sum(off - on for on, off in self.segments)
+
+    @property
+    def actual_minutes(self):
+        """Minutes the valve was actually open (differs from duration_minutes for aborted runs)."""
+        return round(self.watered_sec / 60, 2)
+
+    def remaining(self, now=None):
+        """Return (time_remaining_sec, pulse_left_sec, soak_left_sec), computed from the deadlines."""
+        now = clock.monotonic() if now is None else now
+        if self.phase == "Watering":
+            on, off = self.segments[self.index]
+            pulse_left = max(0.0, off - now)
+            watered = self.watered_sec + (now - on)
+            return max(0.0, self.total_sec - watered), pulse_left, 0.0
+        if self.phase in ("Waiting", "Soaking") and self.index < len(self.segments):
+            return max(0.0, self.total_sec - self.watered_sec), 0.0, max(0.0, self.segments[self.index][0] - now)
+        return 0.0, 0.0, 0.0
+
+
+class RunEngine:
+    """
+    relay_on(pin, name) / relay_off(pin, name) switch the valves.
+    on_change(runs) is called after every transition with the active ZoneRuns.
+    on_finish(run) is called once per run after its relay is off for good.
+    relay_is_on(pin), if given, is used to confirm the relay really closed.
+    A zone that is already running queues its next run; that run's segments
+    are shifted so it starts when the zone becomes free (same effect as the
+    old per-set lock in run_set).
+    """
+
+    def __init__(self, relay_on, relay_off, on_change=None, on_finish=None, relay_is_on=None):
+        self._relay_on = relay_on
+        self._relay_off = relay_off
+        self._relay_is_on = relay_is_on
+        self._on_change = on_change
+        self._on_finish = on_finish
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = {}   # set_name -> ZoneRun
+        self._waiting = {}  # set_name -> [ZoneRun, ...]
+        self._thread = None
+        self.threaded = True  # simulate.py turns this off and calls run_due() itself
+
+    def start(self):
+        if self._thread is None and self.threaded:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="run-engine")
+            self._thread.start()
+
+    def active_runs(self):
+        with self._cond:
+            return list(self._active.values())
+
+    def submit(self, run):
+        """Register a ZoneRun; returns it (wait on run.done to block until it finishes)."""
+        self.start()
+        run.engine = self
+        with self._cond:
+            if run.set_name in self._active:
+                log(f"[LOCK] {run.set_name} busy; queued next run ({run.source})")
+                self._waiting.setdefault(run.set_name, []).append(run)
+                return run
+            self._activate(run)
+        self._changed()
+        return run
+
+    def cancel(self, runs=None, status="Aborted", timeout=CANCEL_TIMEOUT_SEC):
+        """
+        Cancel the given ZoneRuns (default: every active and queued run).
+        Queued runs that never started are dropped; active ones are stopped by
+        the engine thread. Blocks until each stopped relay is confirmed off (or
+        `timeout` passes) and returns the runs that were cancelled.
+        """
+        stopping = []
+        dropped = []
+        with self._cond:
+            if runs is None:
+                runs = list(self._active.values()) + [r for queue in self._waiting.values() for r in queue]
+            for run in runs:
+                if run.done.is_set():
+                    continue
+                queue = self._waiting.get(run.set_name, [])
+                if run in queue:
+                    queue.remove(run)
+                    dropped.append(run)
+                    continue
+                run.cancel_status = status
+                # -inf deadline: handled before anything else that is due
+                heapq.heappush(self._heap, (float("-inf"), 0, next(self._seq), run, "cancel"))
+                stopping.append(run)
+            self._cond.notify()
+        for run in dropped:
+            run.status = "Cancelled"
+            run._set_done()
+            log(f"[SET] Cancelled queued run of {run.set_name} ({run.source})")
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            deadline = time.monotonic() + timeout
+            for run in stopping:
+                if not run.done.wait(max(0.0, deadline - time.monotonic())):
+                    log(f"[ERROR] Run engine did not confirm stop of {run.set_name} within {timeout}s")
+        return stopping + dropped
+
+    def _activate(self, run, shift=False):
+        # Called with self._cond held
+        if shift and run.segments:
+            delay = clock.monotonic() - run.segments[0][0]
+            if delay > 0:
+                run.segments = [(on + delay, off + delay) for on, off in run.segments]
+        run.started = clock.now()
+        self._active[run.set_name] = run
+        if not run.segments:
+            self._push(clock.monotonic(), run, "finish")
+        else:
+            self._push(run.segments[0][0], run, "on")
+
+    def _push(self, deadline, run, action):
+        # At equal deadlines valves close before others open, so a hand-over
+        # between zones never exceeds the hydraulic budget
+        priority = 1 if action == "on" else 0
+        heapq.heappush(self._heap, (deadline, priority, next(self._seq), run, action))
+        self._cond.notify()
+
+    def run_due(self):
+        """Fire every due action; return seconds until the next deadline (or None)."""
+        while True:
+            with self._cond:
+                if not self._heap:
+                    return None
+                wait = self._heap[0][0] - clock.monotonic()
+                if wait > 0:
+                    return wait
+                deadline, _, _, run, action = heapq.heappop(self._heap)
+            try:
+                self._fire(run, action)
+            except Exception as e:
+                log(f"[ERROR] Run engine failed to {action} {run.set_name}: {e}")
+                if action != "finish":
+                    self._finish(run, "Error")
+            self._changed()
+
+    def _loop(self):
+        while True:
+            wait = self.run_due()
+            with self._cond:
+                # Re-check under the lock: submit()/cancel() may have pushed an earlier deadline
+                if self._heap:
+                    wait = self._heap[0][0] - clock.monotonic()
+                    if wait <= 0:
+                        continue
+                self._cond.wait(wait if self._heap else None)
+
+    def _fire(self, run, action):
+        if run.done.is_set():
+            return
+        if action == "on":
+            self._relay_on(run.pin, run.set_name)
+            run.phase = "Watering"
+            with self._cond:
+                self._push(run.segments[run.index][1], run, "off")
+        elif action == "off":
+            self._relay_off(run.pin, run.set_name)
+            on, off = run.segments[run.index]
+            run.watered_sec += off - on
+            run.index += 1
+            if run.index < len(run.segments):
+                run.phase = "Soaking"
+                with self._cond:
+                    self._push(run.segments[run.index][0], run, "on")
+            else:
+                self._finish(run, "Completed")
+        elif action == "finish":
+            self._finish(run, "Completed")
+        elif action == "cancel":
+            if run.phase == "Watering":
+                run.watered_sec += clock.monotonic() - run.segments[run.index][0]
+            self._finish(run, run.cancel_status)
+
+    def _finish(self, run, status):
+        try:
+            self._relay_off(run.pin, run.set_name)
+            if self._relay_is_on is not None and self._relay_is_on(run.pin):
+                log(f"[WARN] {run.set_name} (pin {run.pin}) still reads ON after turn_off; retrying")
+                self._relay_off(run.pin, run.set_name)
+            run.relay_confirmed_off = self._relay_is_on is None or not self._relay_is_on(run.pin)
+            if not run.relay_confirmed_off:
+                log(f"[ERROR] Could not confirm relay OFF for {run.set_name} (pin {run.pin})")
+        except Exception as e:
+            log(f"[WARN] Could not turn off {run.set_name} at end of run: {e}")
+        run.phase = ""
+        run.status = status
+        run.ended = clock.now()
+        with self._cond:
+            if self._active.get(run.set_name) is run:
+                del self._active[run.set_name]
+            waiting = self._waiting.get(run.set_name)
+            if waiting:
+                self._activate(waiting.pop(0), shift=True)
+        if self._on_finish:
+            try:
+                self._on_finish(run)
+            except Exception as e:
+                log(f"[WARN] Run finish hook failed for {run.set_name}: {e}")
+        run._set_done()
+
+    def _changed(self):
+        if self._on_change:
+            try:
+                self._on_change(self.active_runs())
+            except Exception as e:
+                log(f"[WARN] Run state hook failed: {e}")
@@ -1,27 +1,39 @@
 ### run_manager.py
 
+import os
+import signal
 import time
-from datetime import datetime
-from gpio_controller import turn_on, turn_off
+import clock
+from gpio_controller import turn_on, turn_off, is_relay_on
 from status import CURRENT_RUN
 from logger import log
+from log_rotation import append_line
 from config import RELAYS  # ✅ Correct source for RELAYS
-import json
 from datetime import datetime, timedelta
-import threading
+from cycle_soak import plan_cycles
+from run_engine import RunEngine, ZoneRun
+from shared_state import shared_state
+from state_file import last_completed_run
+from history_index import history_file
 
 WATERING_HISTORY_JSONL = "/home/lds00/sprinkler/watering_history.jsonl"
 
-LAST_COMPLETED_RUN_FILE = "/home/lds00/sprinkler/last_completed_run.json"
-
-
-# Per-set lock to prevent concurrent runs
-_set_locks = {name: threading.Lock() for name in RELAYS}
+# Cross-process stop: flask_api writes the request file and signals main.py
+STOP_REQUEST_FILE = "/home/lds00/sprinkler/stop_all.request"
+CONTROLLER_PID_FILE = "/home/lds00/sprinkler/controller.pid"
+STOP_REQUEST_TIMEOUT_SEC = 2.0
 
 
 def force_stop_all():
+    """
+    Cancel every active and queued run in this process's run engine and make
+    sure all relays are off. Returns once the engine has confirmed the stops
+    (each aborted run is logged to history with the time it actually watered).
+    """
+    stopped = run_engine.cancel()
     for name, pin in RELAYS.items():
-        turn_off(pin, name)
+        turn_off(pin, name)  # Also covers relays the engine never opened
+    CURRENT_RUN.pop("_Run", None)
     CURRENT_RUN.update({
         "Running": False,
         "Set": "",
@@ -29,13 +41,43 @@ def force_stop_all():
         "Soak_Remaining_Sec": 0,
         "Phase": ""
     })
-    log("[SYSTEM] All zones stopped manually.")
+    log(f"[SYSTEM] All zones stopped manually ({len(stopped)} run(s) cancelled).")
+    return stopped
+
+
+def request_stop_all(timeout=STOP_REQUEST_TIMEOUT_SEC):
+    """
+    Stop everything from another process (flask_api's /stop-all). The relays
+    are switched off here immediately, then main.py is asked to cancel its runs
+    (request file + SIGUSR1 to the pid in controller.pid) so it cannot re-open a
+    valve on the next pulse. Returns True once main.py has acknowledged by
+    removing the request file.
+    """
+    for name, pin in RELAYS.items():
+        turn_off(pin, name)
+    try:
+        with open(STOP_REQUEST_FILE, "w") as f:
+            f.write(datetime.now().isoformat())
+    except Exception as e:
+        log(f"[ERROR] Could not write stop request: {e}")
+        return False
+    try:
+        with open(CONTROLLER_PID_FILE) as f:
+            os.kill(int(f.read().strip()), signal.SIGUSR1)
+    except Exception as e:
+        log(f"[WARN] Could not signal controller, it will pick up the stop request on its next check: {e}")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not os.path.exists(STOP_REQUEST_FILE):
+            return True
+        time.sleep(0.02)
+    log(f"[ERROR] Controller did not acknowledge stop request within {timeout}s")
+    return False
 
 
-def log_watering_history(log_file, set_name, start_dt, end_dt, source="SCHEDULED", status="Completed", duration_minutes=None):
+def log_watering_history(log_file, set_name, start_dt, end_dt, source="SCHEDULED", status="Completed", duration_minutes=None, late_sec=None):
     entry = f"{start_dt.date()} {set_name} {source.upper()} START: {start_dt.strftime('%H:%M:%S')} STOP: {end_dt.strftime('%H:%M:%S')}\n"
-    with open(log_file, "a") as f:
-        f.write(entry)
+    append_line(log_file, entry)
     # Record last completed run for status API
     try:
         last_run = {
@@ -44,8 +86,7 @@ def log_watering_history(log_file, set_name, start_dt, end_dt, source="SCHEDULED
             "duration_minutes": duration_minutes if duration_minutes is not None else int((end_dt - start_dt).total_seconds() // 60),
             "status": status
         }
-        with open(LAST_COMPLETED_RUN_FILE, "w") as f:
-            json.dump(last_run, f)
+        last_completed_run.set(last_run)
     except Exception as e:
         log(f"[WARN] Could not write last_completed_run.json: {e}")
     # --- Persistent JSONL watering history ---
@@ -56,105 +97,94 @@ def log_watering_history(log_file, set_name, start_dt, end_dt, source="SCHEDULED
             "duration_minutes": duration_minutes if duration_minutes is not None else int((end_dt - start_dt).total_seconds() // 60),
             "status": status
         }
-        with open(WATERING_HISTORY_JSONL, "a") as f:
-            f.write(json.dumps(event) + "\n")
+        if late_sec:
+            event["late_sec"] = late_sec  # Scheduled start launched late (missed-start catch-up)
+        history_file(WATERING_HISTORY_JSONL).append(event)
     except Exception as e:
         log(f"[WARN] Could not write watering_history.jsonl: {e}")
 
 
-def run_set(set_name, duration_minutes, RELAYS, log_file, source="SCHEDULED", pulse=None, soak=None):
-    pin = RELAYS.get(set_name)
-    if pin is None:
-        log(f"[ERROR] Unknown set name: {set_name}")
-        return
-
-    lock = _set_locks.get(set_name)
-    if lock is None:
-        log(f"[ERROR] No lock found for set {set_name}")
-        return
-
-    log(f"[LOCK] Attempting to acquire lock for set '{set_name}'")
-    with lock:
-        log(f"[LOCK] Acquired lock for set '{set_name}'")
-        # Log mist run with temperature if applicable
-        if set_name == "Misters" and source and source.startswith("MIST_"):
-            try:
-                temp = source.split("_")[1]
-                log_msg = f"Misters (Temp {temp}°F) Start: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                log(log_msg)
-                # Also log to watering_history.jsonl
-                event = {
-                    "date": datetime.now().isoformat(),
-                    "set": set_name,
-                    "duration_minutes": duration_minutes,
-                    "status": "Started",
-                    "source": source,
-                    "note": log_msg
-                }
-                with open(WATERING_HISTORY_JSONL, "a") as f:
-                    f.write(json.dumps(event) + "\n")
-            except Exception as e:
-                log(f"[WARN] Could not log mist run with temp: {e}")
-        log(f"[SET] Running {set_name} for {duration_minutes} min ({source})")
-        start_time = datetime.now()
-        total = duration_minutes * 60
-        elapsed = 0
-        CURRENT_RUN.update({
-            "Running": True,
-            "Set": set_name,
-            "Phase": "Watering",
-            "Time_Remaining_Sec": total,
-            "Soak_Remaining_Sec": 0,
-            "Pulse_Time_Left_Sec": 0
-        })
-
-        if pulse and soak:
-            while elapsed < total:
-                CURRENT_RUN["Phase"] = "Watering"
-                log(f"[DEBUG] Calling turn_on(pin={pin}) in run_set pulse/soak loop for set '{set_name}' (source={source})")
-                turn_on(pin)
-                pulse_left = pulse * 60
-                for i in range(pulse * 60):
-                    if elapsed >= total:
-                        break
-                    time.sleep(1)
-                    elapsed += 1
-                    CURRENT_RUN["Time_Remaining_Sec"] = total - elapsed
-                    CURRENT_RUN["Pulse_Time_Left_Sec"] = pulse_left
-                    pulse_left -= 1
-                turn_off(pin)
-                log(f"[DEBUG] Turned OFF relay for {set_name} (pin {pin}) after pulse at {datetime.now().isoformat()}")
-                CURRENT_RUN["Pulse_Time_Left_Sec"] = 0
-                if elapsed < total:
-                    CURRENT_RUN["Phase"] = "Soaking"
-                    CURRENT_RUN["Soak_Remaining_Sec"] = soak * 60
-                    for i in range(soak * 60):
-                        time.sleep(1)
-                        CURRENT_RUN["Soak_Remaining_Sec"] = soak * 60 - (i + 1)
-        else:
-            log(f"[DEBUG] Calling turn_on(pin={pin}) in run_set (no pulse/soak) for set '{set_name}' (source={source})")
-            turn_on(pin)
-            log(f"[DEBUG] Relay for {set_name} (pin {pin}) should now be ON for {total} seconds")
-            for i in range(total):
-                time.sleep(1)
-                CURRENT_RUN.update({
-                    "Running": True,
-                    "Set": set_name,
-                    "Time_Remaining_Sec": total - i,
-                    "Phase": "Watering",
-                    "Soak_Remaining_Sec": 0,
-                    "Pulse_Time_Left_Sec": 0
-                })
-        turn_off(pin)
-        end_time = datetime.now()
+def _publish_run_state(runs):
+    """Mirror the engine's active runs into CURRENT_RUN: a watering zone wins over soaking/waiting ones."""
+    shared_state.publish_runs(runs)  # For the API process (no-op unless this is the controller)
+    primary = next((r for r in runs if r.phase == "Watering"), None) or (runs[0] if runs else None)
+    if primary is None:
+        CURRENT_RUN.pop("_Run", None)
         CURRENT_RUN.update({
             "Running": False,
             "Set": "",
             "Time_Remaining_Sec": 0,
             "Soak_Remaining_Sec": 0,
             "Phase": "",
-            "Pulse_Time_Left_Sec": 0
+            "Pulse_Time_Left_Sec": 0,
+            "Start_Time": None,
+            "Duration_Minutes": None
         })
-        log_watering_history(log_file, set_name, start_time, end_time, source, status="Completed", duration_minutes=duration_minutes)
-        log(f"[SET] Completed {set_name}")
-    log(f"[LOCK] Released lock for set '{set_name}'")
+        return
+    CURRENT_RUN.update({
+        "Running": True,
+        "Set": primary.set_name,
+        "Phase": primary.phase,
+        "Start_Time": primary.started.isoformat(),
+        "Duration_Minutes": primary.duration_minutes,
+        "_Run": primary  # Countdowns are computed from its deadlines on read
+    })
+
+
+def _log_finished_run(run):
+    # Aborted runs record the time the valve was actually open
+    duration_minutes = run.duration_minutes if run.status == "Completed" else run.actual_minutes
+    log_watering_history(
+        run.info.get("log_file"), run.set_name, run.started, run.ended, run.source,
+        status=run.status, duration_minutes=duration_minutes, late_sec=run.info.get("late_sec")
+    )
+    log(f"[SET] {run.status} {run.set_name}")
+
+
+run_engine = RunEngine(turn_on, turn_off, on_change=_publish_run_state, on_finish=_log_finished_run, relay_is_on=is_relay_on)
+
+
+def start_run(set_name, duration_minutes, RELAYS, log_file, source="SCHEDULED", pulse=None, soak=None, late_sec=None, cycle_plan=None, plan_start=None):
+    """
+    Hand a run to the run engine and return its ZoneRun without blocking.
+    cycle_plan is [(on_sec, off_sec), ...] relative to plan_start (clock.monotonic());
+    without one, pulse/soak are expanded into the same kind of plan.
+    """
+    pin = RELAYS.get(set_name)
+    if pin is None:
+        log(f"[ERROR] Unknown set name: {set_name}")
+        return None
+    # Log mist run with temperature if applicable
+    if set_name == "Misters" and source and source.startswith("MIST_"):
+        try:
+            temp = source.split("_")[1]
+            log_msg = f"Misters (Temp {temp}°F) Start: {clock.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            log(log_msg)
+            # Also log to watering_history.jsonl
+            event = {
+                "date": clock.now().isoformat(),
+                "set": set_name,
+                "duration_minutes": duration_minutes,
+                "status": "Started",
+                "source": source,
+                "note": log_msg
+            }
+            history_file(WATERING_HISTORY_JSONL).append(event)
+        except Exception as e:
+            log(f"[WARN] Could not log mist run with temp: {e}")
+    if plan_start is None:
+        plan_start = clock.monotonic()
+    if cycle_plan is None:
+        cycle_plan = plan_cycles([(set_name, duration_minutes, pulse, soak)])[set_name]
+    segments = [(plan_start + on_sec, plan_start + off_sec) for on_sec, off_sec in cycle_plan]
+    log(f"[SET] Running {set_name} for {duration_minutes} min ({source}) in {len(segments)} pulse(s)")
+    run = ZoneRun(set_name, pin, duration_minutes, segments, source, log_file=log_file, late_sec=late_sec)
+    return run_engine.submit(run)
+
+
+def run_set(set_name, duration_minutes, RELAYS, log_file, source="SCHEDULED", pulse=None, soak=None, late_sec=None, cycle_plan=None, plan_start=None):
+    """Blocking wrapper around start_run: returns once the run has finished."""
+    run = start_run(set_name, duration_minutes, RELAYS, log_file, source, pulse, soak, late_sec, cycle_plan, plan_start)
+    if run is not None:
+        run.done.wait()
+    return run
@@ -0,0 +1,130 @@
+### schedule_actions.py
+
+# What the controller does when the schedule engine fires a "start" or "mist"
+# event: the missed-start grace check, the once-per-day de-duplication of each
+# start time (last_scheduled_run), queuing the scheduled batch, and the mist
+# decision (skipped while a manual run is active) with its mist-status update.
+#
+# main.py and simulate.py both drive a ScheduleActions, so a simulation makes
+# exactly the decisions that deploy. Only the outside world is passed in: where
+# the temperature comes from, where last_scheduled_run is persisted, how mist
+# status is published and whether a manual run is active.
+
+import os
+from datetime import datetime, timedelta
+
+import clock
+from logger import log
+from scheduler import scheduled_zones, due_mist_settings, MIST_RECHECK_SECONDS
+
+# A start time that was due while the loop was blocked (or the service was
+# restarting) is still launched if we notice it within this many minutes.
+MISSED_START_GRACE_MINUTES = int(os.getenv("MISSED_START_GRACE_MINUTES", "15"))
+
+
+class ScheduleActions:
+    """
+    Start and mist handling on top of a zone_sequencer.ZoneSequencer.
+    get_temperature() returns °F or None; last_runs maps start time -> date of
+    its last launch and save_last_runs() persists it after each change; publish_mist(**fields)
+    receives the mist status; mist_status.get() supplies the last published
+    status (state_file.mist_status); manual_active() is True during a manual run.
+    """
+
+    def __init__(self, sequencer, get_temperature, last_runs=None, save_last_runs=None, publish_mist=None,
+                 mist_status=None, manual_active=None, grace_minutes=MISSED_START_GRACE_MINUTES):
+        self.sequencer = sequencer
+        self.get_temperature = get_temperature
+        self.last_runs = {} if last_runs is None else last_runs
+        self.save_last_runs = save_last_runs
+        self.publish_mist = publish_mist
+        self.mist_status = mist_status
+        self.manual_active = manual_active or (lambda: False)
+        self.grace_minutes = grace_minutes
+        self.last_mist_times = {}  # Per mist setting, see scheduler.due_mist_settings
+
+    def start(self, schedule, payload, late_sec=0):
+        """Handle a compiled "start" event. Returns True if the scheduled sets were queued."""
+        sched_time = payload["time"]
+        day_str = payload["date"]
+        # Only run if we haven't already run this start_time today
+        if self.last_runs.get(sched_time) == day_str:
+            return False
+        # Lateness is measured against the wall-clock start, which also covers
+        # starts compiled after a restart or schedule upload inside the grace window.
+        late_sec = max(late_sec, (clock.now() - payload["start_dt"]).total_seconds())
+        if late_sec > self.grace_minutes * 60:
+            log(f"[SCHEDULED] MISSED start {sched_time} on {day_str}: {late_sec:.0f}s late exceeds {self.grace_minutes} min grace")
+            return False
+        # Persist before launching so a crash mid-launch cannot double-fire after restart
+        self.last_runs[sched_time] = day_str
+        if self.save_last_runs is not None:
+            self.save_last_runs()
+        self.launch_scheduled_sets(schedule, sched_time, late_sec)
+        return True
+
+    def launch_scheduled_sets(self, schedule, sched_time, late_sec=0):
+        """Queue every enabled set as one batch; the sequencer interleaves their pulse/soak cycles."""
+        zones = scheduled_zones(schedule)
+        for zone in zones:
+            if late_sec >= 1:
+                log(f"[SCHEDULED] Launching set {zone['set']} for {sched_time} LATE by {late_sec:.0f}s")
+            else:
+                log(f"[SCHEDULED] Launching set {zone['set']} at {sched_time}")
+        if zones:
+            self.sequencer.submit(zones, source="SCHEDULED", late_sec=round(late_sec) if late_sec >= 1 else None)
+
+    def mist(self, schedule):
+        """
+        Trigger misting for every temperature setting whose interval has elapsed.
+        Returns the number of seconds until mist should be evaluated again.
+        """
+        # Prevent misting if a manual run is active
+        if self.manual_active():
+            log("[MIST] Skipping misting because manual run is active.")
+            return MIST_RECHECK_SECONDS
+        mist_settings = schedule.get("mist", {}).get("temperature_settings", [])
+        if not mist_settings:
+            return MIST_RECHECK_SECONDS
+        current_temp = self.get_temperature()
+        if current_temp is None:
+            log("[MIST] Skipping misting because temperature is unavailable.")
+            return MIST_RECHECK_SECONDS
+        # Find the highest temp threshold that applies
+        active_setting = None
+        for setting in sorted(mist_settings, key=lambda s: s.get("temperature", 0), reverse=True):
+            if current_temp >= setting.get("temperature", 0):
+                active_setting = setting
+                break
+        interval = active_setting.get("interval") if active_setting else None
+        # Last and next mist event times (in-memory copy; loaded from mist_status.json once after a restart)
+        last_status = self.mist_status.get() if self.mist_status is not None else {}
+        last_mist_event = last_status.get("last_mist_event")
+        next_mist_event = last_status.get("next_mist_event")
+        if last_mist_event and interval:
+            try:
+                last_dt = datetime.fromisoformat(last_mist_event)
+                next_mist_event = (last_dt + timedelta(minutes=interval)).isoformat()
+            except Exception:
+                next_mist_event = None
+        mist_triggered = False
+        due, recheck_sec = due_mist_settings(mist_settings, current_temp, self.last_mist_times, clock.time())
+        for setting in due:
+            temp_threshold = setting["temperature"]
+            log(f"[WEATHER] Current temperature: {current_temp}°F")
+            log(f"[MIST] Triggering mist for temp >= {temp_threshold}°F: {setting['duration']} min")
+            self.sequencer.submit([{"set": "Misters", "duration_minutes": setting["duration"]}], source=f"MIST_{temp_threshold}")
+            mist_triggered = True
+            last_mist_event = clock.now().isoformat()
+            next_mist_event = (clock.now() + timedelta(minutes=setting["interval"])).isoformat()
+        if self.publish_mist is not None:
+            # The status reports the last configured setting's interval/duration
+            self.publish_mist(
+                is_misting=mist_triggered,
+                last_mist_event=last_mist_event,
+                next_mist_event=next_mist_event,
+                current_temperature=current_temp,
+                interval_minutes=mist_settings[-1].get("interval"),
+                duration_minutes=mist_settings[-1].get("duration")
+            )
+        return recheck_sec
@@ -0,0 +1,169 @@
+### schedule_cache.py
+
+# Shared, cached view of sprinkler_schedule.json for main.py and flask_api.py.
+# The file is parsed and validated once per change; callers get an immutable
+# FrozenSchedule that still supports the usual schedule.get(...) access.
+# Change detection uses inotify when the optional inotify_simple package is
+# installed, and an os.stat() mtime/size/inode comparison otherwise. Both
+# processes derive the same version string from the file's stat, so they agree
+# on which schedule version they are serving.
+
+import json
+import os
+import threading
+from collections.abc import Mapping
+from datetime import datetime
+from types import MappingProxyType
+
+from logger import log
+
+SCHEDULE_FILE = "/home/lds00/sprinkler/sprinkler_schedule.json"
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Return a plain (mutable, JSON-serialisable) copy of a frozen schedule value."""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def validate_schedule(data):
+    """Raise ValueError if the schedule is structurally unusable."""
+    if not isinstance(data, dict):
+        raise ValueError("schedule must be a JSON object")
+    start_times = data.get("start_times", [])
+    if not isinstance(start_times, list):
+        raise ValueError("start_times must be a list")
+    for entry in start_times:
+        if not isinstance(entry, dict) or "time" not in entry:
+            raise ValueError(f"invalid start_times entry: {entry!r}")
+        try:
+            datetime.strptime(entry["time"], "%H:%M")
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid start time: {entry['time']!r}")
+    sets = data.get("sets", [])
+    if not isinstance(sets, list) or not all(isinstance(s, dict) and s.get("set_name") for s in sets):
+        raise ValueError("sets must be a list of objects with a set_name")
+    days = data.get("schedule_days", [False] * 14)
+    if not isinstance(days, list) or len(days) != 14:
+        raise ValueError("schedule_days must be a list of 14 booleans")
+    mist = data.get("mist", {})
+    if not isinstance(mist, dict) or not isinstance(mist.get("temperature_settings", []), list):
+        raise ValueError("mist.temperature_settings must be a list")
+
+
+class FrozenSchedule(Mapping):
+    """Immutable, validated schedule snapshot tagged with a version string."""
+
+    def __init__(self, data, version):
+        self._data = _freeze(data)
+        self.version = version
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"FrozenSchedule(version={self.version!r})"
+
+
+class ScheduleCache:
+    """
+    Parses the schedule file once per change. get() returns the current
+    FrozenSchedule; if the file on disk is missing or invalid, the last good
+    snapshot keeps being served (and the problem is logged once per file version).
+    """
+
+    def __init__(self, path=SCHEDULE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stat_key = None
+        self._failed_key = None
+        self._inotify = None
+        if INotify is not None:
+            try:
+                self._inotify = INotify()
+                # Watch the directory: uploads over SFTP replace the file (new inode)
+                self._inotify.add_watch(
+                    os.path.dirname(path) or ".",
+                    inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE | inotify_flags.DELETE,
+                )
+            except Exception as e:
+                log(f"[WARN] inotify unavailable for {path}, falling back to mtime checks: {e}")
+                self._inotify = None
+
+    def _stat_key_now(self):
+        st = os.stat(self.path)
+        return f"{st.st_mtime_ns:x}-{st.st_size:x}-{st.st_ino:x}"
+
+    def _changed_on_disk(self):
+        if self._inotify is None or self._snapshot is None:
+            return True
+        name = os.path.basename(self.path)
+        return any(event.name == name for event in self._inotify.read(timeout=0))
+
+    def get(self):
+        """Return the current FrozenSchedule, reloading only if the file changed."""
+        with self._lock:
+            if self._changed_on_disk():
+                self._refresh()
+            if self._snapshot is None:
+                raise FileNotFoundError(f"No valid schedule loaded from {self.path}")
+            return self._snapshot
+
+    def _refresh(self):
+        try:
+            key = self._stat_key_now()
+        except OSError as e:
+            if self._failed_key != "missing":
+                log(f"[ERROR] Failed to stat schedule {self.path}: {e}")
+                self._failed_key = "missing"
+            return
+        if key == self._stat_key or key == self._failed_key:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            validate_schedule(data)
+        except Exception as e:
+            log(f"[ERROR] Failed to load schedule (keeping previous version): {e}")
+            self._failed_key = key
+            return
+        self._snapshot = FrozenSchedule(data, key)
+        self._stat_key = key
+        self._failed_key = None
+        log(f"[SCHEDULE] Loaded schedule version {key}")
+
+    @property
+    def version(self):
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else None
+
+
+schedule_cache = ScheduleCache()
+
+
+def get_schedule():
+    """Shortcut for schedule_cache.get()."""
+    return schedule_cache.get()
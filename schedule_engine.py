@@ -0,0 +1,151 @@
+### schedule_engine.py
+
+# Event-driven replacement for the old 1-second polling main_loop.
+# The schedule is compiled into a small timeline of future events which is kept
+# in a heap keyed on clock.monotonic() deadlines. run_forever() sleeps until the
+# earliest deadline, so the relays close on the scheduled second instead of
+# "somewhere inside the scheduled minute", and the Pi does no work between events.
+
+import heapq
+import itertools
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import clock
+from scheduler import is_watering_day
+from logger import log
+
+SOON_WINDOW_MINUTES = 10  # Same look-ahead as main.get_next_scheduled_set (600 s)
+COMPILE_DAYS = 2          # Today + tomorrow; the engine recompiles at midnight
+
+ScheduledEvent = namedtuple("ScheduledEvent", ["deadline", "kind", "payload", "wall_time"])
+
+
+def compile_start_events(schedule, now=None, days=COMPILE_DAYS, grace_minutes=0):
+    """
+    Compile the enabled start times of the next `days` watering days into
+    (datetime, kind, payload) tuples.
+
+    Every start time yields a "soon" event SOON_WINDOW_MINUTES before it (used
+    for the orange LED) and a "start" event on the scheduled minute. Start times
+    that were due at most `grace_minutes` ago are kept (their start event is
+    due immediately) so the caller can launch them late; older ones are skipped.
+    """
+    now = now or clock.now()
+    # Same cutoff as main.on_start's lateness check (not rounded to the minute)
+    earliest = now - timedelta(minutes=grace_minutes)
+    events = []
+    for offset in range(-1 if grace_minutes else 0, days):
+        day = (now + timedelta(days=offset)).date()
+        if not is_watering_day(schedule, day):
+            continue
+        for entry in schedule.get("start_times", []):
+            if not entry.get("isEnabled", False):
+                continue
+            try:
+                start_dt = datetime.combine(day, datetime.strptime(entry["time"], "%H:%M").time())
+            except (KeyError, ValueError) as e:
+                log(f"[WARN] Skipping invalid start time {entry!r}: {e}")
+                continue
+            if start_dt < earliest:
+                continue
+            payload = {"time": entry["time"], "date": day.isoformat(), "start_dt": start_dt}
+            if start_dt > now:
+                soon_dt = start_dt - timedelta(minutes=SOON_WINDOW_MINUTES)
+                events.append((max(soon_dt, now), "soon", payload))
+            events.append((start_dt, "start", payload))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def next_midnight(now=None):
+    now = now or clock.now()
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+
+
+class ScheduleEngine:
+    """
+    Heap of ScheduledEvents keyed on monotonic deadlines.
+
+    Handlers are registered per event kind with on(kind, handler) and are called
+    as handler(event, late_sec) from the run_forever() thread. Wall-clock times
+    are converted to monotonic deadlines when scheduled, so the engine keeps an
+    offset between the two clocks; clock_jumped() reports when NTP (or a user)
+    has moved the wall clock and the timeline should be recompiled.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._wall_offset = clock.time() - clock.monotonic()
+
+    def on(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def schedule_in(self, delay_sec, kind, payload=None):
+        deadline = clock.monotonic() + max(0.0, delay_sec)
+        return self._push(deadline, kind, payload, clock.now() + timedelta(seconds=max(0.0, delay_sec)))
+
+    def schedule_at(self, wall_time, kind, payload=None):
+        delay_sec = (wall_time - clock.now()).total_seconds()
+        deadline = clock.monotonic() + delay_sec
+        return self._push(deadline, kind, payload, wall_time)
+
+    def _push(self, deadline, kind, payload, wall_time):
+        event = ScheduledEvent(deadline, kind, payload, wall_time)
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, next(self._seq), event))
+        self._wakeup.set()
+        return event
+
+    def cancel(self, *kinds):
+        """Drop every pending event of the given kinds."""
+        with self._lock:
+            self._heap = [item for item in self._heap if item[2].kind not in kinds]
+            heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def pending(self, kind=None):
+        with self._lock:
+            return [item[2] for item in sorted(self._heap, key=lambda i: i[:2]) if kind is None or item[2].kind == kind]
+
+    def clock_jumped(self, tolerance_sec=5.0):
+        """True (once) if the wall clock moved relative to the monotonic clock."""
+        offset = clock.time() - clock.monotonic()
+        if abs(offset - self._wall_offset) > tolerance_sec:
+            self._wall_offset = offset
+            return True
+        return False
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run_pending(self):
+        """Dispatch every due event; return seconds until the next deadline (or None)."""
+        while True:
+            with self._lock:
+                if not self._heap:
+                    return None
+                deadline, _, event = self._heap[0]
+                now = clock.monotonic()
+                if deadline > now:
+                    return deadline - now
+                heapq.heappop(self._heap)
+            handler = self._handlers.get(event.kind)
+            if handler is None:
+                log(f"[WARN] No handler for scheduled event '{event.kind}'")
+                continue
+            try:
+                handler(event, now - deadline)
+            except Exception as e:
+                log(f"[ERROR] Scheduled event '{event.kind}' failed: {e}")
+
+    def run_forever(self):
+        while True:
+            self._wakeup.clear()
+            timeout = self.run_pending()
+            self._wakeup.wait(timeout)
@@ -3,20 +3,27 @@ import json
 from datetime import datetime
 import time
 import os
+import clock
+
+# Longest the event loop waits before re-evaluating mist (temperature may have changed)
+MIST_RECHECK_SECONDS = 60
 
 def load_json(path):
     with open(path, 'r') as f:
         return json.load(f)
 
-def get_schedule_day_index():
+def get_schedule_day_index(day=None):
     base = datetime(2023, 12, 31)  # Sunday
-    today = datetime.now().date()
+    today = day or clock.now().date()
     idx = (today - base.date()).days % 14
     return idx
 
+def is_watering_day(schedule, day):
+    """True if `day` (a date) is a watering day in the 14-day schedule_days cycle."""
+    return schedule.get("schedule_days", [False] * 14)[get_schedule_day_index(day)]
+
 def should_run_today(schedule):
-    idx = get_schedule_day_index()
-    return schedule.get("schedule_days", [False] * 14)[idx]
+    return is_watering_day(schedule, clock.now().date())
 
 def is_start_time_enabled(schedule, time_str):
     return any(entry.get("time") == time_str and entry.get("isEnabled", False)
@@ -31,3 +38,45 @@ def is_active(set_entry):
     if set_entry.get("set_name") == "Misters":
         return True
     return set_entry.get("mode", True)
+
+def scheduled_zones(schedule):
+    """Zones queued at a scheduled start time: every enabled set except Misters."""
+    zones = []
+    for s in schedule.get("sets", []):
+        if s["set_name"] == "Misters":
+            continue  # skip Misters for scheduled runs
+        if not s.get("mode", True):
+            continue  # skip inactive sets
+        zones.append({
+            "set": s["set_name"],
+            "duration_minutes": s.get("run_duration_minutes", 1),
+            "pulse": s.get("pulse_duration_minutes"),
+            "soak": s.get("soak_duration_minutes")
+        })
+    return zones
+
+def due_mist_settings(mist_settings, current_temp, last_mist_times, now):
+    """
+    Return (due_settings, recheck_sec): the mist temperature settings whose
+    threshold is met and whose interval has elapsed since their last mist
+    (last_mist_times is updated in place, keyed per setting), and how many
+    seconds until the next one falls due (at most MIST_RECHECK_SECONDS).
+    `now` is an epoch timestamp.
+    """
+    due = []
+    recheck_sec = MIST_RECHECK_SECONDS
+    for setting in mist_settings:
+        temp_threshold = setting.get("temperature")
+        interval = setting.get("interval")  # in minutes
+        duration = setting.get("duration")  # in minutes
+        if temp_threshold is None or interval is None or duration is None:
+            continue
+        if current_temp >= temp_threshold:
+            key = f"{temp_threshold}_{interval}_{duration}"
+            last_time = last_mist_times.get(key, 0)
+            if now - last_time >= interval * 60:
+                due.append(setting)
+                last_mist_times[key] = now
+                last_time = now
+            recheck_sec = min(recheck_sec, max(1, last_time + interval * 60 - now))
+    return due, recheck_sec
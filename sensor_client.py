@@ -0,0 +1,151 @@
+### sensor_client.py
+
+# HTTP client for main.py's sensor logging cycle: reads the remote sensor Pi's
+# /sets-, /plant- and /environment-latest endpoints and writes the readings to
+# the local API.
+#
+# One requests.Session is shared for the life of the process, so connections to
+# the sensor Pi and to flask_api stay open between cycles (keep-alive) instead
+# of paying a TCP handshake per request. fetch_all() issues the three sensor
+# requests concurrently from a small thread pool, so a cycle costs one
+# round trip (or one timeout) rather than three in a row, and post_readings()
+# sends all streams to /sensor-data in a single request.
+#
+# Each endpoint has a circuit breaker: after BREAKER_FAILURES consecutive
+# failures (the Pi Zero is offline or rebooting) the endpoint is skipped
+# without a request for BREAKER_BACKOFF_SEC, doubling per failed retry up to
+# BREAKER_BACKOFF_MAX_SEC. When the pause ends, the next cycle tries the
+# endpoint once; success closes the breaker. Opening and closing are logged
+# once each instead of one error per cycle.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import clock
+from error_reporter import report_error
+from logger import log
+
+SENSOR_PI_URL = "http://100.117.254.20:8000"
+LOCAL_API_URL = "http://127.0.0.1:5000"
+SENSOR_CONNECT_TIMEOUT_SEC = 2
+SENSOR_READ_TIMEOUT_SEC = 2
+LOCAL_TIMEOUT_SEC = 2
+SENSOR_POOL_SIZE = 4   # Connections kept open per host; at least one per concurrent fetch
+
+BREAKER_FAILURES = 3
+BREAKER_BACKOFF_SEC = 30
+BREAKER_BACKOFF_MAX_SEC = 600
+
+# Stream -> (sensor Pi path, fields kept from its response)
+REMOTE_ENDPOINTS = {
+    "sets": ("/sets-latest", ("flow_litres", "flow_pulses", "pressure_kpa")),
+    "plant": ("/plant-latest", ("moisture", "lux", "soil_temperature")),
+    "environment": ("/environment-latest", ("temperature", "humidity", "wind_speed", "barometric_pressure"))
+}
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with exponential backoff, on the injectable clock."""
+
+    def __init__(self, name, failures=BREAKER_FAILURES, backoff_sec=BREAKER_BACKOFF_SEC,
+                 max_backoff_sec=BREAKER_BACKOFF_MAX_SEC):
+        self.name = name
+        self.failures = failures
+        self.backoff_sec = backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self._lock = threading.Lock()
+        self._failed = 0
+        self._backoff = backoff_sec
+        self._open_until = None   # Monotonic deadline while open
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._open_until is not None
+
+    def allow(self):
+        """False while the breaker is open and its pause has not run out."""
+        with self._lock:
+            return self._open_until is None or clock.monotonic() >= self._open_until
+
+    def success(self):
+        """Record a success; returns the number of failures it ends (0 if none were pending)."""
+        with self._lock:
+            failed = self._failed
+            self._failed = 0
+            self._backoff = self.backoff_sec
+            self._open_until = None
+            return failed
+
+    def failure(self):
+        """Record a failure; returns the pause in seconds if the breaker (re)opened, else None."""
+        with self._lock:
+            self._failed += 1
+            if self._failed < self.failures:
+                return None
+            if self._open_until is not None:
+                self._backoff = min(self._backoff * 2, self.max_backoff_sec)  # A retry failed
+            self._open_until = clock.monotonic() + self._backoff
+            return self._backoff
+
+
+class SensorClient:
+    """Pooled keep-alive session to the sensor Pi and the local API."""
+
+    def __init__(self, sensor_url=SENSOR_PI_URL, local_url=LOCAL_API_URL, endpoints=REMOTE_ENDPOINTS):
+        self.sensor_url = sensor_url
+        self.local_url = local_url
+        self.endpoints = endpoints
+        self.breakers = {name: CircuitBreaker(name) for name in endpoints}
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=SENSOR_POOL_SIZE, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="sensor")
+
+    def fetch(self, name):
+        """Latest reading of one remote stream as {field: value}; {} if unavailable or paused."""
+        breaker = self.breakers[name]
+        if not breaker.allow():
+            return {}
+        path, fields = self.endpoints[name]
+        try:
+            resp = self._session.get(self.sensor_url + path, timeout=(SENSOR_CONNECT_TIMEOUT_SEC, SENSOR_READ_TIMEOUT_SEC))
+            resp.raise_for_status()
+            data = resp.json()
+        except Exception as e:
+            pause = breaker.failure()
+            if pause is not None:
+                report_error(f"[REMOTE {name.upper()} ERROR] {e}; pausing requests for {pause}s", error_log=False)
+            else:
+                report_error(f"[REMOTE {name.upper()} ERROR] {e}", error_log=False)
+            return {}
+        failed = breaker.success()
+        if failed:
+            log(f"[SENSOR] {self.sensor_url}{path} reachable again after {failed} failed request(s)")
+        return {field: data.get(field) for field in fields} if isinstance(data, dict) else {}
+
+    def fetch_all(self, names=None):
+        """fetch() several streams concurrently; returns {name: reading}."""
+        names = list(names or self.endpoints)
+        futures = {name: self._pool.submit(self.fetch, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def post(self, path, payload):
+        """POST JSON to the local API. Returns the decoded response, or None on failure (reported)."""
+        try:
+            resp = self._session.post(self.local_url + path, json=payload, timeout=LOCAL_TIMEOUT_SEC)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception as e:
+            report_error(f"[LOCAL POST {path} ERROR] {e}", error_log=False)
+            return None
+
+    def post_readings(self, readings):
+        """Write {stream: reading or [readings]} to the local API in one request (/sensor-data)."""
+        return self.post("/sensor-data", readings)
+
+
+sensor_client = SensorClient()
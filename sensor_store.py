@@ -0,0 +1,491 @@
+### sensor_store.py
+
+# Time-series store for the sensor readings posted to flask_api (/env-data,
+# /soil-data). Readings used to be appended to env_readings.log /
+# soil_readings.log as "timestamp | {json}" lines and every history query
+# re-parsed the text; they now go into an SQLite database in WAL mode with one
+# row per reading, indexed by (stream, time) and (stream, set, time), so
+# "last N", time-range and per-set queries are index range scans.
+#
+# WAL lets main.py or a shell read while the API writes, and synchronous=NORMAL
+# only syncs at checkpoints: a power cut can lose the last few readings but
+# never corrupts the database. Each thread gets its own connection.
+#
+# The ingest endpoints submit() readings instead of inserting them: a
+# background writer commits everything queued within INGEST_COMMIT_INTERVAL_SEC
+# as one transaction (group commit), so a sensor Pi posting several streams
+# every few minutes costs a few commits per minute. Queries flush() first, so a
+# reading is visible as soon as its POST has returned.
+#
+# The old text logs are imported once (import_log(); flask_api does it at
+# startup) and left in place. Rows keep the reading exactly as posted, so the
+# API's response shapes do not change.
+#
+# Every numeric field of a reading is also folded, in the same transaction,
+# into count/sum/min/max rollups per set at minute, hour and day resolution
+# (buckets aligned to local time). rollup() answers chart queries from the
+# finest resolution that keeps the requested range within ROLLUP_TARGET_POINTS
+# buckets, so a month of pressure is 720 hourly points rather than ~9000 raw
+# readings.
+
+import atexit
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import clock
+from logger import log
+from log_rotation import iter_lines
+
+SENSOR_DB_PATH = "/home/lds00/sprinkler/sensor_readings.db"
+IMPORT_BATCH_ROWS = 5000
+EXPORT_PAGE_ROWS = 2000
+ROLLUP_RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+ROLLUP_TARGET_POINTS = 1000
+INGEST_COMMIT_INTERVAL_SEC = 2.0
+INGEST_COMMIT_ROWS = 500
+INGEST_QUEUE_MAX = 10000   # Uncommitted readings before submit() refuses more (BacklogFull)
+INGEST_FLUSH_TIMEOUT_SEC = 10.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY,
+    stream TEXT NOT NULL,
+    ts REAL NOT NULL,
+    set_name TEXT,
+    timestamp TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS readings_stream_ts ON readings (stream, ts);
+CREATE INDEX IF NOT EXISTS readings_stream_set_ts ON readings (stream, set_name, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    stream TEXT NOT NULL,
+    set_name TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    bucket REAL NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (stream, resolution, bucket, field, set_name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def to_epoch(value):
+    """
+    Epoch seconds for an ISO timestamp (naive = local time), a number, or a
+    datetime; None if unparsable, not finite, or not representable as a local
+    datetime (e.g. "nan", "inf", 1e20).
+    """
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, datetime):
+            ts = value.timestamp()
+        elif isinstance(value, (int, float)):
+            ts = float(value)
+        else:
+            try:
+                ts = float(value)
+            except (TypeError, ValueError):
+                ts = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00")).timestamp()
+        if not math.isfinite(ts):
+            return None
+        datetime.fromtimestamp(ts)  # Range check: what every caller does with it next
+        return ts
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def bucket_start(ts, resolution):
+    """Start (epoch) of the `resolution`-second bucket holding `ts`, aligned to local midnight."""
+    offset = time.localtime(ts).tm_gmtoff
+    return ts - (ts + offset) % resolution
+
+
+def numeric_fields(reading):
+    """(field, value) for every finite int/float value of a reading."""
+    for field, value in reading.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            yield field, float(value)
+
+
+_UPSERT_ROLLUP = """
+INSERT INTO rollups (stream, set_name, resolution, field, bucket, count, sum, min, max) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (stream, resolution, bucket, field, set_name) DO UPDATE SET
+    count = count + excluded.count, sum = sum + excluded.sum,
+    min = min(min, excluded.min), max = max(max, excluded.max)
+"""
+
+
+def _add_rollups(acc, stream, ts, set_name, reading):
+    # acc: (stream, set, resolution, field, bucket) -> [count, sum, min, max]
+    for field, value in numeric_fields(reading):
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            key = (stream, set_name or "", resolution, field, bucket_start(ts, resolution))
+            agg = acc.get(key)
+            if agg is None:
+                acc[key] = [1, value, value, value]
+            else:
+                agg[0] += 1
+                agg[1] += value
+                agg[2] = min(agg[2], value)
+                agg[3] = max(agg[3], value)
+
+
+def _write_rollups(conn, acc):
+    conn.executemany(_UPSERT_ROLLUP, [key + tuple(agg) for key, agg in acc.items()])
+
+
+class BacklogFull(Exception):
+    """submit() refused a batch: the group-commit writer is INGEST_QUEUE_MAX readings behind."""
+
+
+def parse_log_line(line):
+    """(timestamp, reading) from a "timestamp | {json}" log line; raises ValueError on anything else."""
+    ts, json_part = line.split("|", 1)
+    return ts.strip(), json.loads(json_part)
+
+
+class SensorStore:
+    """insert() readings per stream ("env", "soil", ...); query() / latest() return them in the API's shape."""
+
+    def __init__(self, path=SENSOR_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._queue = queue.Queue()  # Bounded by INGEST_QUEUE_MAX through _uncommitted
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._uncommitted = 0  # Submitted readings not committed yet (queued or in the writer's batch)
+        self._changes = {}     # stream -> readings inserted or submitted by this process
+        self._boot = f"{os.getpid()}.{int(time.time())}"
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def insert(self, stream, reading, timestamp=None):
+        """Store one reading (the posted JSON object) now; `timestamp` defaults to reading["timestamp"], then now."""
+        self.insert_many([(stream, reading, timestamp)])
+        self._changes[stream] = self._changes.get(stream, 0) + 1
+
+    def insert_many(self, items):
+        """Store (stream, reading, timestamp) items in one transaction."""
+        rows = []
+        rollups = {}
+        for stream, reading, timestamp in items:
+            if timestamp is None:
+                timestamp = reading.get("timestamp") or clock.now().isoformat()
+            ts = to_epoch(timestamp)
+            if ts is None:
+                ts = clock.time()
+            rows.append((stream, ts, reading.get("set_name"), str(timestamp), json.dumps(reading)))
+            _add_rollups(rollups, stream, ts, reading.get("set_name"), reading)
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT INTO readings (stream, ts, set_name, timestamp, data) VALUES (?, ?, ?, ?, ?)", rows)
+            _write_rollups(conn, rollups)
+
+    def version(self, stream):
+        """Changes whenever this process stores or submits a reading for `stream` (all writes go through the API process)."""
+        return f"{self._boot}.{self._changes.get(stream, 0)}"
+
+    def submit(self, stream, readings):
+        """Queue (reading, timestamp) pairs of one stream for the group-commit writer (see submit_many)."""
+        self.submit_many([(stream, reading, timestamp) for reading, timestamp in readings])
+
+    def submit_many(self, items):
+        """
+        Queue (stream, reading, timestamp) items for the group-commit writer, all
+        or none: raises BacklogFull, queuing nothing, if they would put the writer
+        more than INGEST_QUEUE_MAX readings behind.
+        """
+        self._ensure_writer()
+        with self._writer_lock:
+            if self._uncommitted + len(items) > INGEST_QUEUE_MAX:
+                raise BacklogFull(f"sensor store is {self._uncommitted} readings behind; retry later")
+            self._uncommitted += len(items)  # Reserved before queuing, so concurrent submits cannot overshoot
+            for stream, reading, timestamp in items:
+                self._changes[stream] = self._changes.get(stream, 0) + 1
+        for item in items:
+            self._queue.put_nowait(item)  # Unbounded queue: never raises
+
+    def flush(self, timeout=INGEST_FLUSH_TIMEOUT_SEC):
+        """Commit everything submitted so far. Returns False on timeout."""
+        if not self._uncommitted:
+            return True
+        done = threading.Event()
+        self._queue.put((None, done, None))
+        return done.wait(timeout)
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True, name="sensor-store-writer")
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + INGEST_COMMIT_INTERVAL_SEC
+            while True:  # Collect until the interval ends, the batch is full or someone flushes
+                if item[0] is None:
+                    waiters.append(item[1])
+                    break
+                batch.append(item)
+                if len(batch) >= INGEST_COMMIT_ROWS:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.insert_many(batch)
+                except Exception as e:
+                    # One bad reading must not cost the others theirs: retry row by row
+                    log(f"[WARN] [SENSOR_STORE] Group commit of {len(batch)} reading(s) failed ({e}); storing one at a time")
+                    for row in batch:
+                        try:
+                            self.insert_many([row])
+                        except Exception as e:
+                            log(f"[ERROR] [SENSOR_STORE] Could not store {row[0]} reading {row[2]!r}: {e}")
+                with self._writer_lock:
+                    self._uncommitted -= len(batch)
+            for done in waiters:
+                done.set()
+
+    def query(self, stream, n=None, start=None, end=None, set_name=None):
+        """
+        Readings of `stream` with start <= time < end (either may be None),
+        optionally only one set's, in chronological order. With `n` only the
+        newest n of them are returned.
+        """
+        self.flush()
+        sql = "SELECT timestamp, data FROM readings WHERE stream = ?"
+        args = [stream]
+        if set_name is not None:
+            sql += " AND set_name = ?"
+            args.append(set_name)
+        if start is not None:
+            sql += " AND ts >= ?"
+            args.append(to_epoch(start))
+        if end is not None:
+            sql += " AND ts < ?"
+            args.append(to_epoch(end))
+        if n is not None:
+            sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+            args.append(int(n))
+        else:
+            sql += " ORDER BY ts, id"
+        rows = self._conn().execute(sql, args).fetchall()
+        if n is not None:
+            rows.reverse()
+        return [_entry(timestamp, data) for timestamp, data in rows]
+
+    def iter_readings(self, stream, start=None, end=None, set_name=None):
+        """
+        All readings of `stream` in the range, oldest first, in the API's shape.
+        Fetched in pages by (time, id), so memory stays constant and no read
+        transaction is held open while the caller streams them out.
+        """
+        self.flush()
+        where = "stream = ?"
+        args = [stream]
+        if set_name is not None:
+            where += " AND set_name = ?"
+            args.append(set_name)
+        if start is not None:
+            where += " AND ts >= ?"
+            args.append(to_epoch(start))
+        if end is not None:
+            where += " AND ts < ?"
+            args.append(to_epoch(end))
+        after = None
+        while True:
+            sql = f"SELECT ts, id, timestamp, data FROM readings WHERE {where}"
+            page_args = list(args)
+            if after is not None:
+                sql += " AND (ts > ? OR (ts = ? AND id > ?))"
+                page_args += [after[0], after[0], after[1]]
+            sql += " ORDER BY ts, id LIMIT ?"
+            page_args.append(EXPORT_PAGE_ROWS)
+            rows = self._conn().execute(sql, page_args).fetchall()
+            for ts, row_id, timestamp, data in rows:
+                yield _entry(timestamp, data)
+            if len(rows) < EXPORT_PAGE_ROWS:
+                return
+            after = (rows[-1][0], rows[-1][1])
+
+    def field_names(self, stream, start=None, end=None, set_name=None):
+        """Sorted names of every field that occurs in the range (CSV columns), found without decoding rows in Python."""
+        self.flush()
+        sql = "SELECT DISTINCT j.key FROM readings, json_each(readings.data) AS j WHERE stream = ?"
+        args = [stream]
+        if set_name is not None:
+            sql += " AND set_name = ?"
+            args.append(set_name)
+        if start is not None:
+            sql += " AND ts >= ?"
+            args.append(to_epoch(start))
+        if end is not None:
+            sql += " AND ts < ?"
+            args.append(to_epoch(end))
+        return sorted(row[0] for row in self._conn().execute(sql, args))
+
+    def series(self, stream, field, start=None, end=None, set_name=None, limit=None):
+        """(epoch, value) pairs of one numeric field, oldest first; extracted in SQLite without decoding the rows."""
+        self.flush()
+        sql = "SELECT ts, json_extract(data, ?) AS value FROM readings WHERE stream = ?"
+        args = ['$."' + field.replace('"', '') + '"', stream]
+        if set_name is not None:
+            sql += " AND set_name = ?"
+            args.append(set_name)
+        if start is not None:
+            sql += " AND ts >= ?"
+            args.append(to_epoch(start))
+        if end is not None:
+            sql += " AND ts < ?"
+            args.append(to_epoch(end))
+        sql += " AND typeof(value) IN ('integer', 'real') ORDER BY ts, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        return self._conn().execute(sql, args).fetchall()
+
+    def rollup_series(self, stream, field, start, end, resolution, set_name=None):
+        """(bucket epoch, min, max) of one field at `resolution` ("minute", "hour", "day"), oldest first."""
+        sec = ROLLUP_RESOLUTIONS[resolution]
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        self.flush()
+        sql = ("SELECT bucket, min(min), max(max) FROM rollups"
+               " WHERE stream = ? AND resolution = ? AND bucket >= ? AND bucket < ? AND field = ?")
+        args = [stream, sec, bucket_start(start_ts, sec), end_ts, field]
+        if set_name is not None:
+            sql += " AND set_name = ?"
+            args.append(set_name)
+        sql += " GROUP BY bucket ORDER BY bucket"
+        return self._conn().execute(sql, args).fetchall()
+
+    def latest(self, stream, set_name=None):
+        """The newest reading of `stream` (optionally of one set), or None."""
+        rows = self.query(stream, n=1, set_name=set_name)
+        return rows[0] if rows else None
+
+    def rollup(self, stream, start, end, set_name=None, fields=None, resolution=None):
+        """
+        min/max/mean/count per bucket for start <= time < end, as
+        {"resolution", "start", "end", "series": {field: [{"time", "min", "max", "mean", "count"}, ...]}}.
+        `resolution` ("minute", "hour", "day") defaults to the finest one giving
+        at most ROLLUP_TARGET_POINTS buckets. Without `set_name` all sets are
+        combined; `fields` limits the series returned.
+        """
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        if start_ts is None or end_ts is None or end_ts <= start_ts:
+            raise ValueError("start and end must be timestamps with start < end")
+        if resolution is None:
+            resolution = next(
+                (name for name, sec in ROLLUP_RESOLUTIONS.items() if (end_ts - start_ts) / sec <= ROLLUP_TARGET_POINTS),
+                "day"
+            )
+        if resolution not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(ROLLUP_RESOLUTIONS)}")
+        sec = ROLLUP_RESOLUTIONS[resolution]
+        self.flush()
+        sql = ("SELECT field, bucket, sum(count), sum(sum), min(min), max(max) FROM rollups"
+               " WHERE stream = ? AND resolution = ? AND bucket >= ? AND bucket < ?")
+        args = [stream, sec, bucket_start(start_ts, sec), end_ts]
+        if set_name is not None:
+            sql += " AND set_name = ?"
+            args.append(set_name)
+        if fields:
+            sql += f" AND field IN ({', '.join('?' * len(fields))})"
+            args.extend(fields)
+        sql += " GROUP BY field, bucket ORDER BY field, bucket"
+        series = {}
+        for field, bucket, count, total, low, high in self._conn().execute(sql, args):
+            series.setdefault(field, []).append({
+                "time": datetime.fromtimestamp(bucket).isoformat(),
+                "min": low,
+                "max": high,
+                "mean": total / count,
+                "count": count
+            })
+        return {
+            "resolution": resolution,
+            "start": datetime.fromtimestamp(start_ts).isoformat(),
+            "end": datetime.fromtimestamp(end_ts).isoformat(),
+            "series": series
+        }
+
+    def import_log(self, stream, log_path):
+        """
+        One-time import of a "timestamp | {json}" text log (live file and
+        rotated archives) into `stream`. Returns the number of rows imported;
+        0 if this log was imported before. Unparsable lines are skipped.
+        """
+        key = f"imported:{stream}:{log_path}"
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            return 0
+        count = 0
+        batch = []
+        rollups = {}
+        with conn:  # One transaction: an interrupted import leaves nothing behind and is redone
+            for line in iter_lines(log_path):
+                try:
+                    timestamp, reading = parse_log_line(line)
+                except ValueError:
+                    continue
+                ts = to_epoch(timestamp)
+                if ts is None or not isinstance(reading, dict):
+                    continue
+                batch.append((stream, ts, reading.get("set_name"), timestamp, json.dumps(reading)))
+                _add_rollups(rollups, stream, ts, reading.get("set_name"), reading)
+                if len(batch) >= IMPORT_BATCH_ROWS:
+                    conn.executemany("INSERT INTO readings (stream, ts, set_name, timestamp, data) VALUES (?, ?, ?, ?, ?)", batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany("INSERT INTO readings (stream, ts, set_name, timestamp, data) VALUES (?, ?, ?, ?, ?)", batch)
+                count += len(batch)
+            _write_rollups(conn, rollups)
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, clock.now().isoformat()))
+        if count:
+            self._changes[stream] = self._changes.get(stream, 0) + count
+            log(f"[SENSOR_STORE] Imported {count} {stream} reading(s) from {log_path}")
+        return count
+
+
+def _entry(timestamp, data):
+    return {"timestamp": timestamp, **json.loads(data)}
+
+
+sensor_store = SensorStore()
+atexit.register(sensor_store.flush)
@@ -0,0 +1,164 @@
+### serve_api.py
+
+# Production launcher for flask_api (instead of `flask run` / app.run()).
+#
+#   python3 serve_api.py [--host 0.0.0.0] [--port 5000] [--threads 12] [--timeout 60]
+#
+# Serves the app through waitress when it is installed (pip install waitress):
+# a fixed pool of worker threads, HTTP/1.1 keep-alive, a cap on open
+# connections, and idle connections dropped after --timeout seconds. Without
+# waitress it falls back to werkzeug's server with the same bounded thread
+# pool and socket timeout. Responses go through compression.CompressionMiddleware.
+#
+# Each /status-stream client holds one worker thread for as long as it stays
+# connected, so API_RESERVED_THREADS workers are kept out of reach of SSE:
+# flask_api admits at most --threads minus the reserve (at least half the
+# pool stays free) and answers further streams with 503, leaving workers for
+# /stop-all, /status and the rest. Waitress queues at most one request per
+# connection (connection_limit); the werkzeug fallback queues at most
+# API_QUEUE_MAX requests beyond its busy workers and answers the next with 503
+# instead of letting them wait unboundedly, and since a worker there stays
+# with its connection while it idles in keep-alive, idle connections are
+# dropped after FALLBACK_IDLE_SEC.
+#
+# Before serving, a self-check requests the main endpoints in-process and
+# exits non-zero if /status fails.
+
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+from compression import CompressionMiddleware
+from flask_api import app, sensor_readings, set_stream_limit
+from logger import log
+from shared_state import shared_state
+
+API_HOST = "0.0.0.0"
+API_PORT = 5000
+API_THREADS = 12
+API_CONNECTION_LIMIT = 100
+API_TIMEOUT_SEC = 60   # Idle connections closed after this; /status-stream heartbeats every 5 s
+API_RESERVED_THREADS = 4   # Workers /status-stream may not take
+API_QUEUE_MAX = 32         # werkzeug fallback: requests waiting for a worker before 503
+FALLBACK_IDLE_SEC = 5      # werkzeug fallback: keep-alive idle limit (the connection holds a worker)
+
+SELF_CHECK_ENDPOINTS = ("/status", "/schedule-index", "/mist-status", "/history", "/env-latest")
+
+
+def self_check():
+    """Request the main endpoints in-process. Returns False if /status itself fails."""
+    ok = True
+    client = app.test_client()
+    for path in SELF_CHECK_ENDPOINTS:
+        try:
+            response = client.get(path)
+            code = response.status_code
+        except Exception as e:
+            code = f"exception: {e}"
+        good = code in (200, 404)  # 404: no readings / history yet
+        log(f"[API] Self-check {path}: {code}")
+        if not good and path == "/status":
+            ok = False
+    try:
+        sensor_readings().latest("env")
+    except Exception as e:
+        log(f"[API] Self-check sensor store failed: {e}")
+        ok = False
+    if shared_state.sequence() is None:
+        log("[API] Self-check: controller state not available (is main.py running?); serving file fallbacks")
+    return ok
+
+
+def stream_limit(threads):
+    """/status-stream clients allowed with `threads` workers."""
+    return max(threads - API_RESERVED_THREADS, threads // 2)
+
+
+def busy_response():
+    body = json.dumps({"error": "Server busy; retry shortly."}).encode()
+    return (
+        b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+        b"Retry-After: 1\r\nConnection: close\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+
+
+def serve_werkzeug(wsgi_app, host, port, threads, timeout, queue_max=API_QUEUE_MAX):
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class Handler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive
+
+    Handler.timeout = min(timeout, FALLBACK_IDLE_SEC)
+
+    class PooledServer(BaseWSGIServer):
+        multithread = True
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="api")
+            self._slots = threading.BoundedSemaphore(threads + queue_max)  # Running + queued
+
+        def process_request(self, request, client_address):
+            if not self._slots.acquire(blocking=False):
+                self._reject(request)
+                return
+            self._pool.submit(self._process, request, client_address)
+
+        def _process(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self._slots.release()
+
+        def _reject(self, request):
+            # Answered on the accept thread; read what has arrived so closing does not reset the connection first
+            try:
+                request.settimeout(0.2)
+                request.recv(65536)
+                request.sendall(busy_response())
+            except OSError:
+                pass
+            finally:
+                self.shutdown_request(request)
+
+    PooledServer(host, port, wsgi_app, handler=Handler).serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the sprinkler API.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--threads", type=int, default=API_THREADS)
+    parser.add_argument("--timeout", type=int, default=API_TIMEOUT_SEC)
+    parser.add_argument("--skip-self-check", action="store_true")
+    args = parser.parse_args(argv)
+
+    if not args.skip_self_check and not self_check():
+        print("API self-check failed; see the status log", file=sys.stderr)
+        return 1
+    set_stream_limit(stream_limit(args.threads))
+    wsgi_app = CompressionMiddleware(app.wsgi_app)
+    if waitress is not None:
+        log(f"[API] Serving on {args.host}:{args.port} with waitress ({args.threads} threads, {stream_limit(args.threads)} for /status-stream)")
+        waitress.serve(
+            wsgi_app, host=args.host, port=args.port, threads=args.threads,
+            connection_limit=API_CONNECTION_LIMIT, channel_timeout=args.timeout, ident="sprinkler"
+        )
+    else:
+        log(f"[API] waitress not installed; serving on {args.host}:{args.port} with werkzeug ({args.threads} threads, {stream_limit(args.threads)} for /status-stream)")
+        serve_werkzeug(wsgi_app, args.host, args.port, args.threads, args.timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+### shared_state.py
+
+# Live controller state shared with the API process through shared memory.
+# main.py and flask_api.py are separate processes, so CURRENT_RUN in the API
+# process never changes. The controller instead publishes its run state
+# (primary run, per-zone phase / remaining times / relay shadow) and mist state
+# into a fixed-layout record in a memory-mapped file on tmpfs. The API maps the
+# same file and reads it with plain memory copies: no syscalls and no JSON per
+# request.
+#
+# Consistency uses a seqlock. The writer makes the sequence counter odd, writes
+# the payload, then makes it even again. A reader retries if the counter was
+# odd, or changed while it copied the payload. There is a single writer (the
+# controller, serialised by a lock), so readers never block it.
+#
+# Countdowns are not rewritten every second: each zone stores its deadlines on
+# the system-wide monotonic clock, and the reader derives the remaining times
+# from them (the same approach as status.RunState).
+
+import math
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+
+import clock
+from config import RELAYS
+
+STATE_PATH = "/dev/shm/sprinkler_state" if os.path.isdir("/dev/shm") else "/home/lds00/sprinkler/sprinkler_state.shm"
+MAGIC = b"SPKS"
+LAYOUT_VERSION = 1
+MAX_ZONES = 8
+READ_RETRIES = 100
+REOPEN_INTERVAL_SEC = 5.0  # How often a reader retries mapping a segment the controller has not created yet
+
+PHASES = ("", "Waiting", "Watering", "Soaking")
+
+_HEADER = struct.Struct("<4sHHQ")              # magic, layout version, zone count, sequence
+_RUN = struct.Struct("<bd")                    # primary zone index (-1: none), published_at (epoch)
+_ZONE = struct.Struct("<32sBBdddddd")          # name, phase, relay_on, started (epoch), duration_minutes,
+                                               # water_remaining_sec, pulse_end, next_on, written (monotonic)
+_MIST = struct.Struct("<?ddddd")               # is_misting, last/next event (epoch), temperature, interval, duration
+_SEQ_OFFSET = 8
+_PAYLOAD_OFFSET = _HEADER.size
+_ZONES_OFFSET = _PAYLOAD_OFFSET + _RUN.size
+_MIST_OFFSET = _ZONES_OFFSET + MAX_ZONES * _ZONE.size
+SIZE = _MIST_OFFSET + _MIST.size
+
+_NAN = float("nan")
+
+
+def _to_epoch(value):
+    if not value:
+        return _NAN
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def _to_iso(epoch):
+    return None if math.isnan(epoch) else datetime.fromtimestamp(epoch).isoformat()
+
+
+def _num(value):
+    return _NAN if value is None else float(value)
+
+
+def _opt(value):
+    return None if math.isnan(value) else (int(value) if value == int(value) else value)
+
+
+class SharedState:
+    """
+    open_writer() in the controller, then publish_runs() / publish_mist().
+    Any process can read_run() / read_mist(); they return None while no
+    controller has created the segment.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._map = None
+        self._writer = False
+        self._lock = threading.Lock()
+        self._next_open_attempt = 0.0
+        self._zone_names = list(RELAYS)[:MAX_ZONES]
+
+    # --- Writer (controller) ---
+
+    def open_writer(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self._map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        self._writer = True
+        with self._lock:
+            self._map[:SIZE] = bytes(SIZE)  # Stale state from a previous run is meaningless
+            _HEADER.pack_into(self._map, 0, MAGIC, LAYOUT_VERSION, len(self._zone_names), 0)
+            self._begin()
+            self._write_zones({}, None)
+            _MIST.pack_into(self._map, _MIST_OFFSET, False, _NAN, _NAN, _NAN, _NAN, _NAN)
+            self._end()
+        return self
+
+    def publish_runs(self, runs):
+        """Mirror the run engine's active ZoneRuns (primary = the watering one, as in CURRENT_RUN)."""
+        if not self._writer:
+            return
+        by_zone = {run.set_name: run for run in runs}
+        primary = next((r for r in runs if r.phase == "Watering"), None) or (runs[0] if runs else None)
+        with self._lock:
+            self._begin()
+            self._write_zones(by_zone, primary)
+            self._end()
+
+    def publish_mist(self, is_misting, last_mist_event, next_mist_event, current_temperature, interval_minutes, duration_minutes):
+        if not self._writer:
+            return
+        with self._lock:
+            self._begin()
+            _MIST.pack_into(
+                self._map, _MIST_OFFSET, bool(is_misting), _to_epoch(last_mist_event), _to_epoch(next_mist_event),
+                _num(current_temperature), _num(interval_minutes), _num(duration_minutes)
+            )
+            self._end()
+
+    def _begin(self):
+        seq = struct.unpack_from("<Q", self._map, _SEQ_OFFSET)[0]
+        struct.pack_into("<Q", self._map, _SEQ_OFFSET, seq + 1 if seq % 2 == 0 else seq + 2)
+
+    def _end(self):
+        seq = struct.unpack_from("<Q", self._map, _SEQ_OFFSET)[0]
+        struct.pack_into("<Q", self._map, _SEQ_OFFSET, seq + 1)
+
+    def _write_zones(self, by_zone, primary):
+        now = clock.monotonic()
+        primary_index = -1
+        for index, name in enumerate(self._zone_names):
+            run = by_zone.get(name)
+            if run is None:
+                values = (0, 0, _NAN, _NAN, 0.0, _NAN, _NAN, now)
+            else:
+                time_rem, pulse_left, soak_left = run.remaining(now)
+                values = (
+                    PHASES.index(run.phase) if run.phase in PHASES else 0,
+                    run.phase == "Watering",
+                    run.started.timestamp(),
+                    _num(run.duration_minutes),
+                    time_rem,
+                    now + pulse_left if run.phase == "Watering" else _NAN,
+                    now + soak_left if run.phase in ("Waiting", "Soaking") else _NAN,
+                    now
+                )
+                if run is primary:
+                    primary_index = index
+            _ZONE.pack_into(self._map, _ZONES_OFFSET + index * _ZONE.size, name.encode()[:32], *values)
+        _RUN.pack_into(self._map, _PAYLOAD_OFFSET, primary_index, clock.time())
+
+    # --- Reader (any process) ---
+
+    def _mapped(self):
+        if self._map is not None:
+            return True
+        now = clock.monotonic()
+        if now < self._next_open_attempt:
+            return False
+        self._next_open_attempt = now + REOPEN_INTERVAL_SEC
+        try:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def _read_payload(self):
+        if not self._mapped():
+            return None
+        for _ in range(READ_RETRIES):
+            before = struct.unpack_from("<Q", self._map, _SEQ_OFFSET)[0]
+            if before % 2:
+                continue  # Write in progress
+            data = self._map[:SIZE]
+            after = struct.unpack_from("<Q", self._map, _SEQ_OFFSET)[0]
+            if before == after:
+                magic, version, zone_count, _ = _HEADER.unpack_from(data, 0)
+                if magic != MAGIC or version != LAYOUT_VERSION:
+                    return None
+                return data, zone_count
+        return None
+
+    def sequence(self):
+        """The record's sequence counter (None if unavailable): it changes whenever the controller publishes."""
+        if not self._mapped():
+            return None
+        return struct.unpack_from("<Q", self._map, _SEQ_OFFSET)[0]
+
+    def read_run(self):
+        """
+        The controller's run state in CURRENT_RUN's shape (Running, Set, Phase,
+        Start_Time, Duration_Minutes and the three countdowns), plus "Zones":
+        every zone's phase, relay state and countdowns. None if unavailable.
+        """
+        payload = self._read_payload()
+        if payload is None:
+            return None
+        data, zone_count = payload
+        primary_index, published_at = _RUN.unpack_from(data, _PAYLOAD_OFFSET)
+        now = clock.monotonic()
+        zones = []
+        for index in range(zone_count):
+            name, phase, relay_on, started, duration, water_rem, pulse_end, next_on, written = \
+                _ZONE.unpack_from(data, _ZONES_OFFSET + index * _ZONE.size)
+            phase = PHASES[phase] if phase < len(PHASES) else ""
+            if phase == "Watering":
+                time_rem = max(0.0, water_rem - (now - written))
+                pulse_left = max(0.0, pulse_end - now)
+                soak_left = 0.0
+            else:
+                time_rem = water_rem
+                pulse_left = 0.0
+                soak_left = 0.0 if math.isnan(next_on) else max(0.0, next_on - now)
+            zones.append({
+                "Set": name.rstrip(b"\0").decode(),
+                "Phase": phase,
+                "Relay_On": bool(relay_on),
+                "Start_Time": _to_iso(started),
+                "Duration_Minutes": _opt(duration),
+                "Time_Remaining_Sec": int(time_rem),
+                "Pulse_Time_Left_Sec": int(pulse_left),
+                "Soak_Remaining_Sec": int(soak_left)
+            })
+        if 0 <= primary_index < len(zones):
+            state = {k: v for k, v in zones[primary_index].items() if k != "Relay_On"}
+            state["Running"] = True
+        else:
+            state = {
+                "Running": False, "Set": "", "Phase": "", "Start_Time": None, "Duration_Minutes": None,
+                "Time_Remaining_Sec": 0, "Pulse_Time_Left_Sec": 0, "Soak_Remaining_Sec": 0
+            }
+        state["Zones"] = zones
+        state["Updated"] = _to_iso(published_at)
+        return state
+
+    def read_mist(self):
+        """The controller's mist state in mist_status.json's shape, or None if unavailable."""
+        payload = self._read_payload()
+        if payload is None:
+            return None
+        data, _ = payload
+        is_misting, last_event, next_event, temperature, interval, duration = _MIST.unpack_from(data, _MIST_OFFSET)
+        return {
+            "is_misting": is_misting,
+            "last_mist_event": _to_iso(last_event),
+            "next_mist_event": _to_iso(next_event),
+            "current_temperature": _opt(temperature),
+            "interval_minutes": _opt(interval),
+            "duration_minutes": _opt(duration)
+        }
+
+
+shared_state = SharedState()
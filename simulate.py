@@ -0,0 +1,220 @@
+### simulate.py
+
+# Season simulator. Replays N days of a schedule on a virtual clock (clock.SimClock)
+# in a few seconds, using the real schedule compiler (schedule_engine), the
+# controller's start and mist decisions (schedule_actions: missed-start grace,
+# once-per-day starts, mist status), zone sequencer / cycle-soak planner and run
+# engine, with fake_gpio standing in for the relay board and a daily temperature
+# curve standing in for the weather service. Prints the water
+# totals and writes the relay timeline, so a schedule upload can be checked (and
+# the scheduling overhead measured) before it touches the yard.
+#
+#   python3 simulate.py --schedule sprinkler_schedule.json --days 30 --start 2025-07-01 --temp-high 100
+#
+# Nothing here touches the real relays or the files main.py uses: the log,
+# history and mist status files go to --out (a temporary directory by default).
+# No manual run is ever active, and last_scheduled_run is kept in memory.
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import fake_gpio
+fake_gpio.install()  # Before anything imports gpio_controller
+
+import clock
+import logger
+logger.LOG_PATH = os.path.join(tempfile.gettempdir(), "sprinkler_simulation.log")
+
+import run_manager
+import state_file
+from config import RELAYS, ZONE_FLOW_LPM, MAX_CONCURRENT_ZONES
+from schedule_cache import SCHEDULE_FILE, FrozenSchedule, validate_schedule
+from schedule_engine import ScheduleEngine, compile_start_events, next_midnight
+from schedule_actions import ScheduleActions, MISSED_START_GRACE_MINUTES
+from zone_sequencer import ZoneSequencer
+
+
+def temperature_at(when, low, high):
+    """Daily temperature curve (°F): `low` at 03:00, `high` at 15:00."""
+    hours = when.hour + when.minute / 60
+    return low + (high - low) * (1 - math.cos((hours - 3) / 24 * 2 * math.pi)) / 2
+
+
+class Simulation:
+    """One simulated period. run() returns the summary dict that main() prints."""
+
+    def __init__(self, schedule, start, days, temp_low, temp_high, out_dir):
+        self.schedule = schedule
+        self.start = start
+        self.days = days
+        self.temp_low = temp_low
+        self.temp_high = temp_high
+        self.out_dir = out_dir
+        self.events = 0
+
+    def _setup(self):
+        clock.set_clock(clock.SimClock(self.start))
+        fake_gpio.reset()
+        logger.LOG_PATH = os.path.join(self.out_dir, "sprinkler_status.log")
+        run_manager.WATERING_HISTORY_JSONL = os.path.join(self.out_dir, "watering_history.jsonl")
+        state_file.last_completed_run.path = os.path.join(self.out_dir, "last_completed_run.json")
+        state_file.mist_status.path = os.path.join(self.out_dir, "mist_status.json")
+        state_file.mist_status.min_interval_sec = 0  # Coalescing timers run on the real clock
+        self.log_file = os.path.join(self.out_dir, "watering_history.log")
+        for pin in RELAYS.values():
+            fake_gpio.setup(pin, fake_gpio.OUT)
+        self.run_engine = run_manager.run_engine
+        self.run_engine.threaded = False  # Stepped below instead
+        self.sequencer = ZoneSequencer(self._start_zone, state_file=None)
+        self.sequencer.start()
+        self.actions = ScheduleActions(
+            self.sequencer,
+            lambda: round(temperature_at(clock.now(), self.temp_low, self.temp_high), 1),
+            publish_mist=lambda **data: state_file.mist_status.set(data),
+            mist_status=state_file.mist_status
+        )
+        self.engine = ScheduleEngine()
+        self.engine.on("soon", lambda event, late_sec: None)
+        self.engine.on("start", self._on_start)
+        self.engine.on("midnight", self._on_midnight)
+        self.engine.on("mist", self._on_mist)
+
+    def _start_zone(self, set_name, duration_minutes, **kwargs):
+        return run_manager.start_run(set_name, duration_minutes, RELAYS, self.log_file, **kwargs)
+
+    def _compile_timeline(self):
+        self.engine.cancel("soon", "start", "midnight")
+        for when, kind, payload in compile_start_events(self.schedule, grace_minutes=MISSED_START_GRACE_MINUTES):
+            self.engine.schedule_at(when, kind, payload)
+        self.engine.schedule_at(next_midnight(), "midnight")
+
+    def _on_start(self, event, late_sec):
+        self.events += 1
+        self.actions.start(self.schedule, event.payload, late_sec)
+
+    def _on_midnight(self, event, late_sec):
+        self.events += 1
+        self._compile_timeline()
+
+    def _on_mist(self, event, late_sec):
+        self.events += 1
+        self.engine.schedule_in(self.actions.mist(self.schedule), "mist")
+
+    def run(self):
+        self._setup()
+        self._compile_timeline()
+        self.engine.schedule_in(0, "mist")
+        end = self.days * 86400
+        busy_sec = 0.0
+        wall_start = time.perf_counter()
+        while True:
+            t0 = time.perf_counter()
+            waits = [w for w in (self.engine.run_pending(), self.run_engine.run_due()) if w is not None]
+            busy_sec += time.perf_counter() - t0
+            if not waits:
+                break
+            if clock.monotonic() + min(waits) > end:
+                break
+            clock.sleep(min(waits))
+        # Runs still going when the period ends are stopped (logged as Aborted)
+        truncated = [run.set_name for run in self.run_engine.cancel()]
+        self.run_engine.run_due()
+        return self._summary(time.perf_counter() - wall_start, busy_sec, truncated)
+
+    def _timeline(self):
+        pin_names = {pin: name for name, pin in RELAYS.items()}
+        return [(when, pin_names[pin], "ON" if level else "OFF")
+                for when, pin, level in fake_gpio.transitions if pin in pin_names]
+
+    def _summary(self, wall_sec, busy_sec, truncated):
+        timeline = self._timeline()
+        totals = {name: {"pulses": 0, "minutes": 0.0} for name in RELAYS}
+        opened = {}
+        open_now = peak = 0
+        for when, name, state in timeline:
+            if state == "ON":
+                opened[name] = when
+                totals[name]["pulses"] += 1
+                open_now += 1
+                peak = max(peak, open_now)
+            elif name in opened:
+                totals[name]["minutes"] += (when - opened.pop(name)).total_seconds() / 60
+                open_now -= 1
+        for name, total in totals.items():
+            total["minutes"] = round(total["minutes"], 1)
+            flow = ZONE_FLOW_LPM.get(name)
+            total["litres"] = round(total["minutes"] * flow, 1) if flow else None
+        timeline_path = os.path.join(self.out_dir, "relay_timeline.csv")
+        with open(timeline_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time", "set", "state"])
+            for when, name, state in timeline:
+                writer.writerow([when.isoformat(timespec="seconds"), name, state])
+        summary = {
+            "start": self.start.isoformat(),
+            "days": self.days,
+            "temperature_range_f": [self.temp_low, self.temp_high],
+            "totals": totals,
+            "relay_transitions": len(timeline),
+            "peak_open_zones": peak,
+            "max_concurrent_zones": MAX_CONCURRENT_ZONES,
+            "truncated_runs": truncated,
+            "scheduler_events": self.events,
+            "wall_seconds": round(wall_sec, 3),
+            "scheduling_seconds": round(busy_sec, 3),
+            "timeline_file": timeline_path
+        }
+        with open(os.path.join(self.out_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def print_summary(summary):
+    steps = summary["scheduler_events"] + summary["relay_transitions"]
+    per_step_us = summary["scheduling_seconds"] / steps * 1e6 if steps else 0
+    print(f"Simulated {summary['days']} day(s) from {summary['start']} in {summary['wall_seconds']}s "
+          f"(scheduling {summary['scheduling_seconds']}s, {per_step_us:.0f} µs per event)")
+    print(f"{'Set':<15}{'Pulses':>8}{'Minutes':>10}{'Litres':>10}")
+    for name, total in summary["totals"].items():
+        litres = "-" if total["litres"] is None else total["litres"]
+        print(f"{name:<15}{total['pulses']:>8}{total['minutes']:>10}{litres:>10}")
+    print(f"Peak open zones: {summary['peak_open_zones']} (MAX_CONCURRENT_ZONES = {summary['max_concurrent_zones']})")
+    if summary["truncated_runs"]:
+        print(f"Stopped at end of period: {', '.join(summary['truncated_runs'])}")
+    print(f"Relay timeline: {summary['timeline_file']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a sprinkler schedule on a virtual clock.")
+    parser.add_argument("--schedule", default=SCHEDULE_FILE, help="schedule JSON (default: the live schedule)")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--start", help="start date YYYY-MM-DD (default: today)")
+    parser.add_argument("--temp-low", type=float, default=65.0, help="nightly low in °F for the mist logic")
+    parser.add_argument("--temp-high", type=float, default=95.0, help="afternoon high in °F for the mist logic")
+    parser.add_argument("--out", help="directory for the log, history and timeline (default: a new temp dir)")
+    args = parser.parse_args(argv)
+
+    with open(args.schedule) as f:
+        data = json.load(f)
+    try:
+        validate_schedule(data)
+    except ValueError as e:
+        print(f"Invalid schedule {args.schedule}: {e}", file=sys.stderr)
+        return 1
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else datetime.combine(datetime.now().date(), datetime.min.time())
+    out_dir = args.out or tempfile.mkdtemp(prefix="sprinkler_sim_")
+    os.makedirs(out_dir, exist_ok=True)
+    simulation = Simulation(FrozenSchedule(data, "simulation"), start, args.days, args.temp_low, args.temp_high, out_dir)
+    print_summary(simulation.run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
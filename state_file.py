@@ -0,0 +1,120 @@
+### state_file.py
+
+# Small JSON state files shared between main.py and flask_api.py
+# (mist_status.json, last_completed_run.json).
+# The process that writes a file keeps the in-memory copy authoritative: get()
+# never touches the disk there, and set() only writes when the content really
+# changed. Writes are atomic (temp file + fsync + rename), so a reader never
+# sees a truncated file, and updates arriving within min_interval_sec of the
+# previous write are coalesced into one deferred write of the latest value.
+# Other processes get() through an os.stat() check and only re-parse the file
+# when it was replaced.
+
+import atexit
+import json
+import os
+import threading
+
+import clock
+from logger import log
+
+MIST_STATUS_FILE = "/home/lds00/sprinkler/mist_status.json"
+LAST_COMPLETED_RUN_FILE = "/home/lds00/sprinkler/last_completed_run.json"
+COALESCE_SEC = 1.0
+
+
+class StateFile:
+    """A JSON value persisted to `path`. Values handed out by get() are shared; treat them as read-only."""
+
+    def __init__(self, path, default=None, min_interval_sec=COALESCE_SEC):
+        self.path = path
+        self.default = default
+        self.min_interval_sec = min_interval_sec
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_key = None     # stat key of the file last parsed (reader side)
+        self._owner = False         # True once this process has set() the value
+        self._written = None        # JSON text last written
+        self._pending = None        # JSON text waiting for a coalesced write
+        self._last_write = float("-inf")
+        self._timer = None
+
+    def get(self):
+        with self._lock:
+            if not self._owner:
+                self._reload_if_changed()
+            return self._value if self._value is not None else self.default
+
+    def set(self, value):
+        """Make `value` current; it is written to disk only if it differs from what is there."""
+        text = json.dumps(value, sort_keys=True)
+        with self._lock:
+            if not self._owner:
+                self._reload_if_changed()  # Seed _written so an unchanged value is not rewritten after a restart
+                self._owner = True
+            self._value = value
+            if text == (self._pending or self._written):
+                return
+            self._pending = text
+            wait = self._last_write + self.min_interval_sec - clock.monotonic()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Write a pending (coalesced) update now."""
+        with self._lock:
+            self._timer = None
+            text, self._pending = self._pending, None
+            if text is None or text == self._written:
+                return
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._written = text
+                self._last_write = clock.monotonic()
+            except Exception as e:
+                log(f"[WARN] Could not write {self.path}: {e}")
+
+    def _reload_if_changed(self):
+        # Called with self._lock held
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if key == self._loaded_key:
+            return
+        try:
+            with open(self.path) as f:
+                text = f.read()
+            self._value = json.loads(text)
+            self._written = json.dumps(self._value, sort_keys=True)
+            self._loaded_key = key
+        except Exception:
+            pass  # Keep the previous value; the file may be mid-replace by an older writer
+
+
+mist_status = StateFile(MIST_STATUS_FILE, default={
+    "is_misting": False,
+    "last_mist_event": None,
+    "next_mist_event": None,
+    "current_temperature": None,
+    "interval_minutes": None,
+    "duration_minutes": None
+})
+last_completed_run = StateFile(LAST_COMPLETED_RUN_FILE)
+
+
+@atexit.register
+def _flush_all():
+    for state in (mist_status, last_completed_run):
+        state.flush()
@@ -1,9 +1,49 @@
 import os
+import clock
 
-CURRENT_RUN = {
+
+class RunState(dict):
+    """
+    CURRENT_RUN. The run engine only writes it when a relay changes; the
+    countdown fields (Time_Remaining_Sec, Pulse_Time_Left_Sec, Soak_Remaining_Sec)
+    are computed on read from the engine's monotonic deadlines stored under
+    "_Run", so nothing has to rewrite them every second.
+    """
+
+    _COUNTDOWNS = ("Time_Remaining_Sec", "Pulse_Time_Left_Sec", "Soak_Remaining_Sec")
+
+    def _countdown(self, key):
+        run = dict.get(self, "_Run")
+        if run is None:
+            return None
+        remaining = run.remaining(clock.monotonic())
+        return int(remaining[self._COUNTDOWNS.index(key)])
+
+    def __getitem__(self, key):
+        if key in self._COUNTDOWNS:
+            value = self._countdown(key)
+            if value is not None:
+                return value
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def snapshot(self):
+        """Plain dict copy with the countdowns evaluated now (private keys dropped)."""
+        data = {k: v for k, v in self.items() if not k.startswith("_")}
+        for key in self._COUNTDOWNS:
+            data[key] = self.get(key, 0)
+        return data
+
+
+CURRENT_RUN = RunState({
     "Running": False,
     "Set": "",
     "Time_Remaining_Sec": 0,
     "Soak_Remaining_Sec": 0,
     "Phase": ""
-}
\ No newline at end of file
+})
@@ -0,0 +1,93 @@
+### upcoming_runs.py
+
+# Precomputed index of upcoming scheduled runs for /status.
+# The 14-day schedule_days cycle (scheduler.get_schedule_day_index) is expanded
+# once per schedule version and calendar day into a flat list of runs covering
+# HORIZON_DAYS. next_run / upcoming_runs queries then only filter today's runs
+# against the current time and slice the rest, instead of re-walking 30 days
+# and re-parsing every start time on every request.
+
+import threading
+from datetime import datetime, timedelta
+
+from scheduler import is_watering_day, scheduled_zones
+from cycle_soak import plan_cycles, summarize_plan
+
+HORIZON_DAYS = 30  # Same look-ahead the old /status walk used
+
+
+def plan_start_time(schedule):
+    """
+    Return [(set_name, offset_minutes, span_minutes), ...] for one start time:
+    the zones main.launch_scheduled_sets queues (scheduler.scheduled_zones),
+    interleaved the way the zone sequencer will run them
+    (cycle_soak.plan_cycles), ordered by first valve opening.
+    """
+    zones = [(z["set"], z["duration_minutes"], z.get("pulse"), z.get("soak")) for z in scheduled_zones(schedule)]
+    return summarize_plan(plan_cycles(zones))
+
+
+class UpcomingRunsIndex:
+    """
+    Runs for the next HORIZON_DAYS, rebuilt only when the schedule version or the
+    date changes. The returned run dicts are shared between requests; treat them
+    as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._today_runs = []   # [(entry_start_dt, run_start_dt, run_dict)]
+        self._later_runs = []   # [run_dict] for the days after today, in order
+
+    def _rebuild(self, schedule, today):
+        plan = plan_start_time(schedule)
+        start_times = []
+        for entry in schedule.get("start_times", []):
+            if not entry.get("isEnabled", False):
+                continue
+            start_times.append(datetime.strptime(entry["time"], "%H:%M").time())
+        today_runs = []
+        later_runs = []
+        for offset in range(HORIZON_DAYS):
+            day = today + timedelta(days=offset)
+            if not is_watering_day(schedule, day):
+                continue
+            for start_time in start_times:
+                entry_start = datetime.combine(day, start_time)
+                for set_name, offset_minutes, minutes in plan:
+                    run_start = entry_start + timedelta(minutes=offset_minutes)
+                    run = {
+                        "set": set_name,
+                        "start_time": run_start.isoformat(),
+                        "duration_minutes": int(minutes) if minutes == int(minutes) else round(minutes, 1)
+                    }
+                    if offset == 0:
+                        today_runs.append((entry_start, run_start, run))
+                    else:
+                        later_runs.append(run)
+        self._today_runs = today_runs
+        self._later_runs = later_runs
+
+    def upcoming(self, schedule, n=10, now=None):
+        """Return the next `n` runs after `now` (same shape as the old /status walk)."""
+        now = now or datetime.now()
+        key = (getattr(schedule, "version", id(schedule)), now.date())
+        with self._lock:
+            if key != self._key:
+                self._rebuild(schedule, now.date())
+                self._key = key
+            today_runs = self._today_runs
+            later_runs = self._later_runs
+        # If today, skip start times already passed
+        runs = [run for entry_start, run_start, run in today_runs if entry_start >= now and run_start > now][:n]
+        if len(runs) < n:
+            runs.extend(later_runs[:n - len(runs)])
+        return runs
+
+    def next_run(self, schedule, now=None):
+        runs = self.upcoming(schedule, 1, now)
+        return runs[0] if runs else None
+
+
+upcoming_runs_index = UpcomingRunsIndex()
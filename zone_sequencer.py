@@ -0,0 +1,188 @@
+### zone_sequencer.py
+
+# Flow-aware zone sequencer.
+# Instead of opening every zone at once when a start time hits (pressure
+# collapses and the zones starve each other), runs are queued in FIFO order and
+# valves are only opened while they fit the hydraulic budget from config.py: at
+# most MAX_CONCURRENT_ZONES open at once and, if MAX_FLOW_LPM is set, the summed
+# ZONE_FLOW_LPM estimates of the open zones. Within a batch, cycle_soak.py
+# interleaves pulse/soak cycles so one zone's soak is filled by another's pulse.
+# Strict FIFO means a large zone at the head is never overtaken and starved.
+#
+# The sequencer has no threads of its own: a batch is dispatched when it is
+# submitted or when the last run of the previous batch finishes (run-engine done
+# callback), which also lets simulate.py drive it on a virtual clock.
+#
+# main.py owns the sequencer; the API process sees the queue through
+# zone_queue.json, rewritten whenever the queue changes.
+
+import json
+import os
+import threading
+from collections import deque
+
+import clock
+from config import MAX_CONCURRENT_ZONES, MAX_FLOW_LPM, RELAYS
+from cycle_soak import plan_cycles, plan_window_seconds, missing_zone_flows
+from logger import log
+
+ZONE_QUEUE_FILE = "/home/lds00/sprinkler/zone_queue.json"
+
+
+class ZoneSequencer:
+    """
+    FIFO queue of run batches. A batch is one or more zones started together
+    (a scheduled start time, a manual command, a mist trigger). Its zones are
+    interleaved by cycle_soak.plan_cycles within the hydraulic budget, so
+    batches run one at a time and the next batch starts the moment the previous
+    one finishes. start_func is called as start_func(set_name, duration_minutes,
+    source=..., cycle_plan=..., plan_start=..., **kwargs) and must return without
+    blocking, giving back a run_engine.ZoneRun or None (main.py passes a wrapper
+    around run_manager.start_run, which hands the zone to the run engine).
+    """
+
+    def __init__(self, start_func, state_file=ZONE_QUEUE_FILE):
+        self._start_func = start_func
+        self._state_file = state_file
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._active = []  # Batches currently running (more than one only after an immediate batch)
+        self._started = False
+
+    def start(self):
+        """Begin dispatching (batches submitted before this wait in the queue)."""
+        missing = missing_zone_flows(RELAYS)
+        if missing:
+            log(f"[WARN] [SEQUENCER] MAX_FLOW_LPM is {MAX_FLOW_LPM} but ZONE_FLOW_LPM has no estimate for "
+                f"{', '.join(missing)}; these zones count as the whole flow budget and only run alone")
+        self._started = True
+        self._dispatch()
+        self._write_state()
+
+    def _busy_sets(self):
+        batches = list(self._queue) + self._active
+        return {zone["set"] for batch in batches for zone in batch["zones"]}
+
+    def submit(self, zones, source="SCHEDULED", immediate=False, **kwargs):
+        """
+        Queue a batch. zones: [{"set", "duration_minutes", "pulse", "soak"}, ...].
+        Zones already queued or running are dropped. Returns False if nothing was queued.
+        An immediate batch (manual runs) jumps the queue and starts without waiting
+        for the running batch; the run engine still serialises a zone with itself.
+        """
+        with self._lock:
+            busy = set() if immediate else self._busy_sets()
+            accepted = []
+            for zone in zones:
+                if zone["set"] in busy:
+                    log(f"[SEQUENCER] {zone['set']} already queued or running; ignoring duplicate request ({source})")
+                    continue
+                accepted.append(dict(zone))
+                busy.add(zone["set"])
+            if not accepted:
+                return False
+            plan = plan_cycles([(z["set"], z["duration_minutes"], z.get("pulse"), z.get("soak")) for z in accepted])
+            for zone in accepted:
+                zone["cycle_plan"] = plan.get(zone["set"], [])
+            batch = {
+                "zones": accepted,
+                "source": source,
+                "immediate": immediate,
+                "kwargs": kwargs,
+                "window_minutes": round(plan_window_seconds(plan) / 60, 1),
+                "queued_at": clock.now().isoformat()
+            }
+            if immediate:
+                self._queue.appendleft(batch)
+            else:
+                self._queue.append(batch)
+            names = ", ".join(z["set"] for z in accepted)
+            log(f"[SEQUENCER] Queued {names} ({source}), window {batch['window_minutes']} min, {len(self._queue)} batch(es) waiting")
+        self._dispatch()
+        self._write_state()
+        return True
+
+    def clear_queue(self):
+        """Drop every batch that has not started yet."""
+        with self._lock:
+            dropped = [z["set"] for batch in self._queue for z in batch["zones"]]
+            self._queue.clear()
+        if dropped:
+            log(f"[SEQUENCER] Cleared queued runs: {', '.join(dropped)}")
+        self._write_state()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "active": [self._public(batch) for batch in self._active],
+                "queued": [self._public(batch) for batch in self._queue],
+                "max_concurrent_zones": MAX_CONCURRENT_ZONES,
+                "max_flow_lpm": MAX_FLOW_LPM,
+                "updated": clock.now().isoformat()
+            }
+
+    @staticmethod
+    def _public(batch):
+        public = {k: v for k, v in batch.items() if k not in ("kwargs", "pending")}
+        public["zones"] = [
+            {"set": z["set"], "duration_minutes": z["duration_minutes"], "cycles": [list(seg) for seg in z["cycle_plan"]]}
+            for z in batch["zones"]
+        ]
+        return public
+
+    def _dispatch(self):
+        """Start every batch that may start now (the head of the queue, if nothing is running)."""
+        while True:
+            with self._lock:
+                if not (self._started and self._queue and (not self._active or self._queue[0]["immediate"])):
+                    return
+                batch = self._queue.popleft()
+                batch["started_at"] = clock.now().isoformat()
+                batch["pending"] = len(batch["zones"])
+                self._active.append(batch)
+            self._write_state()
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        plan_start = clock.monotonic()
+        for zone in batch["zones"]:
+            run = self._start_zone(zone, batch, plan_start)
+            if run is None:
+                self._zone_done(batch)
+            else:
+                run.add_done_callback(lambda run, batch=batch: self._zone_done(batch))
+
+    def _zone_done(self, batch):
+        with self._lock:
+            batch["pending"] -= 1
+            if batch["pending"] > 0:
+                return
+            self._active.remove(batch)
+        self._write_state()
+        self._dispatch()
+
+    def _start_zone(self, zone, batch, plan_start):
+        try:
+            return self._start_func(
+                zone["set"], zone["duration_minutes"],
+                source=batch["source"],
+                pulse=zone.get("pulse"),
+                soak=zone.get("soak"),
+                cycle_plan=zone["cycle_plan"],
+                plan_start=plan_start,
+                **batch["kwargs"]
+            )
+        except Exception as e:
+            log(f"[SEQUENCER] Run of {zone['set']} failed: {e}")
+            return None
+
+    def _write_state(self):
+        if not self._state_file:
+            return
+        try:
+            tmp_path = self._state_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, self._state_file)
+        except Exception as e:
+            log(f"[WARN] Could not write {self._state_file}: {e}")